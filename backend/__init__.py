@@ -71,7 +71,11 @@ def create_app():
 
     db.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode=app.config.get("SOCKETIO_ASYNC_MODE"),
+    )
 
     @app.route("/health")
     def health_check():
@@ -0,0 +1,139 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import MetaTrader5 as mt5
+from sqlalchemy import text
+from tqdm import tqdm
+import logging
+
+from backend.bulk_mt5_scraper import connect_mt5, copy_frame, get_all_tickers_from_db, get_db_engine
+
+# Índices e outros símbolos sem linha em 'tickers' que também precisam de histórico
+EXTRA_SYMBOLS = [s for s in os.getenv("DAILY_HISTORY_EXTRA_SYMBOLS", "IBOV").split(",") if s]
+
+DAILY_COLUMNS = ["symbol", "date", "open", "high", "low", "close", "volume"]
+
+UPSERT_DAILY_QUOTES_SQL = """
+    INSERT INTO daily_quotes (symbol, date, open, high, low, close, volume)
+    SELECT symbol, date, open, high, low, close, volume
+    FROM daily_quotes_staging
+    ON CONFLICT (symbol, date) DO UPDATE
+    SET
+        open = EXCLUDED.open,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        close = EXCLUDED.close,
+        volume = EXCLUDED.volume;
+"""
+
+
+def get_last_dates(engine):
+    """Retorna a última data já gravada por símbolo em 'daily_quotes'."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT symbol, MAX(date) FROM daily_quotes GROUP BY symbol"))
+        return {symbol: last_date for symbol, last_date in rows}
+
+
+def fetch_daily_rates(symbol, last_date, full_bars):
+    """
+    Busca as barras D1 do símbolo: backfill completo (últimas ``full_bars``
+    barras) quando não há histórico, ou a partir da última data gravada,
+    inclusive, para regravar o pregão que ainda estava aberto.
+    """
+    if not mt5.symbol_select(symbol, True):
+        return None
+    if last_date is None:
+        return mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_D1, 0, full_bars)
+    start = datetime.combine(last_date, datetime.min.time())
+    return mt5.copy_rates_range(symbol, mt5.TIMEFRAME_D1, start, datetime.now() + timedelta(days=1))
+
+
+def build_daily_frame(symbol_rates):
+    """Monta o DataFrame de 'daily_quotes' coluna a coluna a partir dos arrays do MT5."""
+    symbol_rates = [(s, r) for s, r in symbol_rates if r is not None and len(r)]
+    if not symbol_rates:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+
+    rates = np.concatenate([r for _, r in symbol_rates])
+    symbols = np.repeat(
+        np.array([s for s, _ in symbol_rates], dtype=object),
+        [len(r) for _, r in symbol_rates],
+    )
+    return pd.DataFrame({
+        "symbol": symbols,
+        "date": pd.to_datetime(rates['time'], unit='s').date,
+        "open": rates['open'],
+        "high": rates['high'],
+        "low": rates['low'],
+        "close": rates['close'],
+        "volume": rates['real_volume'],
+    }, columns=DAILY_COLUMNS)
+
+
+def write_daily_frame(engine, frame):
+    """Grava o lote via COPY numa tabela temporária da transação e upsert por (symbol, date)."""
+    if frame.empty:
+        return 0
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            # Staging privado da sessão: execuções simultâneas não compartilham nem truncam linhas
+            cur.execute(
+                "CREATE TEMP TABLE daily_quotes_staging (LIKE daily_quotes INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            copy_frame(cur, "daily_quotes_staging", frame)
+            cur.execute(UPSERT_DAILY_QUOTES_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(frame)
+
+
+def run_history_load(engine, symbols, full_bars=5000, batch_symbols=200):
+    """Executa o backfill/complemento incremental em lotes de símbolos."""
+    last_dates = get_last_dates(engine)
+    backfill = sum(1 for s in symbols if s not in last_dates)
+    logging.info(f"{len(symbols)} símbolos: {backfill} em backfill completo, {len(symbols) - backfill} incrementais.")
+
+    total_rows = 0
+    for i in tqdm(range(0, len(symbols), batch_symbols), desc="Carregando Histórico"):
+        batch = symbols[i:i + batch_symbols]
+        symbol_rates = [(s, fetch_daily_rates(s, last_dates.get(s), full_bars)) for s in batch]
+        total_rows += write_daily_frame(engine, build_daily_frame(symbol_rates))
+    return total_rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill e atualização incremental de 'daily_quotes' via MT5.")
+    parser.add_argument("--symbols", nargs="*", help="Restringe a carga a estes símbolos.")
+    parser.add_argument("--full-bars", type=int, default=5000,
+                        help="Quantidade de barras D1 no backfill de símbolos sem histórico.")
+    parser.add_argument("--batch-symbols", type=int, default=200,
+                        help="Símbolos por lote de gravação.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.info("🚀 Iniciando carga do histórico diário (daily_quotes) via MT5...")
+    started = time.perf_counter()
+    try:
+        engine = get_db_engine()
+        connect_mt5()
+
+        symbols = args.symbols or get_all_tickers_from_db(engine) + EXTRA_SYMBOLS
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        rows = run_history_load(engine, symbols, args.full_bars, args.batch_symbols)
+        logging.info(f"✅ {rows} barras diárias gravadas em {time.perf_counter() - started:.2f}s.")
+    except Exception as e:
+        logging.critical(f"Um erro fatal ocorreu: {e}")
+    finally:
+        mt5.shutdown()
+        logging.info("Conexão com o MetaTrader 5 encerrada.")
+
+
+if __name__ == "__main__":
+    main()
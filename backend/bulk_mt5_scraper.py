@@ -1,6 +1,10 @@
+import argparse
+import io
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import MetaTrader5 as mt5
 from sqlalchemy import create_engine, text
@@ -64,10 +68,247 @@ def get_all_tickers_from_db(engine):
         logging.error(f"❌ Não foi possível buscar tickers do banco: {e}")
         return []
 
-def main():
+
+UPSERT_ASSET_METRICS_SQL = """
+    INSERT INTO asset_metrics (symbol, description, sector, industry, last_price, previous_close, price_change, price_change_percent, volume, open_price, high_price, low_price, updated_at)
+    SELECT symbol, description, sector, industry, last_price, previous_close, price_change, price_change_percent, volume, open_price, high_price, low_price, updated_at
+    FROM {source}
+    ON CONFLICT (symbol) DO UPDATE
+    SET 
+        description = EXCLUDED.description,
+        sector = EXCLUDED.sector,
+        industry = EXCLUDED.industry,
+        last_price = EXCLUDED.last_price,
+        previous_close = EXCLUDED.previous_close,
+        price_change = EXCLUDED.price_change,
+        price_change_percent = EXCLUDED.price_change_percent,
+        volume = EXCLUDED.volume,
+        open_price = EXCLUDED.open_price,
+        high_price = EXCLUDED.high_price,
+        low_price = EXCLUDED.low_price,
+        updated_at = EXCLUDED.updated_at;
+"""
+
+METRIC_COLUMNS = [
+    "symbol", "description", "sector", "industry", "last_price", "previous_close",
+    "price_change", "price_change_percent", "volume", "open_price", "high_price",
+    "low_price", "updated_at",
+]
+
+
+def run_serial_snapshot(engine, all_symbols):
+    """Modo original: um símbolo por vez, lista de dicts e to_sql em tabela temporária."""
+    all_metrics = []
+    for symbol in tqdm(all_symbols, desc="Processando Ativos"):
+        if not mt5.symbol_select(symbol, True):
+            continue
+        
+        info = mt5.symbol_info(symbol)
+        rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_D1, 0, 2)
+
+        if not info or rates is None or len(rates) < 2:
+            continue
+
+        today = rates[1]
+        yesterday = rates[0]
+        
+        change = today['close'] - yesterday['close']
+        change_percent = (change / yesterday['close']) * 100 if yesterday['close'] > 0 else 0
+
+        all_metrics.append({
+            "symbol": symbol,
+            "description": info.description,
+            "sector": getattr(info, 'sector', 'N/A'),
+            "industry": getattr(info, 'industry', 'N/A'),
+            "last_price": today['close'],
+            "previous_close": yesterday['close'],
+            "price_change": change,
+            "price_change_percent": change_percent,
+            "volume": today['real_volume'],
+            "open_price": today['open'],
+            "high_price": today['high'],
+            "low_price": today['low'],
+            "updated_at": pd.to_datetime(today['time'], unit='s')
+        })
+
+    if not all_metrics:
+        logging.info("Nenhuma métrica coletada.")
+        return
+
+    logging.info(f"Coletadas métricas para {len(all_metrics)} ativos. Atualizando banco de dados...")
+    df_metrics = pd.DataFrame(all_metrics)
+
+    # --- CORREÇÃO FINAL AQUI ---
+    # Convertemos a coluna 'volume' para um tipo compatível com o PostgreSQL.
+    df_metrics['volume'] = df_metrics['volume'].astype('int64')
+
+    # Usando o padrão de UPSERT via tabela temporária para máxima eficiência
+    with engine.connect() as conn:
+        df_metrics.to_sql('temp_asset_metrics', conn, if_exists='replace', index=False)
+        upsert_sql = text(UPSERT_ASSET_METRICS_SQL.format(source="temp_asset_metrics"))
+        conn.execute(upsert_sql)
+        conn.commit()
+    logging.info("✅ Banco de dados atualizado com sucesso!")
+
+
+def _init_pool_worker():
+    """Inicializador de cada processo do pool: cada shard abre sua própria conexão MT5."""
+    connect_mt5()
+
+
+def fetch_chunk(symbols):
+    """
+    Lê symbol_info e as duas últimas barras D1 de um bloco de símbolos e
+    devolve as métricas já em colunas NumPy (apenas símbolos válidos).
+    """
+    n = len(symbols)
+    valid = np.zeros(n, dtype=bool)
+    ohlc = {
+        name: np.zeros(n, dtype=np.float64)
+        for name in ("last_price", "previous_close", "open_price", "high_price", "low_price", "volume")
+    }
+    bar_time = np.zeros(n, dtype=np.int64)
+    description = np.empty(n, dtype=object)
+    sector = np.empty(n, dtype=object)
+    industry = np.empty(n, dtype=object)
+
+    for i, symbol in enumerate(symbols):
+        if not mt5.symbol_select(symbol, True):
+            continue
+        info = mt5.symbol_info(symbol)
+        rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_D1, 0, 2)
+        if not info or rates is None or len(rates) < 2:
+            continue
+
+        today, yesterday = rates[1], rates[0]
+        valid[i] = True
+        ohlc["last_price"][i] = today['close']
+        ohlc["previous_close"][i] = yesterday['close']
+        ohlc["open_price"][i] = today['open']
+        ohlc["high_price"][i] = today['high']
+        ohlc["low_price"][i] = today['low']
+        ohlc["volume"][i] = today['real_volume']
+        bar_time[i] = today['time']
+        description[i] = info.description
+        sector[i] = getattr(info, 'sector', 'N/A')
+        industry[i] = getattr(info, 'industry', 'N/A')
+
+    columns = {name: values[valid] for name, values in ohlc.items()}
+    columns["symbol"] = np.asarray(symbols, dtype=object)[valid]
+    columns["time"] = bar_time[valid]
+    columns["description"] = description[valid]
+    columns["sector"] = sector[valid]
+    columns["industry"] = industry[valid]
+    return columns
+
+
+def build_metrics_frame(chunks):
+    """Concatena as colunas dos blocos e calcula as variações de forma vetorizada."""
+    chunks = [c for c in chunks if len(c["symbol"])]
+    if not chunks:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+
+    cols = {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+    last_price = cols["last_price"]
+    previous_close = cols["previous_close"]
+    change = last_price - previous_close
+    change_percent = np.divide(
+        change * 100, previous_close,
+        out=np.zeros_like(change), where=previous_close > 0,
+    )
+
+    return pd.DataFrame({
+        "symbol": cols["symbol"],
+        "description": cols["description"],
+        "sector": cols["sector"],
+        "industry": cols["industry"],
+        "last_price": last_price,
+        "previous_close": previous_close,
+        "price_change": change,
+        "price_change_percent": change_percent,
+        "volume": cols["volume"].astype('int64'),
+        "open_price": cols["open_price"],
+        "high_price": cols["high_price"],
+        "low_price": cols["low_price"],
+        "updated_at": pd.to_datetime(cols["time"], unit='s'),
+    }, columns=METRIC_COLUMNS)
+
+
+def copy_frame(cursor, table, frame):
+    """Envia um DataFrame para a tabela via COPY FROM STDIN (CSV)."""
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def run_batched_snapshot(engine, all_symbols, workers=4, chunk_size=200):
+    """
+    Modo em lotes: divide os símbolos em blocos processados por um pool de
+    processos (um shard MT5 por processo), monta as métricas em colunas e faz
+    o upsert via COPY numa tabela temporária da transação. Registra o tempo de cada fase.
+    """
+    timings = {}
+    chunks = [all_symbols[i:i + chunk_size] for i in range(0, len(all_symbols), chunk_size)]
+
+    started = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker) as pool:
+            results = list(tqdm(pool.map(fetch_chunk, chunks), total=len(chunks), desc="Processando Blocos"))
+    else:
+        results = [fetch_chunk(chunk) for chunk in tqdm(chunks, desc="Processando Blocos")]
+    timings["fetch"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    df_metrics = build_metrics_frame(results)
+    timings["build"] = time.perf_counter() - started
+
+    if df_metrics.empty:
+        logging.info("Nenhuma métrica coletada.")
+        return timings
+
+    logging.info(f"Coletadas métricas para {len(df_metrics)} ativos. Atualizando banco de dados...")
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            # Staging privado da sessão: execuções simultâneas não compartilham nem truncam linhas
+            cur.execute(
+                "CREATE TEMP TABLE asset_metrics_staging (LIKE asset_metrics INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            copy_frame(cur, "asset_metrics_staging", df_metrics)
+            timings["copy"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            cur.execute(UPSERT_ASSET_METRICS_SQL.format(source="asset_metrics_staging"))
+            timings["upsert"] = time.perf_counter() - started
+        conn.commit()
+    finally:
+        conn.close()
+
+    logging.info("✅ Banco de dados atualizado com sucesso!")
+    return timings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot das métricas de todos os ativos via MT5.")
+    parser.add_argument("--mode", choices=["batched", "serial"], default="batched",
+                        help="batched: blocos em pool de processos + COPY; serial: loop original.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MT5_SCRAPER_WORKERS", 4)),
+                        help="Número de processos (shards MT5) no modo batched.")
+    parser.add_argument("--chunk-size", type=int, default=200,
+                        help="Símbolos por bloco no modo batched.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Função principal que orquestra o processo de scraping."""
+    args = parse_args(argv)
     logging.info("🚀 Iniciando o Scraper Universal de Dados do MT5...")
     engine = None
+    total_started = time.perf_counter()
     
     try:
         engine = get_db_engine()
@@ -78,75 +319,15 @@ def main():
             logging.warning("Nenhum ticker encontrado. Encerrando.")
             return
 
-        all_metrics = []
-        for symbol in tqdm(all_symbols, desc="Processando Ativos"):
-            if not mt5.symbol_select(symbol, True):
-                continue
-            
-            info = mt5.symbol_info(symbol)
-            rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_D1, 0, 2)
-
-            if not info or rates is None or len(rates) < 2:
-                continue
-
-            today = rates[1]
-            yesterday = rates[0]
-            
-            change = today['close'] - yesterday['close']
-            change_percent = (change / yesterday['close']) * 100 if yesterday['close'] > 0 else 0
-
-            all_metrics.append({
-                "symbol": symbol,
-                "description": info.description,
-                "sector": getattr(info, 'sector', 'N/A'),
-                "industry": getattr(info, 'industry', 'N/A'),
-                "last_price": today['close'],
-                "previous_close": yesterday['close'],
-                "price_change": change,
-                "price_change_percent": change_percent,
-                "volume": today['real_volume'],
-                "open_price": today['open'],
-                "high_price": today['high'],
-                "low_price": today['low'],
-                "updated_at": pd.to_datetime(today['time'], unit='s')
-            })
-
-        if not all_metrics:
-            logging.info("Nenhuma métrica coletada.")
-            return
-
-        logging.info(f"Coletadas métricas para {len(all_metrics)} ativos. Atualizando banco de dados...")
-        df_metrics = pd.DataFrame(all_metrics)
-
-        # --- CORREÇÃO FINAL AQUI ---
-        # Convertemos a coluna 'volume' para um tipo compatível com o PostgreSQL.
-        df_metrics['volume'] = df_metrics['volume'].astype('int64')
-
-        # Usando o padrão de UPSERT via tabela temporária para máxima eficiência
-        with engine.connect() as conn:
-            df_metrics.to_sql('temp_asset_metrics', conn, if_exists='replace', index=False)
-            upsert_sql = text("""
-                INSERT INTO asset_metrics (symbol, description, sector, industry, last_price, previous_close, price_change, price_change_percent, volume, open_price, high_price, low_price, updated_at)
-                SELECT symbol, description, sector, industry, last_price, previous_close, price_change, price_change_percent, volume, open_price, high_price, low_price, updated_at
-                FROM temp_asset_metrics
-                ON CONFLICT (symbol) DO UPDATE
-                SET 
-                    description = EXCLUDED.description,
-                    sector = EXCLUDED.sector,
-                    industry = EXCLUDED.industry,
-                    last_price = EXCLUDED.last_price,
-                    previous_close = EXCLUDED.previous_close,
-                    price_change = EXCLUDED.price_change,
-                    price_change_percent = EXCLUDED.price_change_percent,
-                    volume = EXCLUDED.volume,
-                    open_price = EXCLUDED.open_price,
-                    high_price = EXCLUDED.high_price,
-                    low_price = EXCLUDED.low_price,
-                    updated_at = EXCLUDED.updated_at;
-            """)
-            conn.execute(upsert_sql)
-            conn.commit()
-        logging.info("✅ Banco de dados atualizado com sucesso!")
+        if args.mode == "serial":
+            run_serial_snapshot(engine, all_symbols)
+        else:
+            timings = run_batched_snapshot(engine, all_symbols, args.workers, args.chunk_size)
+            timings["total"] = time.perf_counter() - total_started
+            logging.info(
+                "⏱️ Tempos por fase: "
+                + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items())
+            )
 
     except Exception as e:
         logging.critical(f"Um erro fatal ocorreu: {e}")
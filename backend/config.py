@@ -36,6 +36,10 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Modo do servidor Socket.IO: threading (padrão), eventlet ou gevent.
+    # Nos modos assíncronos o processo deve ser iniciado com monkey patching (ver run.py).
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or None
+
 def get_db_engine():
     """
     Cria e retorna uma engine do SQLAlchemy baseada na URI de configuração.
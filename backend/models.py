@@ -1,6 +1,6 @@
 # backend/models.py
 from . import db
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 from sqlalchemy import (
     String, Integer, DateTime, Numeric, Text, Boolean, ForeignKey, Date
 )
@@ -74,6 +74,14 @@ class CvmFinancialData(db.Model):
     
     company = relationship("Company", back_populates="financial_data")
 
+    __table_args__ = (
+        db.Index(
+            'uix_cvm_financial_data_natural_key',
+            'company_id', 'reference_date', 'report_type', 'report_version', 'account_code',
+            unique=True,
+        ),
+    )
+
 # --- Modelo definitivo para a tabela 'cvm_documents' ---
 # Baseado na imagem image_d39e84.png
 class CvmDocument(db.Model):
@@ -145,6 +153,36 @@ class AssetMetrics(db.Model):
     ticker_info = relationship("Ticker", back_populates="metrics")
 
 
+class DailyQuote(db.Model):
+    __tablename__ = 'daily_quotes'
+
+    # Histórico diário OHLCV carregado do MT5 (backfill + complementos incrementais)
+    symbol = db.Column(String(20), primary_key=True)
+    date = db.Column(Date, primary_key=True)
+    open = db.Column(Numeric(12, 4))
+    high = db.Column(Numeric(12, 4))
+    low = db.Column(Numeric(12, 4))
+    close = db.Column(Numeric(12, 4), nullable=False)
+    volume = db.Column(Numeric(20, 2))
+
+
+class IntradayBar(db.Model):
+    __tablename__ = 'intraday_bars'
+
+    # Tabela particionada por mês em bar_time; gravada em lote pelo RTD Worker
+    symbol = db.Column(String(20), primary_key=True)
+    timeframe = db.Column(String(5), primary_key=True)
+    bar_time = db.Column(DateTime, primary_key=True)
+    open = db.Column(Numeric(12, 4), nullable=False)
+    high = db.Column(Numeric(12, 4), nullable=False)
+    low = db.Column(Numeric(12, 4), nullable=False)
+    close = db.Column(Numeric(12, 4), nullable=False)
+    volume = db.Column(Numeric(20, 2))
+    ticks = db.Column(Integer)
+
+    __table_args__ = {'postgresql_partition_by': 'RANGE (bar_time)'}
+
+
 class MacroIndicator(db.Model):
     __tablename__ = 'macro_indicators'
 
@@ -233,6 +271,10 @@ class PortfolioPosition(db.Model):
     symbol = db.Column(String(20), ForeignKey('tickers.symbol'), nullable=False)
     quantity = db.Column(Numeric(20, 4), nullable=False)
     avg_price = db.Column(Numeric(10, 2), nullable=False)
+    # Alvos de rebalanceamento: peso-alvo (%), preço-alvo e lote de negociação
+    target_pct = db.Column(Numeric(10, 4), nullable=False, default=0, server_default='0')
+    target_price = db.Column(Numeric(10, 2))
+    lot_size = db.Column(Integer, nullable=False, default=100, server_default='100')
 
     portfolio = relationship("Portfolio", back_populates="positions")
     ticker = relationship("Ticker", foreign_keys=[symbol], primaryjoin="PortfolioPosition.symbol == Ticker.symbol")
@@ -245,6 +287,10 @@ class PortfolioPosition(db.Model):
         uselist=False,
     )
 
+    __table_args__ = (
+        db.Index('uix_portfolio_position_symbol', 'portfolio_id', 'symbol', unique=True),
+    )
+
 
 class PortfolioDailyValue(db.Model):
     __tablename__ = 'portfolio_daily_values'
@@ -256,6 +302,8 @@ class PortfolioDailyValue(db.Model):
     total_cost = db.Column(Numeric(20, 2), nullable=False)
     total_gain = db.Column(Numeric(20, 2), nullable=False)
     total_gain_percent = db.Column(Numeric(10, 4), nullable=False)
+    # Dia recalculado pelo rebuild-nav (posições atuais sobre fechamentos), não um snapshot real
+    is_reconstructed = db.Column(Boolean, nullable=False, default=False, server_default=false())
     created_at = db.Column(DateTime(timezone=True), server_default=func.now())
 
     portfolio = relationship("Portfolio", back_populates="daily_values")
@@ -1,41 +1,60 @@
 from flask import Blueprint, jsonify, request
-from backend.models import AssetMetrics
+from backend.models import DailyQuote
 from backend import db
 from datetime import datetime, timedelta
 
 historical_bp = Blueprint('historical_bp', __name__)
 
+
+def load_daily_history(symbol, start=None, end=None):
+    """Lê a série diária de 'daily_quotes' para o símbolo, em ordem cronológica."""
+    query = db.session.query(
+        DailyQuote.date, DailyQuote.open, DailyQuote.high,
+        DailyQuote.low, DailyQuote.close, DailyQuote.volume,
+    ).filter(DailyQuote.symbol == symbol.upper())
+    if start:
+        query = query.filter(DailyQuote.date >= start)
+    if end:
+        query = query.filter(DailyQuote.date <= end)
+    return query.order_by(DailyQuote.date).all()
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
 @historical_bp.route('/<string:ticker>', methods=['GET'])
 def get_historical_data(ticker):
     """
-    Fornece dados históricos para um ticker.
-    NOTA: Atualmente, esta rota retorna dados limitados da tabela de métricas.
-    Para um histórico completo, um ETL para popular uma tabela de 'quotes' diários é necessário.
+    Fornece o histórico diário OHLCV de um ticker a partir da tabela 'daily_quotes'.
+    Parâmetros opcionais: start e end (YYYY-MM-DD). Por padrão, os últimos 365 dias.
     """
     try:
-        # Por enquanto, vamos retornar os dados mais recentes que temos na tabela de métricas.
-        # Esta é uma simplificação. O ideal é ter uma tabela de histórico de preços.
-        metric = db.session.query(AssetMetrics).filter(AssetMetrics.ticker.ilike(ticker)).first()
+        try:
+            end = datetime.strptime(request.args['end'], "%Y-%m-%d").date() if 'end' in request.args else None
+            start = (
+                datetime.strptime(request.args['start'], "%Y-%m-%d").date()
+                if 'start' in request.args
+                else (end or datetime.today().date()) - timedelta(days=365)
+            )
+        except ValueError:
+            return jsonify({"success": False, "error": "Datas devem estar no formato YYYY-MM-DD."}), 400
 
-        if not metric:
+        rows = load_daily_history(ticker, start, end)
+        if not rows:
             return jsonify({"success": False, "error": "Dados históricos não encontrados para o ticker."}), 404
 
-        # Simula uma pequena série histórica para o gráfico com os dados que temos
-        historical_data = [{
-            "date": (metric.updated_at - timedelta(days=1)).strftime("%Y-%m-%d"),
-            "open": metric.previous_close,
-            "high": metric.previous_close,
-            "low": metric.previous_close,
-            "close": metric.previous_close,
-            "volume": metric.volume * 0.8 if metric.volume else 0 # Simulação
-        }, {
-            "date": metric.updated_at.strftime("%Y-%m-%d"),
-            "open": metric.open,
-            "high": metric.high,
-            "low": metric.low,
-            "close": metric.last_price,
-            "volume": metric.volume
-        }]
+        historical_data = [
+            {
+                "date": row.date.strftime("%Y-%m-%d"),
+                "open": _to_float(row.open),
+                "high": _to_float(row.high),
+                "low": _to_float(row.low),
+                "close": _to_float(row.close),
+                "volume": _to_float(row.volume),
+            }
+            for row in rows
+        ]
 
         return jsonify({
             "success": True,
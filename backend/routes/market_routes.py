@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify
 from backend.services.metatrader5_rtd_worker import get_rtd_worker
+from backend.services.quote_cache import quote_cache
 from backend.models import AssetMetrics
+from backend.routes.historical_routes import load_daily_history
 from backend import db
 import logging
 from datetime import datetime, timedelta
@@ -9,6 +11,8 @@ import yfinance as yf
 logger = logging.getLogger(__name__)
 market_bp = Blueprint('market_bp', __name__)
 
+IBOV_SYMBOL = "IBOV"
+
 
 @market_bp.route('/overview', methods=['GET'])
 def get_market_overview():
@@ -62,7 +66,12 @@ def get_quote(ticker):
         return jsonify({"error": "Serviço de cotações (MT5) não disponível."}), 503
 
     ticker_upper = ticker.upper()
-    quote = rtd_worker.get_mt5_quote(ticker_upper)
+    quote = quote_cache.get(ticker_upper)
+    if quote is None:
+        quote = rtd_worker.get_mt5_quote(ticker_upper)
+        if quote:
+            quote_cache.put(ticker_upper, quote)
+            rtd_worker.watch_symbols([ticker_upper])
 
     if quote:
         return jsonify({"success": True, "ticker": ticker_upper, "quote": quote})
@@ -72,10 +81,22 @@ def get_quote(ticker):
 
 @market_bp.route('/ibov-history', methods=['GET'])
 def get_ibov_history():
-    """Retorna a série histórica do Ibovespa."""
+    """
+    Retorna a série histórica do Ibovespa dos últimos 365 dias a partir de
+    'daily_quotes'; usa o yfinance apenas se o histórico ainda não foi carregado.
+    """
     try:
         end = datetime.today().date()
         start = end - timedelta(days=365)
+
+        rows = load_daily_history(IBOV_SYMBOL, start, end)
+        if rows:
+            history = [
+                {"date": row.date.strftime('%Y-%m-%d'), "close": float(row.close)}
+                for row in rows
+            ]
+            return jsonify({"success": True, "history": history})
+
         data = yf.download('^BVSP', start=start, end=end, progress=False)[['Adj Close']]
         history = [
             {"date": idx.strftime('%Y-%m-%d'), "close": float(row['Adj Close'])}
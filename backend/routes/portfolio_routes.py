@@ -1,151 +1,51 @@
 import logging
-from datetime import date
+import math
+from datetime import date, timedelta
 from flask import Blueprint, jsonify, request
-from sqlalchemy.sql import func
+from sqlalchemy import and_
 
 from backend.models import (
     db,
     Portfolio,
     PortfolioPosition,
-    AssetMetrics,
     PortfolioDailyValue,
     PortfolioDailyMetric,
     Ticker,
-    Company,
 )
+from backend.services.portfolio_valuation import (
+    DEFAULT_LOT_SIZE,
+    aggregate_exposure,
+    get_portfolio_valuation,
+    get_portfolio_valuations,
+)
+from backend.services.portfolio_cache import portfolio_summary_cache
+from backend.services.db_upsert import chunked, insert_on_conflict
+from backend.services.eod_snapshot import snapshot_portfolios
+from backend.services.portfolio_risk import get_portfolio_risk
+from backend.services.rebalancer import clear_rebalance_cache, get_rebalance
+from backend.services.portfolio_stream import load_live_portfolio
+from backend.services.metatrader5_rtd_worker import get_rtd_worker
 
 logger = logging.getLogger(__name__)
 portfolio_bp = Blueprint("portfolio_bp", __name__)
 
 
-def calculate_portfolio_summary(portfolio_id: int):
-    """Calcula o resumo e holdings do portfólio."""
-    portfolio = Portfolio.query.get(portfolio_id)
-    if not portfolio:
-        return None
-
-    positions = (
-        PortfolioPosition.query.filter_by(portfolio_id=portfolio_id)
-        .join(
-            AssetMetrics,
-            PortfolioPosition.symbol == AssetMetrics.symbol,
-            isouter=True,
-        )
-        .all()
-    )
-
-    holdings = []
-    total_value = 0.0
-    total_cost = 0.0
-    total_long = 0.0
-    total_short = 0.0
-    for pos in positions:
-        last_price = (
-            float(pos.metrics.last_price)
-            if pos.metrics and pos.metrics.last_price is not None
-            else 0.0
-        )
-        daily_change_pct = (
-            float(pos.metrics.price_change_percent)
-            if pos.metrics and pos.metrics.price_change_percent is not None
-            else 0.0
-        )
-        quantity = float(pos.quantity)
-        avg_price = float(pos.avg_price)
-        position_value = quantity * last_price
-        cost = quantity * avg_price
-        gain = position_value - cost
-        gain_percent = (gain / cost * 100) if cost else 0.0
-
-        holdings.append(
-            {
-                "symbol": pos.symbol,
-                "quantity": quantity,
-                "avg_price": avg_price,
-                "last_price": last_price,
-                "daily_change_pct": daily_change_pct,
-                "position_value": position_value,
-                "value": position_value,
-                "cost": cost,
-                "gain": gain,
-                "gain_percent": gain_percent,
-                "contribution": 0.0,
-                "position_pct": 0.0,
-                "target_pct": 0.0,
-                "difference": 0.0,
-                "adjustment_qty": 0.0,
-            }
-        )
+def _invalidate_portfolio(portfolio_id: int):
+    """
+    Descarta o resumo e o plano de rebalanceamento memoizados e recarrega o
+    estado do P&L ao vivo, se acompanhado.
+    """
+    portfolio_summary_cache.invalidate(portfolio_id)
+    clear_rebalance_cache(portfolio_id)
+    worker = get_rtd_worker()
+    if worker:
+        worker.refresh_portfolio(portfolio_id, load_live_portfolio)
 
-        total_value += position_value
-        total_cost += cost
-        if position_value >= 0:
-            total_long += position_value
-        else:
-            total_short += position_value
-
-    # Calcula campos dependentes do valor total
-    for h in holdings:
-        position_pct = (h["position_value"] / total_value * 100) if total_value else 0.0
-        h["position_pct"] = position_pct
-        target_pct = h.get("target_pct", 0.0)
-        h["difference"] = target_pct - position_pct
-        h["contribution"] = (h["daily_change_pct"] * position_pct) / 100
-        h["adjustment_qty"] = (
-            (h["difference"] / 100) * total_value / h["last_price"]
-            if h["last_price"]
-            else 0.0
-        )
 
-    total_gain = total_value - total_cost
-    total_gain_percent = (total_gain / total_cost * 100) if total_cost else 0.0
-
-    today = date.today()
-    metrics = {
-        m.metric_id: float(m.value) if m.value is not None else 0.0
-        for m in PortfolioDailyMetric.query.filter_by(
-            portfolio_id=portfolio_id, date=today
-        )
-    }
-    qtd_cotas = metrics.get("qtdCotas", 0.0)
-    cota_d1 = metrics.get("cotaD1")
-
-    patrimonio_liquido = total_value
-    valor_cota = patrimonio_liquido / qtd_cotas if qtd_cotas else 0.0
-    variacao_cota_pct = (
-        ((valor_cota / cota_d1) - 1) * 100 if cota_d1 else 0.0
-    )
-
-    posicao_comprada_pct = (
-        (total_long / patrimonio_liquido * 100) if patrimonio_liquido else 0.0
-    )
-    posicao_vendida_pct = (
-        (abs(total_short) / patrimonio_liquido * 100) if patrimonio_liquido else 0.0
-    )
-    net_long_pct = posicao_comprada_pct - posicao_vendida_pct
-    exposicao_total_pct = (
-        ((total_long + abs(total_short)) / patrimonio_liquido * 100)
-        if patrimonio_liquido
-        else 0.0
-    )
-
-    summary = {
-        "id": portfolio.id,
-        "name": portfolio.name,
-        "total_value": total_value,
-        "total_cost": total_cost,
-        "total_gain": total_gain,
-        "total_gain_percent": total_gain_percent,
-        "holdings": holdings,
-        "patrimonio_liquido": patrimonio_liquido,
-        "valor_cota": valor_cota,
-        "variacao_cota_pct": variacao_cota_pct,
-        "posicao_comprada_pct": posicao_comprada_pct,
-        "posicao_vendida_pct": posicao_vendida_pct,
-        "net_long_pct": net_long_pct,
-        "exposicao_total_pct": exposicao_total_pct,
-    }
-    return summary
+def calculate_portfolio_summary(portfolio_id: int):
+    """Resumo e holdings do portfólio, memoizados por versão das posições e preços."""
+    valuation = get_portfolio_valuation(portfolio_id)
+    return valuation[1] if valuation else None
 
 
 @portfolio_bp.route("/<int:portfolio_id>/summary", methods=["GET"])
@@ -168,60 +68,141 @@ def get_portfolio_summary(portfolio_id: int):
         )
 
 
+@portfolio_bp.route("/summary", methods=["GET"])
+def get_portfolios_summary():
+    """
+    Resumo de vários portfólios e exposição consolidada por símbolo e setor.
+    ``ids`` aceita lista separada por vírgula (ou parâmetro repetido); sem
+    ``ids``, considera todos os portfólios.
+    """
+    try:
+        raw_ids = [part for value in request.args.getlist("ids") for part in value.split(",")]
+        try:
+            portfolio_ids = [int(part) for part in raw_ids if part.strip()]
+        except ValueError:
+            return jsonify({"success": False, "error": "ids deve ser uma lista de inteiros"}), 400
+        if not portfolio_ids:
+            portfolio_ids = [pid for (pid,) in db.session.query(Portfolio.id).order_by(Portfolio.id)]
+        portfolio_ids = list(dict.fromkeys(portfolio_ids))
+
+        valuations = get_portfolio_valuations(portfolio_ids)
+        found = [pid for pid in portfolio_ids if pid in valuations]
+        return jsonify(
+            {
+                "success": True,
+                "portfolios": [valuations[pid][1] for pid in found],
+                "missing": [pid for pid in portfolio_ids if pid not in valuations],
+                "rollup": aggregate_exposure([valuations[pid][0] for pid in found]),
+            }
+        )
+    except Exception as e:
+        logger.error(f"Erro em get_portfolios_summary: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro interno ao consolidar portfólios"}),
+            500,
+        )
+
+
 @portfolio_bp.route("/<int:portfolio_id>/positions", methods=["POST"])
 def upsert_positions(portfolio_id: int):
-    """Insere ou atualiza posições de um portfólio."""
+    """
+    Insere ou atualiza posições de um portfólio em lote: os símbolos são
+    resolvidos numa única consulta e as posições gravadas com
+    INSERT ... ON CONFLICT (portfolio_id, symbol) DO UPDATE.
+    Retorna a contagem de linhas inseridas, atualizadas e ignoradas.
+    """
     data = request.get_json(silent=True) or []
     if not isinstance(data, list):
         return jsonify({"success": False, "error": "Formato inválido"}), 400
 
+    # Uma linha por símbolo; em duplicatas prevalece a última ocorrência
+    items = {}
+    skipped = 0
+    for item in data:
+        symbol = item.get("symbol") if isinstance(item, dict) else None
+        if not symbol:
+            skipped += 1
+            continue
+        items[symbol] = item
+    duplicates = len(data) - skipped - len(items)
+
     try:
-        # Garante que todos os tickers existam ou cria novos
-        for item in data:
-            symbol = item.get("symbol")
-            if not symbol:
+        # Tickers existentes e posições atuais do portfólio numa única consulta
+        known = dict(
+            db.session.query(Ticker.symbol, PortfolioPosition.id)
+            .outerjoin(
+                PortfolioPosition,
+                and_(
+                    PortfolioPosition.symbol == Ticker.symbol,
+                    PortfolioPosition.portfolio_id == portfolio_id,
+                ),
+            )
+            .filter(Ticker.symbol.in_(list(items)))
+            .all()
+        )
+
+        new_tickers = []
+        for symbol, item in items.items():
+            if symbol in known:
                 continue
-            ticker = Ticker.query.filter_by(symbol=symbol).first()
-            if not ticker:
-                ticker_type = item.get("type")
-                if not ticker_type:
-                    return (
-                        jsonify({"success": False, "error": "Tipo do ticker não fornecido"}),
-                        400,
-                    )
-                ticker = Ticker(symbol=symbol, type=ticker_type, company_id=None)
-                db.session.add(ticker)
+            ticker_type = item.get("type")
+            if not ticker_type:
+                return (
+                    jsonify({"success": False, "error": "Tipo do ticker não fornecido"}),
+                    400,
+                )
+            new_tickers.append({"symbol": symbol, "type": ticker_type, "company_id": None})
+
+        if new_tickers:
+            db.session.execute(
+                insert_on_conflict(Ticker)
+                .values(new_tickers)
+                .on_conflict_do_nothing(index_elements=["symbol"])
+            )
 
         portfolio = Portfolio.query.get(portfolio_id)
         if not portfolio:
-            portfolio = Portfolio(id=portfolio_id, name=f"Portfolio {portfolio_id}")
-            db.session.add(portfolio)
+            db.session.add(Portfolio(id=portfolio_id, name=f"Portfolio {portfolio_id}"))
+            db.session.flush()
 
-        for item in data:
-            symbol = item.get("symbol")
-            quantity = item.get("quantity", 0)
-            avg_price = item.get("avg_price", 0)
-            if not symbol:
-                continue
-
-            position = PortfolioPosition.query.filter_by(
-                portfolio_id=portfolio_id, symbol=symbol
-            ).first()
-            if position:
-                position.quantity = quantity
-                position.avg_price = avg_price
-            else:
-                db.session.add(
-                    PortfolioPosition(
-                        portfolio=portfolio,
-                        symbol=symbol,
-                        quantity=quantity,
-                        avg_price=avg_price,
-                    )
+        rows = [
+            {
+                "portfolio_id": portfolio_id,
+                "symbol": symbol,
+                "quantity": item.get("quantity", 0),
+                "avg_price": item.get("avg_price", 0),
+            }
+            for symbol, item in items.items()
+        ]
+        for chunk in chunked(rows):
+            stmt = insert_on_conflict(PortfolioPosition).values(chunk)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["portfolio_id", "symbol"],
+                    set_={
+                        "quantity": stmt.excluded.quantity,
+                        "avg_price": stmt.excluded.avg_price,
+                    },
                 )
+            )
 
         db.session.commit()
-        return jsonify({"success": True}), 201
+        _invalidate_portfolio(portfolio_id)
+
+        updated = sum(1 for symbol in items if known.get(symbol) is not None)
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "inserted": len(items) - updated,
+                    "updated": updated,
+                    "skipped": skipped,
+                    "duplicates": duplicates,
+                    "tickers_created": len(new_tickers),
+                }
+            ),
+            201,
+        )
     except Exception as e:
         db.session.rollback()
         logger.error(f"Erro ao inserir posições: {e}")
@@ -235,34 +216,12 @@ def upsert_positions(portfolio_id: int):
 def create_portfolio_snapshot(portfolio_id: int):
     """Salva um snapshot diário do valor do portfólio."""
     try:
-        summary = calculate_portfolio_summary(portfolio_id)
-        if not summary:
+        stats = snapshot_portfolios([portfolio_id])
+        if stats["missing"]:
             return (
                 jsonify({"success": False, "error": "Portfólio não encontrado"}),
                 404,
             )
-
-        record = PortfolioDailyValue.query.filter_by(
-            portfolio_id=portfolio_id, date=func.current_date()
-        ).first()
-
-        if record:
-            record.total_value = summary["total_value"]
-            record.total_cost = summary["total_cost"]
-            record.total_gain = summary["total_gain"]
-            record.total_gain_percent = summary["total_gain_percent"]
-        else:
-            db.session.add(
-                PortfolioDailyValue(
-                    portfolio_id=portfolio_id,
-                    total_value=summary["total_value"],
-                    total_cost=summary["total_cost"],
-                    total_gain=summary["total_gain"],
-                    total_gain_percent=summary["total_gain_percent"],
-                )
-            )
-
-        db.session.commit()
         return jsonify({"success": True}), 201
     except Exception as e:
         db.session.rollback()
@@ -273,9 +232,37 @@ def create_portfolio_snapshot(portfolio_id: int):
         )
 
 
+@portfolio_bp.route("/snapshot", methods=["POST"])
+def create_eod_snapshot():
+    """
+    Snapshot de fim de dia de vários portfólios (todos, por padrão) numa
+    única gravação. Corpo opcional: {"ids": [...], "date": "YYYY-MM-DD"}.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        day = date.fromisoformat(data["date"]) if data.get("date") else None
+        portfolio_ids = [int(pid) for pid in data["ids"]] if data.get("ids") else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Parâmetros inválidos"}), 400
+
+    try:
+        return jsonify({"success": True, **snapshot_portfolios(portfolio_ids, day)}), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao salvar snapshot EOD: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro ao salvar snapshot"}),
+            500,
+        )
+
+
 @portfolio_bp.route("/<int:portfolio_id>/daily-metrics", methods=["POST"])
 def update_daily_metrics(portfolio_id: int):
-    """Atualiza métricas diárias do portfólio."""
+    """
+    Atualiza métricas diárias do portfólio com um único upsert em lote
+    (uix_portfolio_metric_date). Cada item aceita ``date`` opcional
+    (YYYY-MM-DD, padrão hoje), permitindo backfills de várias datas.
+    """
     data = request.get_json(silent=True) or []
     if not isinstance(data, list):
         return jsonify({"success": False, "error": "Formato inválido"}), 400
@@ -288,31 +275,40 @@ def update_daily_metrics(portfolio_id: int):
                 404,
             )
 
+        # Uma linha por (métrica, data); em duplicatas prevalece a última ocorrência
         today = date.today()
+        rows = {}
         for item in data:
             metric_id = item.get("id")
             value = item.get("value")
             if metric_id is None or value is None:
                 continue
+            try:
+                day = date.fromisoformat(item["date"]) if item.get("date") else today
+            except (TypeError, ValueError):
+                return (
+                    jsonify({"success": False, "error": "Datas devem estar no formato YYYY-MM-DD."}),
+                    400,
+                )
+            rows[(metric_id, day)] = {
+                "portfolio_id": portfolio_id,
+                "metric_id": metric_id,
+                "value": value,
+                "date": day,
+            }
 
-            record = PortfolioDailyMetric.query.filter_by(
-                portfolio_id=portfolio_id, metric_id=metric_id, date=today
-            ).first()
-
-            if record:
-                record.value = value
-            else:
-                db.session.add(
-                    PortfolioDailyMetric(
-                        portfolio_id=portfolio_id,
-                        metric_id=metric_id,
-                        value=value,
-                        date=today,
-                    )
+        for chunk in chunked(list(rows.values())):
+            stmt = insert_on_conflict(PortfolioDailyMetric).values(chunk)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["portfolio_id", "metric_id", "date"],
+                    set_={"value": stmt.excluded.value},
                 )
+            )
 
         db.session.commit()
-        return jsonify({"success": True}), 201
+        _invalidate_portfolio(portfolio_id)
+        return jsonify({"success": True, "upserted": len(rows)}), 201
     except Exception as e:
         db.session.rollback()
         logger.error("Erro ao salvar métricas", exc_info=True)
@@ -328,6 +324,110 @@ def update_daily_metrics(portfolio_id: int):
         )
 
 
+@portfolio_bp.route("/<int:portfolio_id>/daily-metrics", methods=["GET"])
+def get_daily_metrics(portfolio_id: int):
+    """
+    Retorna métricas diárias num intervalo em formato colunar:
+    ``dates`` e, por métrica, um array de valores alinhado às datas (None sem valor).
+    Parâmetros opcionais: start e end (YYYY-MM-DD, padrão últimos 365 dias)
+    e metrics (lista separada por vírgulas).
+    """
+    try:
+        end = date.fromisoformat(request.args["end"]) if "end" in request.args else date.today()
+        start = (
+            date.fromisoformat(request.args["start"])
+            if "start" in request.args
+            else end - timedelta(days=365)
+        )
+    except ValueError:
+        return jsonify({"success": False, "error": "Datas devem estar no formato YYYY-MM-DD."}), 400
+    metric_ids = [
+        m.strip() for arg in request.args.getlist("metrics") for m in arg.split(",") if m.strip()
+    ]
+
+    try:
+        if not Portfolio.query.get(portfolio_id):
+            return (
+                jsonify({"success": False, "error": "Portfólio não encontrado"}),
+                404,
+            )
+
+        query = db.session.query(
+            PortfolioDailyMetric.date,
+            PortfolioDailyMetric.metric_id,
+            PortfolioDailyMetric.value,
+        ).filter(
+            PortfolioDailyMetric.portfolio_id == portfolio_id,
+            PortfolioDailyMetric.date >= start,
+            PortfolioDailyMetric.date <= end,
+        )
+        if metric_ids:
+            query = query.filter(PortfolioDailyMetric.metric_id.in_(metric_ids))
+        rows = query.order_by(PortfolioDailyMetric.date).all()
+
+        dates = sorted({row.date for row in rows})
+        position = {day: i for i, day in enumerate(dates)}
+        series = {
+            metric_id: [None] * len(dates)
+            for metric_id in metric_ids or sorted({row.metric_id for row in rows})
+        }
+        for day, metric_id, value in rows:
+            series[metric_id][position[day]] = float(value)
+
+        return jsonify(
+            {
+                "success": True,
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "dates": [day.isoformat() for day in dates],
+                "metrics": series,
+            }
+        )
+    except Exception as e:
+        logger.error(f"Erro ao buscar métricas diárias: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro ao buscar métricas diárias"}),
+            500,
+        )
+
+
+@portfolio_bp.route("/<int:portfolio_id>/risk", methods=["GET"])
+def get_portfolio_risk_metrics(portfolio_id: int):
+    """
+    Retorna volatilidade, beta e tracking error contra o IBOV, drawdown máximo
+    e VaR do portfólio com os pesos atuais sobre os preços de daily_quotes.
+    Parâmetros opcionais: start e end (YYYY-MM-DD, padrão últimos 365 dias)
+    e window (janela da volatilidade móvel, padrão 21 pregões).
+    """
+    try:
+        end = date.fromisoformat(request.args["end"]) if "end" in request.args else date.today()
+        start = (
+            date.fromisoformat(request.args["start"])
+            if "start" in request.args
+            else end - timedelta(days=365)
+        )
+    except ValueError:
+        return jsonify({"success": False, "error": "Datas devem estar no formato YYYY-MM-DD."}), 400
+    window = request.args.get("window", 21, type=int)
+    if window < 2:
+        return jsonify({"success": False, "error": "window deve ser maior ou igual a 2."}), 400
+
+    try:
+        risk = get_portfolio_risk(portfolio_id, start, end, window)
+        if risk is None:
+            return (
+                jsonify({"success": False, "error": "Portfólio não encontrado"}),
+                404,
+            )
+        return jsonify({"success": True, "risk": risk})
+    except Exception as e:
+        logger.error(f"Erro ao calcular risco do portfólio: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro ao calcular risco do portfólio"}),
+            500,
+        )
+
+
 @portfolio_bp.route("/<int:portfolio_id>/daily-values", methods=["GET"])
 def get_portfolio_daily_values(portfolio_id: int):
     """Retorna a série de valores diários do portfólio."""
@@ -345,6 +445,7 @@ def get_portfolio_daily_values(portfolio_id: int):
                 "total_cost": float(v.total_cost),
                 "total_gain": float(v.total_gain),
                 "total_gain_percent": float(v.total_gain_percent),
+                "is_reconstructed": bool(v.is_reconstructed),
             }
             for v in values
         ]
@@ -386,48 +487,36 @@ def get_portfolio_daily_contribution(portfolio_id: int):
 def get_suggested_portfolio(portfolio_id: int):
     """Retorna a lista de ativos sugeridos para o portfólio."""
     try:
-        summary = calculate_portfolio_summary(portfolio_id)
-        if not summary:
+        # Book, resumo e ordens da mesma valoração: alinhados posição a posição
+        rebalance = get_rebalance(portfolio_id)
+        if rebalance is None:
             return (
                 jsonify({"success": False, "error": "Portfólio não encontrado"}),
                 404,
             )
 
-        position_pct = {h["symbol"]: h["position_pct"] for h in summary["holdings"]}
-
-        positions = (
-            PortfolioPosition.query.filter_by(portfolio_id=portfolio_id)
-            .join(Ticker, PortfolioPosition.symbol == Ticker.symbol)
-            .join(Company, Ticker.company_id == Company.id, isouter=True)
-            .join(
-                AssetMetrics,
-                PortfolioPosition.symbol == AssetMetrics.symbol,
-                isouter=True,
-            )
-            .all()
-        )
+        book, summary, plan = rebalance
 
         assets = []
-        for pos in positions:
-            current_price = (
-                float(pos.metrics.last_price)
-                if pos.metrics and pos.metrics.last_price is not None
-                else 0.0
-            )
-            target_price = current_price * 1.1 if current_price else 0.0
+        for holding, company, target_price, trade in zip(
+            summary["holdings"], book.companies, book.target_price.tolist(), plan["trades"]
+        ):
+            current_price = holding["last_price"]
+            # Sem preço-alvo cadastrado, o alvo é o próprio preço atual (upside 0)
+            if target_price != target_price:
+                target_price = current_price
             upside = (
                 ((target_price - current_price) / current_price * 100)
                 if current_price
                 else 0.0
             )
-            weight = position_pct.get(pos.symbol, 0.0)
+            weight = holding["position_pct"]
+            target_weight = holding["target_pct"]
 
             assets.append(
                 {
-                    "ticker": pos.symbol,
-                    "company": pos.ticker.company.company_name
-                    if pos.ticker and pos.ticker.company
-                    else "",
+                    "ticker": holding["symbol"],
+                    "company": company or "",
                     "currency": "BRL",
                     "currentPrice": current_price,
                     "targetPrice": target_price,
@@ -442,7 +531,10 @@ def get_suggested_portfolio(portfolio_id: int):
                     "epsGrowth26": "N/A",
                     "ibovWeight": 0,
                     "portfolioWeight": weight,
-                    "owUw": weight,
+                    "targetWeight": target_weight,
+                    "owUw": weight - target_weight,
+                    "tradeQty": trade["trade_qty"],
+                    "lotSize": trade["lot_size"],
                 }
             )
 
@@ -455,33 +547,170 @@ def get_suggested_portfolio(portfolio_id: int):
         )
 
 
-@portfolio_bp.route("/<int:portfolio_id>/sector-weights", methods=["GET"])
-def get_portfolio_sector_weights(portfolio_id: int):
-    """Retorna os pesos por setor do portfólio."""
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _invalid_target(item: dict):
+    """Mensagem de erro para um item de alvo inválido, ou None."""
+    if not _is_number(item["target_pct"]) or item["target_pct"] < 0:
+        return "target_pct deve ser um número maior ou igual a zero."
+    target_price = item.get("target_price")
+    if target_price is not None and not _is_number(target_price):
+        return "target_price deve ser numérico."
+    lot_size = item.get("lot_size")
+    if lot_size is not None and (not _is_number(lot_size) or lot_size != int(lot_size) or lot_size <= 0):
+        return "lot_size deve ser um inteiro positivo."
+    return None
+
+
+@portfolio_bp.route("/<int:portfolio_id>/targets", methods=["POST"])
+def upsert_targets(portfolio_id: int):
+    """
+    Define pesos-alvo (``target_pct``, em %), e opcionalmente ``target_price``
+    e ``lot_size``, por ativo. Ativos sem posição entram com quantidade zero.
+    Campos omitidos mantêm o valor atual.
+    """
+    data = request.get_json(silent=True) or []
+    if not isinstance(data, list):
+        return jsonify({"success": False, "error": "Formato inválido"}), 400
+
+    items = {
+        item["symbol"]: item
+        for item in data
+        if isinstance(item, dict) and item.get("symbol") and item.get("target_pct") is not None
+    }
+    for symbol, item in items.items():
+        error = _invalid_target(item)
+        if error:
+            return jsonify({"success": False, "error": f"{symbol}: {error}"}), 400
+
     try:
-        summary = calculate_portfolio_summary(portfolio_id)
-        if not summary:
+        if not Portfolio.query.get(portfolio_id):
             return (
                 jsonify({"success": False, "error": "Portfólio não encontrado"}),
                 404,
             )
 
-        position_pct = {h["symbol"]: h["position_pct"] for h in summary["holdings"]}
+        # Tickers conhecidos e valores atuais das posições numa única consulta
+        current = {
+            symbol: (quantity, avg_price, target_price, lot_size)
+            for symbol, quantity, avg_price, target_price, lot_size in (
+                db.session.query(
+                    Ticker.symbol,
+                    PortfolioPosition.quantity,
+                    PortfolioPosition.avg_price,
+                    PortfolioPosition.target_price,
+                    PortfolioPosition.lot_size,
+                )
+                .outerjoin(
+                    PortfolioPosition,
+                    and_(
+                        PortfolioPosition.symbol == Ticker.symbol,
+                        PortfolioPosition.portfolio_id == portfolio_id,
+                    ),
+                )
+                .filter(Ticker.symbol.in_(list(items)))
+            )
+        }
+        unknown = sorted(set(items) - set(current))
 
-        positions = (
-            PortfolioPosition.query.filter_by(portfolio_id=portfolio_id)
-            .join(
-                AssetMetrics,
-                PortfolioPosition.symbol == AssetMetrics.symbol,
-                isouter=True,
+        rows = []
+        for symbol, item in items.items():
+            if symbol not in current:
+                continue
+            quantity, avg_price, target_price, lot_size = current[symbol]
+            rows.append(
+                {
+                    "portfolio_id": portfolio_id,
+                    "symbol": symbol,
+                    "quantity": quantity if quantity is not None else 0,
+                    "avg_price": avg_price if avg_price is not None else 0,
+                    "target_pct": item["target_pct"],
+                    "target_price": item.get("target_price", target_price),
+                    "lot_size": item.get("lot_size") or lot_size or DEFAULT_LOT_SIZE,
+                }
             )
-            .all()
+
+        for chunk in chunked(rows):
+            stmt = insert_on_conflict(PortfolioPosition).values(chunk)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["portfolio_id", "symbol"],
+                    set_={
+                        "target_pct": stmt.excluded.target_pct,
+                        "target_price": stmt.excluded.target_price,
+                        "lot_size": stmt.excluded.lot_size,
+                    },
+                )
+            )
+
+        db.session.commit()
+        _invalidate_portfolio(portfolio_id)
+        total_target = sum(float(item["target_pct"]) for item in items.values())
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "updated": len(rows),
+                    "unknown_symbols": unknown,
+                    "total_target_pct": total_target,
+                }
+            ),
+            201,
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao salvar alvos: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro ao salvar alvos"}),
+            500,
+        )
+
+
+@portfolio_bp.route("/<int:portfolio_id>/rebalance", methods=["GET"])
+def get_portfolio_rebalance(portfolio_id: int):
+    """
+    Retorna as ordens (em lotes inteiros) para levar o portfólio aos pesos-alvo.
+    Parâmetro opcional: turnover (giro máximo, em % do patrimônio).
+    """
+    turnover = request.args.get("turnover", type=float)
+    if turnover is not None and turnover < 0:
+        return jsonify({"success": False, "error": "turnover deve ser positivo."}), 400
+
+    try:
+        rebalance = get_rebalance(portfolio_id, turnover / 100 if turnover is not None else None)
+        if rebalance is None:
+            return (
+                jsonify({"success": False, "error": "Portfólio não encontrado"}),
+                404,
+            )
+        return jsonify({"success": True, "rebalance": rebalance[2]})
+    except Exception as e:
+        logger.error(f"Erro ao calcular rebalanceamento: {e}")
+        return (
+            jsonify({"success": False, "error": "Erro ao calcular rebalanceamento"}),
+            500,
         )
 
+
+@portfolio_bp.route("/<int:portfolio_id>/sector-weights", methods=["GET"])
+def get_portfolio_sector_weights(portfolio_id: int):
+    """Retorna os pesos por setor do portfólio."""
+    try:
+        valuation = get_portfolio_valuation(portfolio_id)
+        if not valuation:
+            return (
+                jsonify({"success": False, "error": "Portfólio não encontrado"}),
+                404,
+            )
+
+        book, summary = valuation
+
         weights = {}
-        for pos in positions:
-            sector = pos.metrics.sector if pos.metrics and pos.metrics.sector else "Unknown"
-            weights[sector] = weights.get(sector, 0.0) + position_pct.get(pos.symbol, 0.0)
+        for holding, sector in zip(summary["holdings"], book.sectors):
+            sector = sector or "Unknown"
+            weights[sector] = weights.get(sector, 0.0) + holding["position_pct"]
 
         result = [
             {
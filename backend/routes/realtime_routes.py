@@ -2,6 +2,9 @@ import logging
 from flask import Blueprint, request, jsonify
 from flask_socketio import emit, join_room, leave_room
 from backend.services.metatrader5_rtd_worker import get_rtd_worker
+from backend.services.tick_buffer import TIMEFRAMES
+from backend.services.quote_cache import quote_cache
+from backend.services.portfolio_stream import load_live_portfolio, portfolio_room
 
 logger = logging.getLogger(__name__)
 realtime_bp = Blueprint('realtime_bp', __name__)
@@ -18,19 +21,69 @@ def get_realtime_status_http():
 
 @realtime_bp.route('/quotes', methods=['GET'])
 def get_realtime_quotes_http():
-    """Retorna cotações em tempo real para uma lista de tickers."""
+    """
+    Retorna cotações de uma lista de tickers a partir do quote_cache, com a
+    idade de cada uma. Apenas os ausentes no cache são buscados no MT5, uma
+    única vez, e passam a ser mantidos aquecidos pelo worker.
+    """
     worker = get_rtd_worker()
     if not worker or not worker.mt5_connected:
         return jsonify({'status': 'error', 'message': 'Worker não inicializado'}), 503
 
-    tickers = request.args.getlist("tickers") or ["VALE3", "PETR4", "ITUB4"]
+    tickers = [
+        t.strip().upper()
+        for arg in request.args.getlist("tickers")
+        for t in arg.split(",")
+        if t.strip()
+    ] or ["VALE3", "PETR4", "ITUB4"]
+    max_age = request.args.get("max_age", type=float)
 
-    quotes = {}
-    for t in tickers:
-        quote = worker.get_mt5_quote(t.upper())
-        if quote:
-            quotes[t.upper()] = quote
-    return jsonify({'status': 'success', 'data': quotes})
+    quotes, missing = quote_cache.get_many(tickers, max_age)
+    if missing:
+        worker.watch_symbols(missing)
+        still_missing = []
+        for ticker in missing:
+            quote = worker.get_mt5_quote(ticker)
+            if quote:
+                quote_cache.put(ticker, quote)
+                quotes[ticker] = {**quote, 'age_ms': 0.0}
+            else:
+                still_missing.append(ticker)
+        missing = still_missing
+
+    return jsonify({
+        'status': 'success',
+        'data': quotes,
+        'missing': missing,
+        'max_age_seconds': quote_cache.max_age_seconds if max_age is None else max_age,
+    })
+
+
+@realtime_bp.route('/bars/<string:ticker>', methods=['GET'])
+def get_realtime_bars_http(ticker):
+    """Retorna barras OHLCV intraday agregadas em memória pelo worker."""
+    worker = get_rtd_worker()
+    if not worker:
+        return jsonify({'status': 'error', 'message': 'Worker não inicializado'}), 503
+
+    timeframe = request.args.get('timeframe', '1m')
+    if timeframe not in TIMEFRAMES:
+        return jsonify({
+            'status': 'error',
+            'message': f"Timeframe inválido. Use um de: {', '.join(TIMEFRAMES)}",
+        }), 400
+    limit = request.args.get('limit', type=int)
+
+    bars = worker.get_bars(ticker.upper(), timeframe, limit)
+    if bars is None:
+        return jsonify({
+            'status': 'error',
+            'message': f"Sem ticks em memória para '{ticker.upper()}'",
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'data': {'symbol': ticker.upper(), 'timeframe': timeframe, 'bars': bars},
+    })
 
 # --- EVENTOS WEBSOCKET ---
 def register_socketio_events(socketio):
@@ -44,8 +97,8 @@ def register_socketio_events(socketio):
     @socketio.on('disconnect')
     def handle_disconnect():
         logger.info(f"Cliente desconectado: {request.sid}")
-        if worker and hasattr(worker, 'active_subscriptions') and request.sid in worker.active_subscriptions:
-            del worker.active_subscriptions[request.sid]
+        if worker:
+            worker.unsubscribe_all(request.sid)
 
     @socketio.on('subscribe_quotes')
     def handle_subscribe(data):
@@ -60,6 +113,23 @@ def register_socketio_events(socketio):
                 worker.subscribe_ticker(sid, ticker.upper())
         logger.info(f"Sessão {sid} subscreveu para: {tickers}")
         emit('subscription_confirmed', {'tickers': tickers})
+        emit('price_snapshot', {'quotes': worker.get_snapshot(
+            [t for t in tickers if isinstance(t, str)]
+        )})
+
+    @socketio.on('request_resync')
+    def handle_resync(data=None):
+        """Reenvia o snapshot completo quando o cliente detecta uma lacuna na sequência."""
+        sid = request.sid
+        if not worker:
+            return
+
+        tickers = (data or {}).get('tickers')
+        if not isinstance(tickers, list):
+            tickers = list(worker.subscriptions.symbols_for_room(sid))
+        tickers = [t for t in tickers if isinstance(t, str)]
+        logger.info(f"Sessão {sid} solicitou resync de: {tickers}")
+        emit('price_snapshot', {'quotes': worker.get_snapshot(tickers)})
 
     @socketio.on('unsubscribe_quotes')
     def handle_unsubscribe(data):
@@ -74,3 +144,29 @@ def register_socketio_events(socketio):
         logger.info(f"Sessão {sid} cancelou subscrição de: {tickers}")
         emit('unsubscription_confirmed', {'tickers': tickers})
 
+    @socketio.on('subscribe_portfolio')
+    def handle_subscribe_portfolio(data):
+        """Passa a enviar o P&L ao vivo do portfólio: snapshot agora, deltas a cada tick."""
+        sid = request.sid
+        portfolio_id = (data or {}).get('portfolio_id')
+        if not isinstance(portfolio_id, int) or not worker:
+            return
+
+        live = worker.subscribe_portfolio(sid, portfolio_id, load_live_portfolio)
+        if live is None:
+            emit('portfolio_error', {'portfolio_id': portfolio_id, 'error': 'Portfólio não encontrado'})
+            return
+        join_room(portfolio_room(portfolio_id))
+        logger.info(f"Sessão {sid} acompanha o portfólio {portfolio_id}")
+        emit('portfolio_snapshot', live.snapshot())
+
+    @socketio.on('unsubscribe_portfolio')
+    def handle_unsubscribe_portfolio(data):
+        sid = request.sid
+        portfolio_id = (data or {}).get('portfolio_id')
+        if not isinstance(portfolio_id, int) or not worker:
+            return
+
+        leave_room(portfolio_room(portfolio_id))
+        worker.unsubscribe_portfolio(sid, portfolio_id)
+        emit('portfolio_unsubscribed', {'portfolio_id': portfolio_id})
@@ -0,0 +1,22 @@
+# backend/services/db_upsert.py
+# INSERT ... ON CONFLICT portável entre PostgreSQL (produção) e SQLite (testes)
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend.models import db
+
+# Linhas por statement: mantém os parâmetros abaixo do limite do driver (65535 no PostgreSQL)
+UPSERT_CHUNK_ROWS = 5000
+
+
+def insert_on_conflict(model):
+    """Retorna um ``insert()`` do dialeto em uso, com ``on_conflict_do_*`` e ``excluded``."""
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def chunked(rows, size: int = UPSERT_CHUNK_ROWS):
+    """Divide a lista de linhas em lotes de até ``size`` itens."""
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
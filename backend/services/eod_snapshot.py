@@ -0,0 +1,109 @@
+# backend/services/eod_snapshot.py
+# Snapshot de fim de dia de todos os portfólios: valoração em lote e gravação num único upsert
+
+import logging
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from backend.models import db, DailyQuote, Portfolio, PortfolioDailyValue
+from backend.services.db_upsert import chunked, insert_on_conflict
+from backend.services.portfolio_valuation import (
+    load_cota_metrics_many,
+    load_portfolio_books,
+    value_books,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def load_closes(symbols: Iterable[str], day: date) -> Dict[str, float]:
+    """Fechamentos do dia em ``daily_quotes`` para os símbolos informados."""
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    rows = db.session.query(DailyQuote.symbol, DailyQuote.close).filter(
+        DailyQuote.symbol.in_(symbols), DailyQuote.date == day
+    )
+    return {symbol: float(close) for symbol, close in rows}
+
+
+def snapshot_portfolios(portfolio_ids: Optional[Iterable[int]] = None,
+                        day: Optional[date] = None) -> Dict:
+    """
+    Valora os portfólios (todos, por padrão) com os fechamentos do dia e
+    grava os registros de ``portfolio_daily_values`` num único
+    INSERT ... ON CONFLICT (portfolio_id, date) DO UPDATE.
+
+    Símbolos sem fechamento do dia em ``daily_quotes`` usam o último preço de
+    ``asset_metrics``. Retorna a duração e as contagens da execução.
+    """
+    started = time.perf_counter()
+    day = day or date.today()
+    if portfolio_ids is None:
+        portfolio_ids = [pid for (pid,) in db.session.query(Portfolio.id).order_by(Portfolio.id)]
+    portfolio_ids = list(dict.fromkeys(portfolio_ids))
+
+    books = load_portfolio_books(portfolio_ids)
+    ordered = list(books.values())
+    closes = load_closes({s for book in ordered for s in book.symbols}, day)
+    for book in ordered:
+        # Books recém-carregados (fora do cache): o preço pode ser substituído no lugar
+        close = np.array([closes.get(s, np.nan) for s in book.symbols], dtype=np.float64)
+        book.last_price = np.where(np.isnan(close), book.last_price, close)
+    summaries = value_books(ordered, load_cota_metrics_many(books, day))
+
+    rows = [
+        {
+            "portfolio_id": summary["id"],
+            "date": day,
+            "total_value": round(summary["total_value"], 2),
+            "total_cost": round(summary["total_cost"], 2),
+            "total_gain": round(summary["total_gain"], 2),
+            "total_gain_percent": round(summary["total_gain_percent"], 4),
+            "is_reconstructed": False,
+        }
+        for summary in summaries
+    ]
+
+    existing = {
+        pid for (pid,) in db.session.query(PortfolioDailyValue.portfolio_id).filter(
+            PortfolioDailyValue.portfolio_id.in_(list(books)),
+            PortfolioDailyValue.date == day,
+        )
+    } if books else set()
+    for chunk in chunked(rows):
+        stmt = insert_on_conflict(PortfolioDailyValue).values(chunk)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["portfolio_id", "date"],
+                set_={
+                    "total_value": stmt.excluded.total_value,
+                    "total_cost": stmt.excluded.total_cost,
+                    "total_gain": stmt.excluded.total_gain,
+                    "total_gain_percent": stmt.excluded.total_gain_percent,
+                    # O snapshot real substitui um dia reconstruído pelo rebuild-nav
+                    "is_reconstructed": stmt.excluded.is_reconstructed,
+                },
+            )
+        )
+    db.session.commit()
+
+    stats = {
+        "date": day.isoformat(),
+        "portfolios": len(rows),
+        "positions": sum(len(book) for book in ordered),
+        "priced_from_close": len(closes),
+        "inserted": len(rows) - len(existing),
+        "updated": len(existing),
+        "missing": [pid for pid in portfolio_ids if pid not in books],
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info(
+        f"Snapshot EOD {stats['date']}: {stats['portfolios']} portfólios "
+        f"({stats['inserted']} inseridos, {stats['updated']} atualizados, "
+        f"{stats['positions']} posições) em {stats['duration_ms']} ms"
+    )
+    return stats
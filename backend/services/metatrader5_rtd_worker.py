@@ -5,14 +5,24 @@
 import os
 import sys
 import time
+import queue
 import threading
 import logging
+from types import SimpleNamespace
 from typing import Dict, List, Optional, Set
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
+from backend.services.tick_buffer import TIMEFRAMES, BarAggregator, TickRingBuffer
+from backend.services.tick_store import TickStoreWriter
+from backend.services.quote_cache import quote_cache
+from backend.services.portfolio_stream import PortfolioStream, portfolio_room
+from backend.services.portfolio_valuation import reprice_cached_valuations
+from backend.services.subscription_registry import SubscriptionRegistry
+
 if sys.stdout.encoding.lower() != "utf-8":
     sys.stdout.reconfigure(encoding="utf-8")
     sys.stderr.reconfigure(encoding="utf-8")
@@ -39,8 +49,21 @@ class MetaTrader5RTDWorker:
     def __init__(self, socketio=None):
         self.socketio = socketio
         self.running = False
+
+        # Modo do servidor Socket.IO (threading, eventlet ou gevent). Nos modos
+        # assíncronos só as chamadas mt5.* saem do loop de eventos, para um
+        # executor próprio e uma de cada vez; buffers, store e emits ficam no
+        # lado green. O flush do store usa o pool genérico (_offload).
+        self.async_mode = getattr(socketio, 'async_mode', None) or 'threading'
+        self._offload = self._make_offload(self.async_mode)
+        self._mt5_executor = self._make_mt5_executor(self.async_mode)
+        self._mt5_lock = threading.Lock()
+        self.emit_queue: Optional[queue.Queue] = None
+        self.emit_thread = None
         self.mt5_connected = False
-        self.active_subscriptions: Dict[str, Set[str]] = {}
+        self.subscriptions = SubscriptionRegistry()
+        # Portfólios reavaliados incrementalmente a cada tick (P&L ao vivo)
+        self.portfolio_stream = PortfolioStream()
         self.ticker_prices: Dict[str, Dict] = {}
         self.db_engine = None
         self.worker_thread = None
@@ -49,6 +72,24 @@ class MetaTrader5RTDWorker:
         self.failed_symbols: Set[str] = set()    # Símbolos que falharam na ativação
         self.activation_failures: Dict[str, int] = {}
 
+        # Métricas do estágio de fan-out (uma leitura MT5 por símbolo por ciclo)
+        self.mt5_call_count = 0
+        self.cycle_count = 0
+        self.last_cycle_stats: Dict[str, float] = {
+            "mt5_calls": 0,
+            "distinct_symbols": 0,
+            "room_subscriptions": 0,
+            "emits": 0,
+            "changed_symbols": 0,
+            "ticks_ingested": 0,
+        }
+
+        # Streaming por delta: último tick emitido e sequência por símbolo. O
+        # lock cobre os dois mapas, lidos pelos handlers Socket.IO e pelo loop.
+        self.last_emitted: Dict[str, Dict] = {}
+        self.symbol_sequences: Dict[str, int] = {}
+        self._delta_lock = threading.Lock()
+
         # Símbolos principais a serem ativados ao iniciar
         self.main_symbols: List[str] = [
             'VALE3', 'PETR4', 'ITUB4', 'BBDC4', 'ABEV3',
@@ -77,6 +118,29 @@ class MetaTrader5RTDWorker:
         self.PAUSE_INTERVAL_SECONDS = 2  # Mais rápido para tempo real
         self.RETRY_DELAY_SECONDS = 30
 
+        # Modo de ingestão: "poll" (symbol_info_tick a cada ciclo) ou
+        # "ticks" (copy_ticks_from desde o último tick visto, com pausa adaptativa)
+        self.INGESTION_MODE = os.getenv("RTD_INGESTION_MODE", "poll").lower()
+        self.MIN_PAUSE_SECONDS = float(os.getenv("RTD_MIN_PAUSE_SECONDS", "0.1"))
+        self.MAX_PAUSE_SECONDS = float(os.getenv("RTD_MAX_PAUSE_SECONDS", "5"))
+        self.TICK_BATCH_SIZE = int(os.getenv("RTD_TICK_BATCH_SIZE", "1000"))
+        self.current_pause = self.MIN_PAUSE_SECONDS
+        self.tick_watermarks: Dict[str, int] = {}  # time_msc do último tick visto
+
+        # Histórico intraday em memória: buffer circular de ticks e barras por símbolo
+        self.TICK_BUFFER_CAPACITY = int(os.getenv("RTD_TICK_BUFFER_CAPACITY", "20000"))
+        self.tick_buffers: Dict[str, TickRingBuffer] = {}
+        self.bar_aggregators: Dict[str, BarAggregator] = {}
+
+        # Persistência intraday (ticks e barras fechadas) via COPY em thread própria
+        self.PERSIST_INTRADAY = os.getenv("RTD_PERSIST_INTRADAY", "true").lower() == "true"
+        self.PERSIST_TICKS = os.getenv("RTD_PERSIST_TICKS", "true").lower() == "true"
+        self.tick_store: Optional[TickStoreWriter] = None
+
+        # Símbolos pedidos via HTTP sem room: mantidos aquecidos no quote_cache
+        self.QUOTE_WATCH_TTL_SECONDS = float(os.getenv("QUOTE_WATCH_TTL_SECONDS", "300"))
+        self.cache_watchlist: Dict[str, float] = {}
+
         # Inicializar conexão com banco
         self._initialize_database()
 
@@ -130,7 +194,7 @@ class MetaTrader5RTDWorker:
     def _sync_symbols_realtime(self):
         """Sincroniza símbolos e ativa tempo real para principais."""
         try:
-            symbols = mt5.symbols_get()
+            symbols = self._run_in_mt5_executor(mt5.symbols_get)
             if symbols:
                 self.mt5_symbols = {symbol.name for symbol in symbols}
                 logger.info(f"Sincronizando {len(self.mt5_symbols)} símbolos...")
@@ -171,21 +235,137 @@ class MetaTrader5RTDWorker:
 
     def _activate_realtime_for_symbol(self, symbol: str):
         """Ativa tempo real para um símbolo específico usando market_book_add."""
-        try:
-            if mt5.market_book_add(symbol) or mt5.symbol_select(symbol, True):
-                tick = mt5.symbol_info_tick(symbol)
-                if tick and tick.bid > 0:
-                    self.realtime_symbols.add(symbol)
-                    logger.info(f"{symbol}: tempo real ativo")
-                    return True
-            self.failed_symbols.add(symbol)
-            logger.warning(f"{symbol}: falha na ativação de tempo real")
-            return False
+        return self._activate_and_read_tick(symbol) is not None
 
+    def _activate_and_read_tick(self, symbol: str):
+        """Ativa o tempo real do símbolo e devolve o tick lido na ativação (None se falhou)."""
+        try:
+            tick = self._run_in_mt5_executor(self._mt5_activate, symbol)
         except Exception as e:
             self.failed_symbols.add(symbol)
             logger.error(f"{symbol}: erro ao ativar tempo real: {e}")
-            return False
+            return None
+        self.mt5_call_count += 1
+        return tick if self._mark_activation(symbol, tick) else None
+
+    def _mark_activation(self, symbol: str, tick) -> bool:
+        """Registra o resultado de uma ativação de tempo real."""
+        if tick and tick.bid > 0:
+            self.realtime_symbols.add(symbol)
+            logger.info(f"{symbol}: tempo real ativo")
+            return True
+        self.failed_symbols.add(symbol)
+        logger.warning(f"{symbol}: falha na ativação de tempo real")
+        return False
+
+    # --- Chamadas ao MT5 (rodam no executor do MT5; sem logs nem locks) ---
+    @staticmethod
+    def _mt5_activate(symbol: str):
+        """Adiciona o market book (ou seleciona no Market Watch) e lê o tick atual."""
+        if mt5.market_book_add(symbol) or mt5.symbol_select(symbol, True):
+            return mt5.symbol_info_tick(symbol)
+        return None
+
+    @staticmethod
+    def _mt5_symbol_ticks(symbols) -> Dict:
+        """Um ``symbol_info_tick`` por símbolo; erros voltam como valor."""
+        ticks = {}
+        for symbol in symbols:
+            try:
+                ticks[symbol] = mt5.symbol_info_tick(symbol)
+            except Exception as e:
+                ticks[symbol] = e
+        return ticks
+
+    @classmethod
+    def _mt5_resolve_misses(cls, symbols, activate) -> Dict:
+        """
+        Fallback dos símbolos sem tick: ativação (para os de ``activate``) e,
+        sem tick válido, a última barra M1. Devolve (tick, rates) ou o erro.
+        """
+        results = {}
+        for symbol in symbols:
+            try:
+                tick = cls._mt5_activate(symbol) if symbol in activate else None
+                rates = None
+                if not (tick and tick.bid > 0):
+                    rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_M1, 0, 1)
+                results[symbol] = (tick, rates)
+            except Exception as e:
+                results[symbol] = e
+        return results
+
+    def _mt5_new_ticks(self, watermarks: Dict[str, Optional[int]]) -> Dict:
+        """Ticks novos de cada símbolo (ver ``_fetch_new_ticks``); erros voltam como valor."""
+        batches = {}
+        for symbol, watermark in watermarks.items():
+            try:
+                batches[symbol] = self._fetch_new_ticks(symbol, watermark)
+            except Exception as e:
+                batches[symbol] = e
+        return batches
+
+    @staticmethod
+    def _make_offload(async_mode: str):
+        """Retorna a função que executa código bloqueante fora do loop de eventos."""
+        if async_mode == 'eventlet':
+            from eventlet import tpool
+            return tpool.execute
+        if async_mode in ('gevent', 'gevent_uwsgi'):
+            import gevent
+            return lambda fn, *args: gevent.get_hub().threadpool.apply(fn, args)
+        return None
+
+    @staticmethod
+    def _make_mt5_executor(async_mode: str):
+        """
+        Executor das chamadas ao MT5 nos modos assíncronos: um pool gevent de
+        uma única thread ou, no eventlet, o tpool (serializado por ``_mt5_lock``).
+        """
+        if async_mode == 'eventlet':
+            from eventlet import tpool
+            return tpool.execute
+        if async_mode in ('gevent', 'gevent_uwsgi'):
+            from gevent.threadpool import ThreadPool
+            pool = ThreadPool(1)
+            return lambda fn, *args: pool.apply(fn, args)
+        return None
+
+    def _run_in_mt5_executor(self, fn, *args):
+        """
+        Executa ``fn`` no executor do MT5, uma chamada por vez (loop e handlers
+        HTTP/Socket.IO não se sobrepõem). ``fn`` só deve chamar mt5.* e
+        devolver os dados crus: nada de logs, buffers ou locks do lado green.
+        """
+        with self._mt5_lock:
+            if self._mt5_executor is None:
+                return fn(*args)
+            return self._mt5_executor(fn, *args)
+
+    def _spawn(self, target):
+        """Inicia uma tarefa de fundo compatível com o modo do Socket.IO."""
+        if self.socketio is not None and self.async_mode != 'threading':
+            return self.socketio.start_background_task(target)
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _join_task(self, task, timeout: float = 5):
+        """Aguarda uma tarefa de ``_spawn``: thread do sistema ou green (eventlet/gevent)."""
+        if task is None:
+            return
+        if self.async_mode == 'eventlet' and not isinstance(task, threading.Thread):
+            import eventlet
+            # A thread green do engineio não aceita timeout no join
+            with eventlet.Timeout(timeout, False):
+                task.join()
+        else:
+            task.join(timeout=timeout)
+
+    def _symbol_info_tick(self, symbol: str):
+        """Chama ``mt5.symbol_info_tick`` contabilizando a chamada nas métricas."""
+        self.mt5_call_count += 1
+        return self._run_in_mt5_executor(mt5.symbol_info_tick, symbol)
 
     # --- Legacy compatibility methods ---
     def initialize(self):
@@ -199,6 +379,13 @@ class MetaTrader5RTDWorker:
     def get_mt5_quote(self, ticker: str) -> Optional[Dict]:
         """
         Obtém cotação EM TEMPO REAL do MetaTrader5.
+        Seguro para chamar de handlers HTTP/Socket.IO em qualquer modo assíncrono.
+        """
+        return self._get_quote_from_mt5(ticker)
+
+    def _get_quote_from_mt5(self, ticker: str) -> Optional[Dict]:
+        """
+        Lê a cotação do MT5 (cada chamada passa pelo executor do MT5).
         PRIORIDADE ABSOLUTA PARA TICKS EM TEMPO REAL.
         """
         if not self.mt5_connected or not MT5_AVAILABLE:
@@ -213,7 +400,7 @@ class MetaTrader5RTDWorker:
             
             # PRIORIDADE 1: Se já tem tempo real ativo, usar tick
             if ticker in self.realtime_symbols:
-                tick = mt5.symbol_info_tick(ticker)
+                tick = self._symbol_info_tick(ticker)
                 if tick and tick.bid > 0:
                     return self._format_realtime_quote(ticker, tick)
                 else:
@@ -222,19 +409,22 @@ class MetaTrader5RTDWorker:
             # PRIORIDADE 2: Tentar ativar tempo real AGORA
             if ticker not in self.failed_symbols:
                 if self._activate_realtime_for_symbol(ticker):
-                    tick = mt5.symbol_info_tick(ticker)
+                    tick = self._symbol_info_tick(ticker)
                     if tick and tick.bid > 0:
                         return self._format_realtime_quote(ticker, tick)
             
             # PRIORIDADE 3: Tentar forçar tick sem ativação
-            tick = mt5.symbol_info_tick(ticker)
+            tick = self._symbol_info_tick(ticker)
             if tick and tick.bid > 0:
                 logger.info(f"{ticker}: Tick obtido sem ativação prévia")
                 return self._format_realtime_quote(ticker, tick)
             
             # ÚLTIMO RECURSO: Dados mais recentes possíveis (M1)
             logger.warning(f"{ticker}: usando dados M1 como último recurso")
-            rates = mt5.copy_rates_from_pos(ticker, mt5.TIMEFRAME_M1, 0, 1)
+            self.mt5_call_count += 1
+            rates = self._run_in_mt5_executor(
+                mt5.copy_rates_from_pos, ticker, mt5.TIMEFRAME_M1, 0, 1
+            )
             if rates is not None and len(rates) > 0:
                 rate = rates[0]
                 return self._format_quote_from_rate(ticker, rate, "M1_fallback")
@@ -259,7 +449,8 @@ class MetaTrader5RTDWorker:
             "time": datetime.fromtimestamp(tick.time).isoformat(),
             "source": "mt5_realtime",
             "price": float(price),
-            "flags": tick.flags,
+            "time_msc": int(getattr(tick, 'time_msc', tick.time * 1000)),
+            "flags": int(tick.flags),
             "volume_real": float(getattr(tick, 'volume_real', 0)),
             "is_realtime": True
         }
@@ -281,33 +472,396 @@ class MetaTrader5RTDWorker:
             "is_realtime": False
         }
 
+    def watch_symbols(self, symbols):
+        """Inclui símbolos pedidos via HTTP no ciclo de leitura para aquecer o quote_cache."""
+        now = time.monotonic()
+        for symbol in symbols:
+            if symbol in self.mt5_symbols:
+                self.cache_watchlist[symbol] = now
+
+    def _build_symbol_index(self) -> Dict[str, Set[str]]:
+        """
+        Monta o índice reverso símbolo -> rooms a partir das subscrições.
+        Símbolos observados apenas pelo cache ou por portfólios acompanhados
+        entram com um conjunto vazio de rooms.
+        """
+        index = self.subscriptions.symbol_index()
+        for symbol in self.portfolio_stream.symbols():
+            index.setdefault(symbol, set())
+
+        expiry = time.monotonic() - self.QUOTE_WATCH_TTL_SECONDS
+        for symbol, requested_at in list(self.cache_watchlist.items()):
+            if requested_at < expiry:
+                self.cache_watchlist.pop(symbol, None)
+                if symbol not in index:
+                    self._release_symbol(symbol)
+            else:
+                index.setdefault(symbol, set())
+        return index
+
+    def _fetch_quotes(self, symbols) -> Dict[str, Dict]:
+        """
+        Obtém uma cotação por símbolo distinto: uma leitura ``symbol_info_tick``
+        por símbolo no lote; os símbolos sem tick válido são resolvidos depois,
+        numa única passada de fallback.
+        """
+        quotes: Dict[str, Dict] = {}
+        misses: List[str] = []
+        symbols = [symbol for symbol in symbols if symbol in self.mt5_symbols]
+        ticks = self._run_in_mt5_executor(self._mt5_symbol_ticks, symbols)
+        self.mt5_call_count += len(symbols)
+        for symbol, tick in ticks.items():
+            if isinstance(tick, Exception):
+                logger.error(f"Erro ao obter cotação para {symbol}: {tick}")
+                continue
+            if tick and tick.bid > 0:
+                quotes[symbol] = self._format_realtime_quote(symbol, tick)
+            else:
+                misses.append(symbol)
+
+        if misses:
+            quotes.update(self._resolve_missing_quotes(misses))
+
+        for symbol, quote in quotes.items():
+            if quote.get("is_realtime"):
+                self._record_ticks(symbol, self._quote_columns(quote))
+        return quotes
+
+    def _resolve_missing_quotes(self, symbols) -> Dict[str, Dict]:
+        """
+        Fallback dos símbolos sem tick no lote: ativa o tempo real de quem
+        ainda não falhou (reaproveitando o tick lido na ativação) e, sem tick,
+        usa a última barra M1.
+        """
+        activate = {
+            symbol for symbol in symbols
+            if symbol not in self.realtime_symbols and symbol not in self.failed_symbols
+        }
+        results = self._run_in_mt5_executor(self._mt5_resolve_misses, symbols, activate)
+
+        quotes: Dict[str, Dict] = {}
+        for symbol, result in results.items():
+            if isinstance(result, Exception):
+                if symbol in activate:
+                    self.failed_symbols.add(symbol)
+                logger.error(f"Erro ao obter cotação para {symbol}: {result}")
+                continue
+            tick, rates = result
+            if symbol in activate:
+                self.mt5_call_count += 1
+                if self._mark_activation(symbol, tick):
+                    quotes[symbol] = self._format_realtime_quote(symbol, tick)
+                    continue
+
+            self.mt5_call_count += 1
+            if rates is not None and len(rates) > 0:
+                quotes[symbol] = self._format_quote_from_rate(symbol, rates[0], "M1_fallback")
+            else:
+                logger.error(f"{symbol}: nenhum tick válido encontrado")
+        return quotes
+
+    @staticmethod
+    def _quote_columns(quote: Dict) -> Dict[str, np.ndarray]:
+        """Converte uma cotação formatada em colunas de um único tick."""
+        return {
+            field: np.array([quote[field]])
+            for field in ("time_msc", "bid", "ask", "last", "volume")
+        }
+
+    def _record_ticks(self, symbol: str, ticks) -> List[Dict]:
+        """
+        Grava os ticks (array estruturado do MT5 ou dict de colunas) no buffer
+        do símbolo, ignorando os já vistos, e atualiza as barras intraday.
+        Retorna as barras fechadas por este lote.
+        """
+        buffer = self.tick_buffers.get(symbol)
+        if buffer is None:
+            buffer = self.tick_buffers[symbol] = TickRingBuffer(self.TICK_BUFFER_CAPACITY)
+            self.bar_aggregators[symbol] = BarAggregator()
+
+        time_msc = np.asarray(ticks["time_msc"], dtype=np.int64)
+        bid = np.asarray(ticks["bid"], dtype=np.float64)
+        ask = np.asarray(ticks["ask"], dtype=np.float64)
+        last = np.asarray(ticks["last"], dtype=np.float64)
+        volume = np.asarray(ticks["volume"], dtype=np.float64)
+
+        last_seen = buffer.last_time_msc
+        if last_seen is not None:
+            fresh = time_msc > last_seen
+            if not fresh.all():
+                time_msc, bid, ask, last, volume = (
+                    time_msc[fresh], bid[fresh], ask[fresh], last[fresh], volume[fresh]
+                )
+        if not len(time_msc):
+            return []
+
+        buffer.extend(time_msc, bid, ask, last, volume)
+        price = np.where(last > 0, last, bid)
+        closed = self.bar_aggregators[symbol].update_many(time_msc, price, volume)
+
+        if self.tick_store:
+            self.tick_store.put_ticks(symbol, time_msc, bid, ask, last, volume)
+            self.tick_store.put_bars(symbol, closed)
+        return closed
+
+    def get_bars(self, symbol: str, timeframe: str = "1m",
+                 limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Retorna as barras intraday do símbolo a partir da memória, ou None se não houver ticks."""
+        aggregator = self.bar_aggregators.get(symbol.upper())
+        if aggregator is None or timeframe not in TIMEFRAMES:
+            return None
+        return aggregator.get_bars(timeframe, limit)
+
+    def _fetch_new_ticks(self, symbol: str, watermark: Optional[int]):
+        """
+        Retorna os ticks do símbolo posteriores à marca d'água (time_msc). Sem
+        marca usa o tick atual como semente. Roda no executor do MT5: quem
+        avança a marca é o lado green (``_fetch_tick_batches``).
+
+        ``copy_ticks_from`` só aceita segundos: se o segundo da marca já tem
+        ``TICK_BATCH_SIZE`` ticks ou mais, o lote volta cheio e sem nada novo.
+        Nesse caso lê o segundo inteiro com ``copy_ticks_range`` e, esgotado,
+        segue a partir do segundo seguinte.
+        """
+        if watermark is None:
+            self.mt5_call_count += 1
+            tick = mt5.symbol_info_tick(symbol)
+            if not tick or tick.bid <= 0:
+                return []
+            return [tick]
+
+        second = watermark // 1000
+        ticks = self._copy_new_ticks(symbol, watermark, second)
+        if ticks is None:
+            self.mt5_call_count += 1
+            crowded = mt5.copy_ticks_range(symbol, second, second + 1, mt5.COPY_TICKS_ALL)
+            if crowded is not None and len(crowded):
+                ticks = crowded[crowded['time_msc'] > watermark]
+            if ticks is None or not len(ticks):
+                ticks = self._copy_new_ticks(symbol, watermark, second + 1)
+        if ticks is None or len(ticks) == 0:
+            return []
+        return ticks
+
+    def _copy_new_ticks(self, symbol: str, watermark: int, second: int):
+        """
+        Um lote de ``copy_ticks_from`` a partir de ``second``, filtrado aos
+        ticks após a marca. None quando o lote veio cheio sem nenhum tick novo.
+        """
+        self.mt5_call_count += 1
+        ticks = mt5.copy_ticks_from(symbol, second, self.TICK_BATCH_SIZE, mt5.COPY_TICKS_ALL)
+        if ticks is None or len(ticks) == 0:
+            return []
+        fresh = ticks[ticks['time_msc'] > watermark]
+        if not len(fresh) and len(ticks) >= self.TICK_BATCH_SIZE:
+            return None
+        return fresh
+
+    @staticmethod
+    def _as_tick(record):
+        """Converte um registro de copy_ticks_from em objeto com atributos, como symbol_info_tick."""
+        if hasattr(record, 'dtype'):
+            return SimpleNamespace(**{name: record[name] for name in record.dtype.names})
+        return record
+
+    def _fetch_tick_batches(self, symbols):
+        """
+        Lê os lotes de ticks novos no executor do MT5 e, do lado green, avança
+        as marcas d'água, grava os buffers e devolve a cotação do último tick
+        de cada símbolo.
+        """
+        watermarks = {symbol: self.tick_watermarks.get(symbol) for symbol in symbols}
+        batches = self._run_in_mt5_executor(self._mt5_new_ticks, watermarks)
+
+        quotes: Dict[str, Dict] = {}
+        ticks_ingested = 0
+        for symbol, ticks in batches.items():
+            if isinstance(ticks, Exception):
+                logger.error(f"{symbol}: erro ao ler ticks: {ticks}")
+                continue
+            if len(ticks):
+                ticks_ingested += len(ticks)
+                last_tick = self._as_tick(ticks[-1])
+                self.tick_watermarks[symbol] = int(last_tick.time_msc)
+                quote = self._format_realtime_quote(symbol, last_tick)
+                quotes[symbol] = quote
+                self._record_ticks(
+                    symbol, ticks if hasattr(ticks, 'dtype') else self._quote_columns(quote)
+                )
+        return quotes, ticks_ingested
+
+    def _next_pause(self, activity: int) -> float:
+        """Pausa curta enquanto chegam ticks, crescendo até o máximo quando ocioso."""
+        if self.INGESTION_MODE != "ticks":
+            return self.PAUSE_INTERVAL_SECONDS
+
+        if activity:
+            self.current_pause = self.MIN_PAUSE_SECONDS
+        else:
+            self.current_pause = min(self.current_pause * 2, self.MAX_PAUSE_SECONDS)
+        return self.current_pause
+
+    def _compute_delta(self, symbol: str, quote: Dict) -> Optional[Dict]:
+        """
+        Compara a cotação com o último tick emitido e retorna apenas os campos
+        alterados com o próximo número de sequência, ou None se nada mudou.
+        """
+        with self._delta_lock:
+            previous = self.last_emitted.get(symbol)
+            if previous is None:
+                changed = dict(quote)
+            else:
+                changed = {
+                    field: value
+                    for field, value in quote.items()
+                    if previous.get(field) != value
+                }
+                if not changed:
+                    return None
+
+            seq = self.symbol_sequences.get(symbol, 0) + 1
+            self.symbol_sequences[symbol] = seq
+            self.last_emitted[symbol] = dict(quote)
+
+        changed["symbol"] = symbol
+        changed["seq"] = seq
+        return changed
+
+    def get_snapshot(self, symbols) -> List[Dict]:
+        """
+        Retorna a cotação completa mais recente de cada símbolo com a sequência
+        atual, usada no snapshot inicial e nos pedidos de resync.
+
+        Só lê o estado de sequência: um símbolo ainda não emitido vai com a
+        cotação lida na hora e ``seq`` 0, e o primeiro delta do loop (seq 1,
+        completo) chega a todos os assinantes.
+        """
+        snapshot = []
+        for symbol in symbols:
+            symbol = symbol.upper()
+            with self._delta_lock:
+                emitted = self.last_emitted.get(symbol)
+                if emitted is not None:
+                    emitted = {**emitted, "seq": self.symbol_sequences.get(symbol, 0)}
+            if emitted is None:
+                quote = self.get_mt5_quote(symbol) if self.mt5_connected else None
+                if not quote:
+                    continue
+                emitted = {**quote, "seq": 0}
+            snapshot.append(emitted)
+        return snapshot
+
+    def _fan_out(self, deltas: Dict[str, Dict], index: Dict[str, Set[str]]) -> int:
+        """Agrupa os deltas por room e faz um único emit por room."""
+        batches: Dict[str, List[Dict]] = {}
+        for symbol, delta in deltas.items():
+            for room in index.get(symbol, ()):
+                batches.setdefault(room, []).append(delta)
+
+        for room, batch in batches.items():
+            self._emit('price_update', {'quotes': batch}, room)
+        return len(batches)
+
+    def _stream_portfolios(self, prices: Dict[str, float]) -> int:
+        """Aplica os preços alterados aos portfólios acompanhados e emite os deltas."""
+        if not self.portfolio_stream:
+            return 0
+        updates = self.portfolio_stream.apply_prices(prices)
+        for portfolio_id, delta in updates:
+            self._emit('portfolio_update', delta, portfolio_room(portfolio_id))
+        return len(updates)
+
+    def _emit(self, event: str, payload: Dict, room: Optional[str] = None):
+        """Enfileira o emit quando o emissor está ativo; caso contrário emite direto."""
+        if self.emit_queue is not None:
+            self.emit_queue.put((event, payload, room))
+        elif self.socketio:
+            self.socketio.emit(event, payload, room=room)
+
+    def _emit_loop(self):
+        """Drena a fila de emits, desacoplando a entrega das leituras do MT5."""
+        while self.running or not self.emit_queue.empty():
+            try:
+                event, payload, room = self.emit_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.socketio.emit(event, payload, room=room)
+            except Exception as e:
+                logger.error(f"Erro ao emitir '{event}' para {room}: {e}")
+
+    def _read_quotes(self, symbols):
+        """Estágio de leitura do ciclo, conforme o modo de ingestão (só as chamadas mt5.* saem do loop)."""
+        if self.INGESTION_MODE == "ticks":
+            return self._fetch_tick_batches(symbols)
+        quotes = self._fetch_quotes(symbols)
+        return quotes, len(quotes)
+
+    def _run_update_cycle(self) -> int:
+        """
+        Executa um ciclo de atualização: índice reverso, leitura e fan-out.
+        Retorna o número de símbolos que mudaram, usado na pausa adaptativa.
+        """
+        index = self._build_symbol_index()
+        calls_before = self.mt5_call_count
+
+        quotes, ticks_ingested = self._read_quotes(list(index))
+
+        self.ticker_prices.update(quotes)
+        quote_cache.put_many(quotes)
+        if self.INGESTION_MODE == "ticks":
+            # Sem tick novo a última cotação continua válida
+            quote_cache.touch(symbol for symbol in index if symbol not in quotes)
+
+        deltas = {}
+        for symbol, quote in quotes.items():
+            delta = self._compute_delta(symbol, quote)
+            if delta:
+                deltas[symbol] = delta
+        emits = self._fan_out(deltas, index)
+        prices = {symbol: quotes[symbol]["price"] for symbol in deltas}
+        # Reprecifica as valorações em cache com o preço do tick, sem descartá-las
+        reprice_cached_valuations(prices)
+        emits += self._stream_portfolios(prices)
+
+        self.cycle_count += 1
+        self.last_cycle_stats = {
+            "mt5_calls": self.mt5_call_count - calls_before,
+            "distinct_symbols": len(index),
+            "room_subscriptions": sum(len(rooms) for rooms in index.values()),
+            "emits": emits,
+            "changed_symbols": len(deltas),
+            "ticks_ingested": ticks_ingested,
+        }
+        return len(deltas)
+
     def _price_update_loop(self):
         """Loop principal para atualização de preços EM TEMPO REAL."""
         logger.info("Iniciando loop de atualização TEMPO REAL...")
         
         while self.running:
             try:
-                if self.mt5_connected and self.active_subscriptions:
-                    # Atualizar preços dos tickers subscritos
-                    for room, tickers in self.active_subscriptions.items():
-                        for ticker in tickers:
-                            quote = self.get_mt5_quote(ticker)
-                            if quote and self.socketio:
-                                self.socketio.emit('price_update', quote, room=room)
+                activity = 0
+                if self.mt5_connected and (
+                    self.subscriptions or self.cache_watchlist or self.portfolio_stream
+                ):
+                    activity = self._run_update_cycle()
                 
-                time.sleep(self.PAUSE_INTERVAL_SECONDS)  # 2 segundos para tempo real
+                time.sleep(self._next_pause(activity))
                 
             except Exception as e:
                 logger.error(f"Erro no loop de atualização: {e}")
                 time.sleep(self.RETRY_DELAY_SECONDS)
 
+    @property
+    def active_subscriptions(self) -> Dict[str, Set[str]]:
+        """Cópia do mapa room -> tickers (compatibilidade com o dicionário antigo)."""
+        return self.subscriptions.rooms_snapshot()
+
     def subscribe_ticker(self, room: str, ticker: str):
         """Subscreve um ticker e ativa tempo real imediatamente."""
-        if room not in self.active_subscriptions:
-            self.active_subscriptions[room] = set()
-        
         ticker_upper = ticker.upper()
-        self.active_subscriptions[room].add(ticker_upper)
+        self.subscriptions.subscribe(room, ticker_upper)
         
         # Tentar ativar tempo real para este ticker IMEDIATAMENTE
         if ticker_upper in self.mt5_symbols and ticker_upper not in self.realtime_symbols:
@@ -316,33 +870,129 @@ class MetaTrader5RTDWorker:
         logger.info(f"Ticker {ticker} subscrito para room {room}")
 
     def unsubscribe_ticker(self, room: str, ticker: str):
-        """Remove subscrição de um ticker."""
-        if room in self.active_subscriptions:
-            self.active_subscriptions[room].discard(ticker.upper())
-            if not self.active_subscriptions[room]:
-                del self.active_subscriptions[room]
+        """Remove subscrição de um ticker, liberando o market book se era o último assinante."""
+        ticker_upper = ticker.upper()
+        if self.subscriptions.unsubscribe(room, ticker_upper):
+            self._release_symbol(ticker_upper)
         
         logger.info(f"Ticker {ticker} removido do room {room}")
 
+    def subscribe_portfolio(self, room: str, portfolio_id: int, load):
+        """
+        Acompanha um portfólio para a room. ``load`` monta o estado vivo na
+        primeira assinatura. Retorna o LivePortfolio ou None se não existe.
+        """
+        live = self.portfolio_stream.subscribe(room, portfolio_id, load)
+        if live is None:
+            return None
+        self._acquire_symbols(live.held_symbols)
+        logger.info(f"Portfólio {portfolio_id} acompanhado pela room {room}")
+        return live
+
+    def refresh_portfolio(self, portfolio_id: int, load):
+        """
+        Recarrega um portfólio acompanhado após mudança de posições: ativa o
+        tempo real dos símbolos novos e libera os que saíram da carteira.
+        """
+        added, removed = self.portfolio_stream.refresh(portfolio_id, load)
+        self._acquire_symbols(added)
+        for symbol in removed:
+            self._release_symbol(symbol)
+        if added or removed:
+            logger.info(
+                f"Portfólio {portfolio_id} recarregado; símbolos novos: {sorted(added)}, "
+                f"liberados: {sorted(removed)}"
+            )
+
+    def _acquire_symbols(self, symbols):
+        """Ativa o tempo real (market book) dos símbolos ainda não ativos."""
+        for symbol in symbols:
+            if symbol in self.mt5_symbols and symbol not in self.realtime_symbols:
+                self._activate_realtime_for_symbol(symbol)
+
+    def unsubscribe_portfolio(self, room: str, portfolio_id: int):
+        for symbol in self.portfolio_stream.unsubscribe(room, portfolio_id):
+            self._release_symbol(symbol)
+        logger.info(f"Portfólio {portfolio_id} removido da room {room}")
+
+    def unsubscribe_all(self, room: str):
+        """Remove todas as subscrições de uma room (desconexão do cliente)."""
+        released = self.subscriptions.remove_room(room)
+        released.extend(self.portfolio_stream.remove_room(room))
+        for symbol in released:
+            self._release_symbol(symbol)
+        logger.info(f"Room {room} removida; símbolos liberados: {released}")
+
+    def _release_symbol(self, symbol: str):
+        """
+        Libera o market book de um símbolo sem assinantes. Símbolos principais,
+        os ainda observados pelo quote_cache, assinados diretamente ou mantidos
+        por um portfólio acompanhado permanecem ativos.
+        """
+        if symbol in self.main_symbols or symbol in self.cache_watchlist:
+            return
+        if self.subscriptions.refcount(symbol) or symbol in self.portfolio_stream.symbols():
+            return
+        if symbol not in self.realtime_symbols:
+            return
+
+        self.realtime_symbols.discard(symbol)
+        if self.mt5_connected and MT5_AVAILABLE:
+            try:
+                self._run_in_mt5_executor(mt5.market_book_release, symbol)
+            except Exception as e:
+                logger.warning(f"{symbol}: erro ao liberar market book: {e}")
+        logger.info(f"{symbol}: market book liberado (sem assinantes)")
+
+    def _current_pause_seconds(self) -> float:
+        """Pausa aplicada ao fim do ciclo atual conforme o modo de ingestão."""
+        if self.INGESTION_MODE == "ticks":
+            return self.current_pause
+        return self.PAUSE_INTERVAL_SECONDS
+
     def get_subscription_stats(self):
         """Retorna estatísticas das subscrições."""
         try:
-            total_subscriptions = sum(len(tickers) for tickers in self.active_subscriptions.values())
-            
+            registry = self.subscriptions.stats()
+            total_subscriptions = registry["total_subscriptions"]
+            cycle = self.last_cycle_stats
+            fanout_ratio = (
+                cycle["room_subscriptions"] / cycle["distinct_symbols"]
+                if cycle["distinct_symbols"]
+                else 0.0
+            )
+
             return {
                 "status": "active" if self.running else "inactive",
                 "mt5_connected": self.mt5_connected,
-                "total_rooms": len(self.active_subscriptions),
+                "total_rooms": registry["total_rooms"],
                 "total_subscriptions": total_subscriptions,
                 "total_symbols": len(self.mt5_symbols),
                 "realtime_symbols": len(self.realtime_symbols),
                 "failed_symbols": len(self.failed_symbols),
                 "active_rooms": list(self.active_subscriptions.keys()),
+                "subscribed_symbols": registry["distinct_symbols"],
                 "database_connected": self.db_engine is not None,
                 "worker_running": self.running,
                 "last_update": datetime.now().isoformat(),
                 "realtime_active": list(self.realtime_symbols),
-                "realtime_failed": list(self.failed_symbols)
+                "realtime_failed": list(self.failed_symbols),
+                "update_cycles": self.cycle_count,
+                "mt5_calls_per_cycle": cycle["mt5_calls"],
+                "distinct_symbols_per_cycle": cycle["distinct_symbols"],
+                "emits_per_cycle": cycle["emits"],
+                "changed_symbols_per_cycle": cycle["changed_symbols"],
+                "ticks_ingested_per_cycle": cycle["ticks_ingested"],
+                "ingestion_mode": self.INGESTION_MODE,
+                "async_mode": self.async_mode,
+                "pending_emits": self.emit_queue.qsize() if self.emit_queue is not None else 0,
+                "buffered_symbols": len(self.tick_buffers),
+                "cached_quotes": len(quote_cache),
+                "streamed_portfolios": len(self.portfolio_stream),
+                "cache_watchlist": len(self.cache_watchlist),
+                "tick_store": self.tick_store.get_stats() if self.tick_store else None,
+                "current_pause_seconds": self._current_pause_seconds(),
+                "fanout_ratio": round(fanout_ratio, 2),
             }
         except Exception as e:
             logger.error(f"Erro ao obter estatísticas: {e}")
@@ -369,9 +1019,23 @@ class MetaTrader5RTDWorker:
             )
             raise  
 
+        if self.db_engine is not None and self.PERSIST_INTRADAY:
+            self.tick_store = TickStoreWriter(
+                self.db_engine,
+                max_pending_rows=int(os.getenv("RTD_STORE_MAX_PENDING_ROWS", "200000")),
+                batch_rows=int(os.getenv("RTD_STORE_BATCH_ROWS", "5000")),
+                flush_interval=float(os.getenv("RTD_STORE_FLUSH_SECONDS", "1")),
+                persist_ticks=self.PERSIST_TICKS,
+                offload=self._offload,
+            )
+            self.tick_store.start()
+
         self.running = True
-        self.worker_thread = threading.Thread(target=self._price_update_loop, daemon=True)
-        self.worker_thread.start()
+        if self.socketio is not None:
+            self.emit_queue = queue.Queue()
+            self.emit_thread = self._spawn(self._emit_loop)
+        self.worker_thread = self._spawn(self._price_update_loop)
+        logger.info(f"Modo Socket.IO: {self.async_mode}")
         logger.info("MetaTrader5 RTD Worker TEMPO REAL iniciado com sucesso.")
         return True
     
@@ -379,8 +1043,12 @@ class MetaTrader5RTDWorker:
         """Para o worker RTD e desliga a conexão com o MT5."""
         logger.info("Parando MetaTrader5 RTD Worker...")
         self.running = False
-        if self.worker_thread and self.worker_thread.is_alive():
-            self.worker_thread.join(timeout=5)
+        for task in (self.worker_thread, self.emit_thread):
+            self._join_task(task)
+        self.emit_queue = None
+
+        if self.tick_store:
+            self.tick_store.stop()
         
         if self.mt5_connected and MT5_AVAILABLE:
             # Remover market books ativos
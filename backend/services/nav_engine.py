@@ -0,0 +1,199 @@
+# backend/services/nav_engine.py
+# Reconstrução vetorizada da série de NAV (portfolio_daily_values) a partir de daily_quotes
+
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from backend.models import db, DailyQuote, PortfolioDailyMetric, PortfolioDailyValue
+from backend.services.db_upsert import chunked, insert_on_conflict
+from backend.services.portfolio_valuation import load_portfolio_book
+
+logger = logging.getLogger(__name__)
+
+# Janela extra lida antes de ``start`` para propagar o último fechamento (feriados, ativos sem negócio)
+FFILL_LOOKBACK_DAYS = 31
+
+
+def load_close_matrix(symbols: List[str], start: date, end: date) -> pd.DataFrame:
+    """
+    Matriz de fechamentos (datas × símbolos) de ``daily_quotes`` entre start e end,
+    com o último fechamento conhecido propagado. Colunas na ordem de ``symbols``.
+    """
+    if not symbols:
+        return pd.DataFrame(columns=symbols, dtype=np.float64)
+
+    rows = db.session.query(DailyQuote.date, DailyQuote.symbol, DailyQuote.close).filter(
+        DailyQuote.symbol.in_(symbols),
+        DailyQuote.date >= start - timedelta(days=FFILL_LOOKBACK_DAYS),
+        DailyQuote.date <= end,
+    ).all()
+    if not rows:
+        return pd.DataFrame(columns=symbols, dtype=np.float64)
+
+    frame = pd.DataFrame(rows, columns=["date", "symbol", "close"])
+    frame["close"] = frame["close"].astype(np.float64)
+    closes = (
+        frame.pivot(index="date", columns="symbol", values="close")
+        .reindex(columns=symbols)
+        .sort_index()
+        .ffill()
+    )
+    return closes.loc[closes.index >= start]
+
+
+def nav_series(closes: np.ndarray, quantity: np.ndarray, avg_price: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Calcula valor, custo e ganho por data. ``quantity`` pode ser um vetor
+    (posição constante) ou uma matriz datas × símbolos (histórico de posições).
+    """
+    quantity = np.broadcast_to(quantity, closes.shape)
+    total_value = (closes * quantity).sum(axis=1)
+    total_cost = (quantity * avg_price).sum(axis=1)
+    total_gain = total_value - total_cost
+    total_gain_percent = np.divide(
+        total_gain, total_cost, out=np.zeros_like(total_gain), where=total_cost != 0
+    ) * 100
+    return {
+        "total_value": total_value,
+        "total_cost": total_cost,
+        "total_gain": total_gain,
+        "total_gain_percent": total_gain_percent,
+    }
+
+
+def first_recorded_date(portfolio_id: int) -> Optional[date]:
+    """
+    Primeiro dia com registro real do portfólio: métricas diárias ou valor
+    diário não reconstruído. Antes dele não há evidência das posições.
+    """
+    firsts = [
+        db.session.query(func.min(PortfolioDailyMetric.date))
+        .filter(PortfolioDailyMetric.portfolio_id == portfolio_id)
+        .scalar(),
+        db.session.query(func.min(PortfolioDailyValue.date))
+        .filter(
+            PortfolioDailyValue.portfolio_id == portfolio_id,
+            PortfolioDailyValue.is_reconstructed.is_(False),
+        )
+        .scalar(),
+    ]
+    firsts = [day for day in firsts if day is not None]
+    return min(firsts) if firsts else None
+
+
+def rebuild_portfolio_nav(portfolio_id: int, start: date, end: date) -> int:
+    """
+    Reconstrói o NAV diário do portfólio entre start e end e insere, num
+    único INSERT em lote, as datas ainda ausentes em ``portfolio_daily_values``,
+    marcadas com ``is_reconstructed``.
+
+    Sem histórico de posições no banco, as posições atuais são aplicadas a
+    todo o intervalo; por isso o início é limitado ao primeiro registro real
+    do portfólio (``first_recorded_date``) e portfólios sem nenhum registro
+    não são reconstruídos. Datas em que algum ativo ainda não tem fechamento
+    são ignoradas. Retorna o número de dias inseridos.
+    """
+    first = first_recorded_date(portfolio_id)
+    if first is None:
+        logger.warning(f"Portfólio {portfolio_id} sem registro diário real; NAV não reconstruído")
+        return 0
+    start = max(start, first)
+    if start > end:
+        return 0
+
+    book = load_portfolio_book(portfolio_id)
+    if book is None or not len(book):
+        return 0
+
+    closes = load_close_matrix(book.symbols, start, end)
+    complete = closes.notna().all(axis=1).to_numpy()
+    if not complete.any():
+        return 0
+    dates = closes.index[complete]
+    nav = nav_series(closes.to_numpy()[complete], book.quantity, book.avg_price)
+
+    rows = [
+        {
+            "portfolio_id": portfolio_id,
+            "date": day,
+            "total_value": round(value, 2),
+            "total_cost": round(cost, 2),
+            "total_gain": round(gain, 2),
+            "total_gain_percent": round(gain_pct, 4),
+            "is_reconstructed": True,
+        }
+        for day, value, cost, gain, gain_pct in zip(
+            dates,
+            nav["total_value"].tolist(),
+            nav["total_cost"].tolist(),
+            nav["total_gain"].tolist(),
+            nav["total_gain_percent"].tolist(),
+        )
+    ]
+
+    existing = {
+        day for (day,) in db.session.query(PortfolioDailyValue.date).filter(
+            PortfolioDailyValue.portfolio_id == portfolio_id,
+            PortfolioDailyValue.date >= start,
+            PortfolioDailyValue.date <= end,
+        )
+    }
+    missing = [row for row in rows if row["date"] not in existing]
+    for chunk in chunked(missing):
+        db.session.execute(
+            insert_on_conflict(PortfolioDailyValue)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=["portfolio_id", "date"])
+        )
+    db.session.commit()
+    return len(missing)
+
+
+_worker_app = None
+
+
+def _init_pool_worker():
+    """Cada processo do pool mantém sua própria aplicação (e engine) Flask."""
+    global _worker_app
+    from backend import create_app
+    _worker_app = create_app()
+
+
+def _rebuild_in_worker(portfolio_id: int, start: date, end: date) -> int:
+    with _worker_app.app_context():
+        return rebuild_portfolio_nav(portfolio_id, start, end)
+
+
+def rebuild_nav(portfolio_ids: Iterable[int], start: Optional[date] = None,
+                end: Optional[date] = None, workers: int = 1) -> Dict[int, int]:
+    """
+    Reconstrói o NAV de vários portfólios, em paralelo com ``workers`` processos.
+    Por padrão cobre os últimos 365 dias, sempre a partir do primeiro registro
+    real de cada portfólio. Retorna dias inseridos por portfólio.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=365)
+    portfolio_ids = list(portfolio_ids)
+
+    if workers <= 1 or len(portfolio_ids) <= 1:
+        return {pid: rebuild_portfolio_nav(pid, start, end) for pid in portfolio_ids}
+
+    results: Dict[int, int] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker) as pool:
+        futures = {
+            pool.submit(_rebuild_in_worker, pid, start, end): pid for pid in portfolio_ids
+        }
+        for future in as_completed(futures):
+            pid = futures[future]
+            try:
+                results[pid] = future.result()
+            except Exception as e:
+                logger.error(f"Erro ao reconstruir NAV do portfólio {pid}: {e}")
+                results[pid] = 0
+    return results
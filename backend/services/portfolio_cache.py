@@ -0,0 +1,127 @@
+# backend/services/portfolio_cache.py
+# Cache em processo da valoração de portfólios, compartilhado pelos endpoints de portfólio
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class PortfolioSummaryCache:
+    """
+    Guarda por portfólio o último par (book, summary) calculado, chaveado
+    pela versão das posições do portfólio.
+
+    - ``invalidate`` incrementa a versão (posições ou métricas de cota alteradas);
+    - ``notify_prices`` reprecifica no lugar as entradas com símbolos de preço
+      novo (sem ida ao banco), mantendo versão e idade;
+    - ``ttl_seconds`` limita a idade da entrada, já que ``asset_metrics``
+      também é atualizada fora deste processo (bulk scraper).
+    """
+
+    def __init__(self, ttl_seconds: float = 5.0):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[int, Tuple[int, float, object]] = {}
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "repriced": 0}
+
+    def version(self, portfolio_id: int) -> int:
+        with self._lock:
+            return self._versions.get(portfolio_id, 0)
+
+    def get_or_compute(self, portfolio_id: int, compute: Callable[[int], Optional[object]]):
+        """Retorna o valor em cache ou o calcula; resultados None não são guardados."""
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(portfolio_id, 0)
+            entry = self._entries.get(portfolio_id)
+            if entry is not None and entry[0] == version and now - entry[1] <= self.ttl_seconds:
+                self.stats["hits"] += 1
+                return entry[2]
+            self.stats["misses"] += 1
+
+        value = compute(portfolio_id)
+        if value is not None:
+            with self._lock:
+                # Não guarda um cálculo que ficou obsoleto durante a execução
+                if self._versions.get(portfolio_id, 0) == version:
+                    self._entries[portfolio_id] = (version, now, value)
+        return value
+
+    def get_many_or_compute(self, portfolio_ids: Iterable[int],
+                            compute_many: Callable[[List[int]], Dict[int, object]]) -> Dict[int, object]:
+        """
+        Versão em lote de ``get_or_compute``: os ids sem entrada válida são
+        calculados juntos numa única chamada a ``compute_many``. Ids que o
+        cálculo não retorna (inexistentes) ficam fora do resultado.
+        """
+        now = time.monotonic()
+        result: Dict[int, object] = {}
+        missing: Dict[int, int] = {}
+        with self._lock:
+            for portfolio_id in dict.fromkeys(portfolio_ids):
+                version = self._versions.get(portfolio_id, 0)
+                entry = self._entries.get(portfolio_id)
+                if entry is not None and entry[0] == version and now - entry[1] <= self.ttl_seconds:
+                    self.stats["hits"] += 1
+                    result[portfolio_id] = entry[2]
+                else:
+                    self.stats["misses"] += 1
+                    missing[portfolio_id] = version
+
+        if missing:
+            computed = compute_many(list(missing))
+            with self._lock:
+                for portfolio_id, value in computed.items():
+                    if self._versions.get(portfolio_id, 0) == missing[portfolio_id]:
+                        self._entries[portfolio_id] = (missing[portfolio_id], now, value)
+            result.update(computed)
+        return result
+
+    def invalidate(self, portfolio_id: int):
+        with self._lock:
+            self._versions[portfolio_id] = self._versions.get(portfolio_id, 0) + 1
+            self._entries.pop(portfolio_id, None)
+            self.stats["invalidations"] += 1
+
+    def notify_prices(self, prices: Dict[str, float],
+                      reprice: Callable[[List[object], Dict[str, float]], List[object]]):
+        """
+        Reprecifica as entradas que carregam algum dos símbolos com preço novo.
+        ``reprice`` recebe os valores afetados e os preços e devolve os novos
+        valores na mesma ordem. Versão e idade da entrada são mantidas:
+        posições e métricas continuam sob ``invalidate`` e TTL.
+        """
+        symbols = set(prices)
+        if not symbols:
+            return
+        with self._lock:
+            affected = {
+                portfolio_id: entry
+                for portfolio_id, entry in self._entries.items()
+                if symbols.intersection(entry[2][0].symbols)
+            }
+        if not affected:
+            return
+
+        repriced = reprice([entry[2] for entry in affected.values()], prices)
+        with self._lock:
+            for (portfolio_id, entry), value in zip(affected.items(), repriced):
+                # Entrada invalidada ou recalculada durante a reprecificação: mantém a atual
+                if self._entries.get(portfolio_id) is entry:
+                    self._entries[portfolio_id] = (entry[0], entry[1], value)
+                    self.stats["repriced"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+portfolio_summary_cache = PortfolioSummaryCache(
+    float(os.getenv("PORTFOLIO_SUMMARY_TTL_SECONDS", "5"))
+)
@@ -0,0 +1,174 @@
+# backend/services/portfolio_risk.py
+# Métricas de risco do portfólio (volatilidade, beta, tracking error, drawdown e VaR) sobre matrizes de retornos
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from backend.services.nav_engine import load_close_matrix
+from backend.services.portfolio_cache import portfolio_summary_cache
+from backend.services.portfolio_valuation import get_portfolio_valuation
+
+BENCHMARK_SYMBOL = os.getenv("RISK_BENCHMARK_SYMBOL", "IBOV")
+TRADING_DAYS = 252
+CONFIDENCE_LEVELS = (0.95, 0.99)
+# Máximo de resultados memoizados (LRU): start/end/window vêm livres da query string
+CACHE_MAX_ENTRIES = int(os.getenv("RISK_CACHE_MAX_ENTRIES", "256"))
+
+
+def return_matrix(closes: np.ndarray) -> np.ndarray:
+    """Retornos simples diários (datas-1 × ativos); ausências contam como retorno 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = closes[1:] / closes[:-1] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def max_drawdown(returns: np.ndarray) -> float:
+    if not len(returns):
+        return 0.0
+    nav = np.cumprod(1 + returns)
+    peak = np.maximum.accumulate(np.maximum(nav, 1.0))
+    return float((nav / peak - 1).min())
+
+
+def value_at_risk(returns: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """VaR diário histórico e paramétrico (normal), como perda positiva."""
+    mean, std = returns.mean(), returns.std(ddof=1)
+    return {
+        "historical": {
+            str(level): float(-np.percentile(returns, (1 - level) * 100))
+            for level in CONFIDENCE_LEVELS
+        },
+        "parametric": {
+            str(level): float(-(mean + NormalDist().inv_cdf(1 - level) * std))
+            for level in CONFIDENCE_LEVELS
+        },
+    }
+
+
+def compute_risk(returns: np.ndarray, weights: np.ndarray,
+                 benchmark: Optional[np.ndarray], window: int = 21) -> Dict:
+    """
+    Calcula as métricas do portfólio a partir da matriz de retornos dos
+    ativos (datas × ativos), dos pesos atuais e dos retornos do benchmark.
+    """
+    portfolio = returns @ weights
+    annualize = np.sqrt(TRADING_DAYS)
+
+    asset_vol = returns.std(axis=0, ddof=1) * annualize
+    result = {
+        "observations": int(len(portfolio)),
+        "volatility": float(portfolio.std(ddof=1) * annualize),
+        "max_drawdown": max_drawdown(portfolio),
+        "var": value_at_risk(portfolio),
+        "rolling_volatility": (
+            sliding_window_view(portfolio, window).std(axis=1, ddof=1) * annualize
+            if len(portfolio) >= window
+            else np.array([])
+        ),
+        "asset_volatility": asset_vol,
+        "beta": None,
+        "tracking_error": None,
+        "asset_beta": np.full(returns.shape[1], np.nan),
+    }
+
+    if benchmark is not None:
+        bench_dev = benchmark - benchmark.mean()
+        bench_var = bench_dev @ bench_dev / (len(benchmark) - 1)
+        if bench_var > 0:
+            # Covariância de cada ativo com o benchmark numa única multiplicação matricial
+            cov = bench_dev @ (returns - returns.mean(axis=0)) / (len(benchmark) - 1)
+            result["asset_beta"] = cov / bench_var
+            result["beta"] = float(result["asset_beta"] @ weights)
+        result["tracking_error"] = float((portfolio - benchmark).std(ddof=1) * annualize)
+    return result
+
+
+_cache: "OrderedDict[Tuple, Dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_portfolio_risk(portfolio_id: int, start: date, end: date, window: int = 21) -> Optional[Dict]:
+    """
+    Métricas de risco do portfólio no intervalo, com as posições atuais
+    ponderadas pelo último fechamento. Memoizado por portfólio e dia
+    (e versão das posições).
+    """
+    key = (portfolio_id, date.today(), portfolio_summary_cache.version(portfolio_id), start, end, window)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    valuation = get_portfolio_valuation(portfolio_id)
+    if valuation is None:
+        return None
+    book = valuation[0]
+
+    symbols = list(book.symbols)
+    columns = symbols + ([BENCHMARK_SYMBOL] if BENCHMARK_SYMBOL not in symbols else [])
+    closes = load_close_matrix(columns, start, end)
+
+    # Pesos atuais pelo último fechamento do intervalo
+    last_close = closes[symbols].iloc[-1].to_numpy(dtype=np.float64) if len(closes) else np.zeros(len(symbols))
+    value = book.quantity * np.nan_to_num(last_close)
+    weights = value / value.sum() if value.sum() else np.zeros(len(symbols))
+    returns = return_matrix(closes.to_numpy(dtype=np.float64))
+    dates = closes.index[1:]
+
+    benchmark = None
+    bench_prices = closes[BENCHMARK_SYMBOL].to_numpy() if len(closes) else np.array([])
+    if len(returns) and not np.isnan(bench_prices).all():
+        valid = ~np.isnan(bench_prices[1:]) & ~np.isnan(bench_prices[:-1])
+        returns, dates = returns[valid], dates[valid]
+        benchmark = returns[:, columns.index(BENCHMARK_SYMBOL)]
+    returns = returns[:, :len(symbols)]
+
+    if len(returns) < 2:
+        risk = {"observations": int(len(returns)), "benchmark": BENCHMARK_SYMBOL, "holdings": []}
+    else:
+        metrics = compute_risk(returns, weights, benchmark, window)
+        rolling = metrics.pop("rolling_volatility")
+        asset_vol = metrics.pop("asset_volatility")
+        asset_beta = metrics.pop("asset_beta")
+        risk = {
+            **metrics,
+            "benchmark": BENCHMARK_SYMBOL,
+            "rolling_volatility": {
+                "window": window,
+                "dates": [d.isoformat() for d in dates[len(dates) - len(rolling):]],
+                "values": rolling.tolist(),
+            },
+            "holdings": [
+                {
+                    "symbol": symbol,
+                    "weight": w,
+                    "volatility": vol,
+                    "beta": None if np.isnan(beta) else beta,
+                }
+                for symbol, w, vol, beta in zip(
+                    symbols, weights.tolist(), asset_vol.tolist(), asset_beta.tolist()
+                )
+            ],
+        }
+    risk.update({"portfolio_id": portfolio_id, "start": start.isoformat(), "end": end.isoformat()})
+
+    with _cache_lock:
+        # Entradas de dias anteriores não serão mais consultadas
+        for stale in [k for k in _cache if k[1] != key[1]]:
+            del _cache[stale]
+        _cache[key] = risk
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return risk
+
+
+def clear_risk_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,214 @@
+# backend/services/portfolio_stream.py
+# Reavaliação incremental de portfólios assinados via Socket.IO a cada tick de preço
+
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend.services.portfolio_valuation import get_portfolio_valuation, load_cota_metrics
+from backend.services.subscription_registry import SubscriptionRegistry
+
+
+def portfolio_room(portfolio_id: int) -> str:
+    """Room do Socket.IO que recebe as atualizações de um portfólio."""
+    return f"portfolio:{portfolio_id}"
+
+
+class LivePortfolio:
+    """
+    Estado vivo de um portfólio: quantidades, preços e valores por posição
+    em arrays e os totais mantidos incrementalmente. Um tick altera apenas
+    as posições do símbolo e ajusta os totais pela diferença de valor.
+    """
+
+    def __init__(self, book, summary: Dict, metrics: Dict[str, float]):
+        self.id = book.id
+        self.symbols: List[str] = list(book.symbols)
+        self.quantity = book.quantity.copy()
+        self.last_price = book.last_price.copy()
+        # Preço de referência do pregão: o fechamento anterior guardado no book,
+        # que não muda quando os preços ao vivo são sobrepostos
+        self.reference_price = book.previous_close.copy()
+        self.value = self.quantity * self.last_price
+        self.total_value = float(self.value.sum())
+        self.total_cost = float(summary["total_cost"])
+        self.qtd_cotas = metrics.get("qtdCotas", 0.0)
+        self.cota_d1 = metrics.get("cotaD1")
+        self.seq = 0
+
+        positions: Dict[str, List[int]] = {}
+        for i, symbol in enumerate(self.symbols):
+            positions.setdefault(symbol, []).append(i)
+        self._positions = {s: np.array(idx) for s, idx in positions.items()}
+
+    @property
+    def held_symbols(self) -> Set[str]:
+        return set(self._positions)
+
+    def apply_prices(self, prices: Dict[str, float]) -> Optional[Dict]:
+        """
+        Aplica os preços novos e retorna o delta (totais, cota e holdings
+        alterados), ou None se nenhuma posição mudou de preço.
+        """
+        held = [s for s in prices if s in self._positions]
+        if not held:
+            return None
+        idx = np.concatenate([self._positions[s] for s in held])
+        new_price = np.array([prices[self.symbols[i]] for i in idx], dtype=np.float64)
+        changed = new_price != self.last_price[idx]
+        if not changed.any():
+            return None
+        idx, new_price = idx[changed], new_price[changed]
+
+        new_value = self.quantity[idx] * new_price
+        self.total_value += float((new_value - self.value[idx]).sum())
+        self.value[idx] = new_value
+        self.last_price[idx] = new_price
+
+        self.seq += 1
+        return self._payload(idx)
+
+    def snapshot(self) -> Dict:
+        """Estado completo atual, enviado na assinatura e em resyncs."""
+        return self._payload(np.arange(len(self.symbols)))
+
+    def _payload(self, idx: np.ndarray) -> Dict:
+        price = self.last_price[idx]
+        value = self.value[idx]
+        reference = self.reference_price[idx]
+        change_pct = np.divide(
+            price - reference, reference, out=np.zeros(len(idx)), where=reference != 0
+        ) * 100
+        position_pct = value / self.total_value * 100 if self.total_value else np.zeros(len(idx))
+        contribution = change_pct * position_pct / 100
+
+        valor_cota = self.total_value / self.qtd_cotas if self.qtd_cotas else 0.0
+        return {
+            "portfolio_id": self.id,
+            "seq": self.seq,
+            "total_value": self.total_value,
+            "total_gain": self.total_value - self.total_cost,
+            "valor_cota": valor_cota,
+            "variacao_cota_pct": ((valor_cota / self.cota_d1) - 1) * 100 if self.cota_d1 else 0.0,
+            "holdings": [
+                {
+                    "symbol": self.symbols[i],
+                    "last_price": px,
+                    "value": v,
+                    "daily_change_pct": chg,
+                    "position_pct": pct,
+                    "contribution": ctb,
+                }
+                for i, px, v, chg, pct, ctb in zip(
+                    idx.tolist(),
+                    price.tolist(),
+                    value.tolist(),
+                    change_pct.tolist(),
+                    position_pct.tolist(),
+                    contribution.tolist(),
+                )
+            ],
+        }
+
+
+def load_live_portfolio(portfolio_id: int) -> Optional[LivePortfolio]:
+    """Monta o estado vivo a partir da valoração memoizada (requer contexto da aplicação)."""
+    valuation = get_portfolio_valuation(portfolio_id)
+    if valuation is None:
+        return None
+    book, summary = valuation
+    return LivePortfolio(book, summary, load_cota_metrics(portfolio_id))
+
+
+class PortfolioStream:
+    """
+    Portfólios com assinantes ativos. Cada portfólio é carregado uma vez,
+    no primeiro assinante, e descartado quando o último sai.
+    """
+
+    def __init__(self):
+        self.subscriptions = SubscriptionRegistry()
+        self._portfolios: Dict[int, LivePortfolio] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, room: str, portfolio_id: int,
+                  load: Callable[[int], Optional[LivePortfolio]]) -> Optional[LivePortfolio]:
+        """Registra a room; carrega o portfólio se ainda não está em memória."""
+        with self._lock:
+            live = self._portfolios.get(portfolio_id)
+        if live is None:
+            live = load(portfolio_id)
+            if live is None:
+                return None
+        with self._lock:
+            live = self._portfolios.setdefault(portfolio_id, live)
+            self.subscriptions.subscribe(room, portfolio_id)
+        return live
+
+    def refresh(self, portfolio_id: int,
+                load: Callable[[int], Optional[LivePortfolio]]) -> Tuple[Set[str], Set[str]]:
+        """
+        Recarrega um portfólio acompanhado após mudança de posições ou métricas.
+        Retorna ``(adicionados, removidos)``: símbolos que passaram a ser ou
+        deixaram de ser acompanhados pelo conjunto de portfólios.
+        """
+        with self._lock:
+            current = self._portfolios.get(portfolio_id)
+        if current is None:
+            return set(), set()
+        live = load(portfolio_id)
+        with self._lock:
+            before = self._symbols_locked()
+            if live is None:
+                self._portfolios.pop(portfolio_id, None)
+            elif portfolio_id in self._portfolios:
+                # Preserva os preços ao vivo já recebidos para as posições mantidas
+                live.apply_prices(dict(zip(current.symbols, current.last_price.tolist())))
+                live.seq = current.seq + 1
+                self._portfolios[portfolio_id] = live
+            after = self._symbols_locked()
+        return after - before, before - after
+
+    def unsubscribe(self, room: str, portfolio_id: int) -> Set[str]:
+        """Remove a room; retorna os símbolos que deixaram de ser acompanhados."""
+        if not self.subscriptions.unsubscribe(room, portfolio_id):
+            return set()
+        return self._drop([portfolio_id])
+
+    def remove_room(self, room: str) -> Set[str]:
+        return self._drop(self.subscriptions.remove_room(room))
+
+    def _drop(self, portfolio_ids) -> Set[str]:
+        with self._lock:
+            before = self._symbols_locked()
+            for portfolio_id in portfolio_ids:
+                if not self.subscriptions.refcount(portfolio_id):
+                    self._portfolios.pop(portfolio_id, None)
+            return before - self._symbols_locked()
+
+    def _symbols_locked(self) -> Set[str]:
+        return set().union(*(p.held_symbols for p in self._portfolios.values()))
+
+    def symbols(self) -> Set[str]:
+        """Símbolos de todos os portfólios acompanhados (entram no ciclo de leitura do RTD)."""
+        with self._lock:
+            return self._symbols_locked()
+
+    def apply_prices(self, prices: Dict[str, float]) -> List[Tuple[int, Dict]]:
+        """Repassa os preços novos a cada portfólio; retorna (portfolio_id, delta) dos afetados."""
+        if not prices:
+            return []
+        with self._lock:
+            return [
+                (portfolio_id, delta)
+                for portfolio_id, live in self._portfolios.items()
+                for delta in [live.apply_prices(prices)]
+                if delta is not None
+            ]
+
+    def __len__(self) -> int:
+        return len(self._portfolios)
+
+    def __bool__(self) -> bool:
+        return bool(self._portfolios)
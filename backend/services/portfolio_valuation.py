@@ -0,0 +1,416 @@
+# backend/services/portfolio_valuation.py
+# Motor de valoração vetorizada de portfólios (posições e preços em arrays NumPy)
+
+import copy
+from datetime import date
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from backend.models import (
+    db,
+    Portfolio,
+    PortfolioPosition,
+    AssetMetrics,
+    PortfolioDailyMetric,
+    Ticker,
+    Company,
+)
+from backend.services.portfolio_cache import portfolio_summary_cache
+from backend.services.quote_cache import quote_cache
+
+# Métricas diárias usadas no cálculo da cota
+COTA_METRICS = ("qtdCotas", "cotaD1")
+
+
+# Lote padrão da B3 para ações à vista
+DEFAULT_LOT_SIZE = 100
+
+
+class PortfolioBook:
+    """
+    Carteira em formato colunar: uma entrada por posição em cada array,
+    na mesma ordem de ``symbols``. Valores ausentes (sem preço) viram 0.
+
+    Cada linha é (symbol, quantity, avg_price, last_price, daily_change_pct,
+    target_pct, lot_size, target_price, sector, company[, previous_close]).
+    Sem ``previous_close`` o fechamento anterior sai de ``last_price`` e da
+    variação diária, ambos do scraper.
+    """
+
+    def __init__(self, portfolio_id: int, name: str, rows: List[tuple]):
+        self.id = portfolio_id
+        self.name = name
+        self.symbols: List[str] = [r[0] for r in rows]
+        self.sectors: List[Optional[str]] = [r[8] for r in rows]
+        self.companies: List[Optional[str]] = [r[9] for r in rows]
+        columns = np.array([r[1:8] for r in rows], dtype=np.float64).reshape(-1, 7)
+        self.target_price = columns[:, 6]  # NaN quando não definido
+        columns = np.nan_to_num(columns[:, :6])
+        self.quantity = columns[:, 0]
+        self.avg_price = columns[:, 1]
+        self.last_price = columns[:, 2]
+        self.daily_change_pct = columns[:, 3]
+        self.target_pct = columns[:, 4]
+        self.lot_size = np.where(columns[:, 5] > 0, columns[:, 5], DEFAULT_LOT_SIZE)
+        # Fechamento anterior: base da variação diária quando o preço é sobreposto
+        stored = np.array(
+            [r[10] if len(r) > 10 and r[10] else 0.0 for r in rows], dtype=np.float64
+        )
+        change = 1 + self.daily_change_pct / 100
+        derived = np.divide(self.last_price, change, out=np.zeros(len(rows)), where=change != 0)
+        self.previous_close = np.where(stored > 0, stored, derived)
+        # Métricas de cota usadas na valoração em cache (reprecificação sem banco)
+        self.cota_metrics: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def with_prices(self, prices: Dict[str, float]) -> "PortfolioBook":
+        """
+        Cópia do book com ``last_price`` sobreposto pelos preços informados e a
+        variação diária recalculada sobre ``previous_close``.
+        """
+        repriced = copy.copy(self)
+        repriced.last_price = np.array(
+            [prices.get(symbol, price) for symbol, price in zip(self.symbols, self.last_price.tolist())],
+            dtype=np.float64,
+        )
+        repriced.daily_change_pct = np.where(
+            self.previous_close > 0,
+            _safe_div(repriced.last_price - self.previous_close, self.previous_close) * 100,
+            self.daily_change_pct,
+        )
+        return repriced
+
+
+def load_portfolio_books(portfolio_ids: Iterable[int]) -> Dict[int, PortfolioBook]:
+    """
+    Carrega portfólios, posições, preços, setor e empresa numa única consulta
+    com LEFT JOINs e agrupa as linhas por portfólio. Ids inexistentes ficam de fora.
+    """
+    portfolio_ids = list(portfolio_ids)
+    if not portfolio_ids:
+        return {}
+    rows = (
+        db.session.query(
+            Portfolio.id,
+            Portfolio.name,
+            PortfolioPosition.symbol,
+            PortfolioPosition.quantity,
+            PortfolioPosition.avg_price,
+            AssetMetrics.last_price,
+            AssetMetrics.price_change_percent,
+            PortfolioPosition.target_pct,
+            PortfolioPosition.lot_size,
+            PortfolioPosition.target_price,
+            AssetMetrics.sector,
+            Company.company_name,
+            AssetMetrics.previous_close,
+        )
+        .select_from(Portfolio)
+        .outerjoin(PortfolioPosition, PortfolioPosition.portfolio_id == Portfolio.id)
+        .outerjoin(AssetMetrics, AssetMetrics.symbol == PortfolioPosition.symbol)
+        .outerjoin(Ticker, Ticker.symbol == PortfolioPosition.symbol)
+        .outerjoin(Company, Company.id == Ticker.company_id)
+        .filter(Portfolio.id.in_(portfolio_ids))
+        .order_by(Portfolio.id, PortfolioPosition.id)
+        .all()
+    )
+    books = {}
+    for (portfolio_id, name), group in groupby(rows, key=lambda r: (r[0], r[1])):
+        # Portfólio sem posições retorna uma única linha com as colunas da posição nulas
+        positions = [tuple(r[2:]) for r in group if r[2] is not None]
+        books[portfolio_id] = PortfolioBook(portfolio_id, name, positions)
+    return books
+
+
+def load_portfolio_book(portfolio_id: int) -> Optional[PortfolioBook]:
+    """Carrega um único portfólio (ver ``load_portfolio_books``)."""
+    return load_portfolio_books([portfolio_id]).get(portfolio_id)
+
+
+def load_cota_metrics_many(portfolio_ids: Iterable[int],
+                           day: Optional[date] = None) -> Dict[int, Dict[str, float]]:
+    """Lê as métricas de cota (qtdCotas, cotaD1) do dia de vários portfólios numa consulta."""
+    portfolio_ids = list(portfolio_ids)
+    metrics: Dict[int, Dict[str, float]] = {pid: {} for pid in portfolio_ids}
+    if not portfolio_ids:
+        return metrics
+    rows = db.session.query(
+        PortfolioDailyMetric.portfolio_id, PortfolioDailyMetric.metric_id, PortfolioDailyMetric.value
+    ).filter(
+        PortfolioDailyMetric.portfolio_id.in_(portfolio_ids),
+        PortfolioDailyMetric.date == (day or date.today()),
+        PortfolioDailyMetric.metric_id.in_(COTA_METRICS),
+    )
+    for portfolio_id, metric_id, value in rows:
+        metrics[portfolio_id][metric_id] = float(value) if value is not None else 0.0
+    return metrics
+
+
+def load_cota_metrics(portfolio_id: int, day: Optional[date] = None) -> Dict[str, float]:
+    """Lê as métricas de cota (qtdCotas, cotaD1) do dia."""
+    return load_cota_metrics_many([portfolio_id], day)[portfolio_id]
+
+
+def _safe_div(num, den):
+    """Divisão elemento a elemento que devolve 0 onde o denominador é 0."""
+    num = np.asarray(num, dtype=np.float64)
+    den = np.broadcast_to(np.asarray(den, dtype=np.float64), num.shape)
+    return np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+
+def value_books(books: List[PortfolioBook],
+                metrics: Optional[Dict[int, Dict[str, float]]] = None) -> List[Dict]:
+    """
+    Calcula holdings e resumo de vários portfólios numa única passada: as
+    posições de todos os books são concatenadas e os totais por portfólio
+    saem de ``np.bincount`` sobre o índice do book de cada posição.
+    """
+    metrics = metrics or {}
+    sizes = np.array([len(book) for book in books], dtype=np.int64)
+    owner = np.repeat(np.arange(len(books)), sizes)
+
+    def concat(attr):
+        return np.concatenate([getattr(book, attr) for book in books]) if books else np.zeros(0)
+
+    quantity = concat("quantity")
+    avg_price = concat("avg_price")
+    last_price = concat("last_price")
+    daily_change_pct = concat("daily_change_pct")
+    target_pct = concat("target_pct")
+
+    value = quantity * last_price
+    cost = quantity * avg_price
+    gain = value - cost
+    gain_percent = _safe_div(gain, cost) * 100
+
+    n = len(books)
+    total_value = np.bincount(owner, weights=value, minlength=n)
+    total_cost = np.bincount(owner, weights=cost, minlength=n)
+    total_long = np.bincount(owner, weights=np.where(value >= 0, value, 0.0), minlength=n)
+    total_short = np.bincount(owner, weights=np.where(value < 0, value, 0.0), minlength=n)
+
+    position_pct = _safe_div(value, total_value[owner]) * 100
+    difference = target_pct - position_pct
+    contribution = daily_change_pct * position_pct / 100
+    adjustment_qty = _safe_div(difference / 100 * total_value[owner], last_price)
+
+    columns = [
+        c.tolist()
+        for c in (
+            quantity, avg_price, last_price, daily_change_pct, value, cost, gain,
+            gain_percent, contribution, position_pct, target_pct, difference, adjustment_qty,
+        )
+    ]
+    bounds = np.concatenate([[0], np.cumsum(sizes)]).tolist()
+
+    summaries = []
+    for i, book in enumerate(books):
+        lo, hi = bounds[i], bounds[i + 1]
+        holdings = [
+            {
+                "symbol": symbol,
+                "quantity": q,
+                "avg_price": avg,
+                "last_price": px,
+                "daily_change_pct": chg,
+                "position_value": v,
+                "value": v,
+                "cost": c,
+                "gain": g,
+                "gain_percent": gp,
+                "contribution": ctb,
+                "position_pct": pct,
+                "target_pct": tgt,
+                "difference": diff,
+                "adjustment_qty": adj,
+            }
+            for symbol, q, avg, px, chg, v, c, g, gp, ctb, pct, tgt, diff, adj in zip(
+                book.symbols, *(column[lo:hi] for column in columns)
+            )
+        ]
+        summaries.append(
+            _summary(book, holdings, float(total_value[i]), float(total_cost[i]),
+                     float(total_long[i]), float(total_short[i]), metrics.get(book.id, {}))
+        )
+    return summaries
+
+
+def _summary(book: PortfolioBook, holdings: List[Dict], total_value: float, total_cost: float,
+             total_long: float, total_short: float, metrics: Dict[str, float]) -> Dict:
+    total_gain = total_value - total_cost
+    total_gain_percent = (total_gain / total_cost * 100) if total_cost else 0.0
+
+    qtd_cotas = metrics.get("qtdCotas", 0.0)
+    cota_d1 = metrics.get("cotaD1")
+
+    patrimonio_liquido = total_value
+    valor_cota = patrimonio_liquido / qtd_cotas if qtd_cotas else 0.0
+    variacao_cota_pct = ((valor_cota / cota_d1) - 1) * 100 if cota_d1 else 0.0
+
+    posicao_comprada_pct = (
+        (total_long / patrimonio_liquido * 100) if patrimonio_liquido else 0.0
+    )
+    posicao_vendida_pct = (
+        (abs(total_short) / patrimonio_liquido * 100) if patrimonio_liquido else 0.0
+    )
+    exposicao_total_pct = (
+        ((total_long + abs(total_short)) / patrimonio_liquido * 100)
+        if patrimonio_liquido
+        else 0.0
+    )
+
+    return {
+        "id": book.id,
+        "name": book.name,
+        "total_value": total_value,
+        "total_cost": total_cost,
+        "total_gain": total_gain,
+        "total_gain_percent": total_gain_percent,
+        "holdings": holdings,
+        "patrimonio_liquido": patrimonio_liquido,
+        "valor_cota": valor_cota,
+        "variacao_cota_pct": variacao_cota_pct,
+        "posicao_comprada_pct": posicao_comprada_pct,
+        "posicao_vendida_pct": posicao_vendida_pct,
+        "net_long_pct": posicao_comprada_pct - posicao_vendida_pct,
+        "exposicao_total_pct": exposicao_total_pct,
+    }
+
+
+def value_book(book: PortfolioBook, metrics: Optional[Dict[str, float]] = None) -> Dict:
+    """Calcula holdings e resumo do portfólio com operações sobre arrays."""
+    return value_books([book], {book.id: metrics or {}})[0]
+
+
+def live_prices(books: Iterable[PortfolioBook]) -> Dict[str, float]:
+    """Preços recentes do ``quote_cache`` (mantido pelo RTD Worker) para os símbolos dos books."""
+    found, _ = quote_cache.get_many({symbol for book in books for symbol in book.symbols})
+    return {symbol: float(quote["price"]) for symbol, quote in found.items() if quote.get("price")}
+
+
+def _value_cached(books: List[PortfolioBook], prices: Dict[str, float]) -> List[tuple]:
+    """Valora os books com os preços ao vivo sobrepostos, no formato guardado pelo cache."""
+    if prices:
+        books = [book.with_prices(prices) for book in books]
+    summaries = value_books(books, {book.id: book.cota_metrics for book in books})
+    return list(zip(books, summaries))
+
+
+def _compute_valuation(portfolio_id: int):
+    book = load_portfolio_book(portfolio_id)
+    if book is None:
+        return None
+    book.cota_metrics = load_cota_metrics(portfolio_id)
+    return _value_cached([book], live_prices([book]))[0]
+
+
+def _compute_valuations(portfolio_ids: List[int]) -> Dict[int, tuple]:
+    books = load_portfolio_books(portfolio_ids)
+    for portfolio_id, metrics in load_cota_metrics_many(books).items():
+        books[portfolio_id].cota_metrics = metrics
+    ordered = list(books.values())
+    return {book.id: valuation for book, valuation in zip(ordered, _value_cached(ordered, live_prices(ordered)))}
+
+
+def reprice_cached_valuations(prices: Dict[str, float]):
+    """
+    Aplica os preços ao vivo às valorações em cache dos portfólios que têm os
+    símbolos, reavaliando só os arrays já carregados (sem consulta ao banco).
+    """
+    portfolio_summary_cache.notify_prices(
+        prices, lambda valuations, new_prices: _value_cached([book for book, _ in valuations], new_prices)
+    )
+
+
+def get_portfolio_valuation(portfolio_id: int):
+    """Retorna (book, summary) do portfólio a partir do cache compartilhado."""
+    return portfolio_summary_cache.get_or_compute(portfolio_id, _compute_valuation)
+
+
+def get_portfolio_valuations(portfolio_ids: Iterable[int]) -> Dict[int, tuple]:
+    """
+    Retorna {portfolio_id: (book, summary)} de vários portfólios. As entradas
+    ausentes do cache são carregadas e valoradas juntas numa única passada.
+    """
+    return portfolio_summary_cache.get_many_or_compute(portfolio_ids, _compute_valuations)
+
+
+def aggregate_exposure(books: List[PortfolioBook]) -> Dict:
+    """
+    Consolida a exposição de vários portfólios por símbolo e por setor,
+    somando quantidade e valor de mercado das posições de todos os books.
+    Pesos são relativos ao valor total consolidado.
+    """
+    symbols = [s for book in books for s in book.symbols]
+    sectors = {s: sector for book in books for s, sector in zip(book.symbols, book.sectors)}
+    companies = {s: company for book in books for s, company in zip(book.symbols, book.companies)}
+    quantity = np.concatenate([book.quantity for book in books]) if books else np.zeros(0)
+    last_price = np.concatenate([book.last_price for book in books]) if books else np.zeros(0)
+    avg_price = np.concatenate([book.avg_price for book in books]) if books else np.zeros(0)
+    owner = np.repeat(np.arange(len(books)), [len(book) for book in books])
+
+    value = quantity * last_price
+    cost = quantity * avg_price
+    total_value = float(value.sum())
+    total_cost = float(cost.sum())
+    total_long = float(value[value >= 0].sum())
+    total_short = float(value[value < 0].sum())
+
+    unique_symbols, symbol_idx = np.unique(np.array(symbols, dtype=object), return_inverse=True)
+    n_symbols = len(unique_symbols)
+    symbol_qty = np.bincount(symbol_idx, weights=quantity, minlength=n_symbols)
+    symbol_value = np.bincount(symbol_idx, weights=value, minlength=n_symbols)
+    # Número de books distintos com o símbolo
+    pairs = np.unique(np.stack([symbol_idx, owner]), axis=1) if len(symbols) else np.zeros((2, 0), dtype=np.int64)
+    symbol_books = np.bincount(pairs[0], minlength=n_symbols)
+
+    sector_names = [sectors[s] for s in unique_symbols.tolist()]
+    unique_sectors, sector_idx = np.unique(
+        np.array([s or "" for s in sector_names], dtype=object), return_inverse=True
+    )
+    sector_value = np.bincount(sector_idx, weights=symbol_value, minlength=len(unique_sectors))
+    sector_symbols = np.bincount(sector_idx, minlength=len(unique_sectors))
+
+    symbol_pct = _safe_div(symbol_value, total_value) * 100
+    sector_pct = _safe_div(sector_value, total_value) * 100
+    symbol_order = np.argsort(-np.abs(symbol_value), kind="stable")
+    sector_order = np.argsort(-np.abs(sector_value), kind="stable")
+
+    total_gain = total_value - total_cost
+    return {
+        "portfolio_count": len(books),
+        "total_value": total_value,
+        "total_cost": total_cost,
+        "total_gain": total_gain,
+        "total_gain_percent": (total_gain / total_cost * 100) if total_cost else 0.0,
+        "posicao_comprada_pct": (total_long / total_value * 100) if total_value else 0.0,
+        "posicao_vendida_pct": (abs(total_short) / total_value * 100) if total_value else 0.0,
+        "exposicao_total_pct": (
+            ((total_long + abs(total_short)) / total_value * 100) if total_value else 0.0
+        ),
+        "by_symbol": [
+            {
+                "symbol": unique_symbols[i],
+                "company": companies[unique_symbols[i]],
+                "sector": sector_names[i],
+                "quantity": float(symbol_qty[i]),
+                "value": float(symbol_value[i]),
+                "weight_pct": float(symbol_pct[i]),
+                "portfolios": int(symbol_books[i]),
+            }
+            for i in symbol_order.tolist()
+        ],
+        "by_sector": [
+            {
+                "sector": unique_sectors[i] or None,
+                "value": float(sector_value[i]),
+                "weight_pct": float(sector_pct[i]),
+                "symbols": int(sector_symbols[i]),
+            }
+            for i in sector_order.tolist()
+        ],
+    }
@@ -0,0 +1,74 @@
+# backend/services/quote_cache.py
+# Cache de cotações em processo, mantido aquecido pelo loop do RTD Worker
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class QuoteCache:
+    """
+    Guarda a última cotação de cada símbolo com o instante em que foi
+    confirmada pelo worker. As rotas HTTP leem daqui em vez de chamar o MT5,
+    respeitando um limite de idade (staleness) configurável.
+    """
+
+    def __init__(self, max_age_seconds: float = 5.0):
+        self.max_age_seconds = max_age_seconds
+        self._quotes: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, symbol: str, quote: Dict):
+        with self._lock:
+            self._quotes[symbol] = (time.monotonic(), quote)
+
+    def put_many(self, quotes: Dict[str, Dict]):
+        now = time.monotonic()
+        with self._lock:
+            for symbol, quote in quotes.items():
+                self._quotes[symbol] = (now, quote)
+
+    def touch(self, symbols: Iterable[str]):
+        """Renova a idade de cotações confirmadas sem mudança (nenhum tick novo)."""
+        now = time.monotonic()
+        with self._lock:
+            for symbol in symbols:
+                entry = self._quotes.get(symbol)
+                if entry is not None:
+                    self._quotes[symbol] = (now, entry[1])
+
+    def get(self, symbol: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Retorna a cotação com ``age_ms`` ou None se ausente ou mais velha que o limite."""
+        found, _ = self.get_many([symbol], max_age)
+        return found.get(symbol)
+
+    def get_many(self, symbols: Iterable[str],
+                 max_age: Optional[float] = None) -> Tuple[Dict[str, Dict], List[str]]:
+        """
+        Resolve vários símbolos numa única passada sob o lock.
+        Retorna ``(cotações encontradas com age_ms, símbolos ausentes ou vencidos)``.
+        """
+        limit = self.max_age_seconds if max_age is None else max_age
+        now = time.monotonic()
+        found: Dict[str, Dict] = {}
+        missing: List[str] = []
+        with self._lock:
+            for symbol in symbols:
+                entry = self._quotes.get(symbol)
+                age = now - entry[0] if entry is not None else None
+                if age is None or age > limit:
+                    missing.append(symbol)
+                    continue
+                found[symbol] = {**entry[1], "age_ms": round(age * 1000, 1)}
+        return found, missing
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+
+quote_cache = QuoteCache(float(os.getenv("QUOTE_CACHE_MAX_AGE_SECONDS", "5")))
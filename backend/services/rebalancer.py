@@ -0,0 +1,137 @@
+# backend/services/rebalancer.py
+# Rebalanceamento do portfólio para os pesos-alvo, em lotes inteiros e com orçamento de giro
+
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from backend.services.portfolio_valuation import PortfolioBook, get_portfolio_valuation
+
+
+def solve_rebalance(quantity: np.ndarray, price: np.ndarray, target_pct: np.ndarray,
+                    lot_size: np.ndarray, turnover_budget: Optional[float] = None) -> Dict:
+    """
+    Calcula as quantidades inteiras a negociar para aproximar os pesos-alvo.
+
+    As ordens desejadas (alvo - atual) são arredondadas ao lote mais próximo.
+    Posições com alvo zero são zeradas por inteiro, inclusive o fracionário.
+    Com ``turnover_budget`` (fração do patrimônio), as ordens que excedem o
+    orçamento são projetadas proporcionalmente e truncadas em lotes. A sobra é
+    preenchida com um lote a mais nas maiores distâncias residuais.
+    """
+    value = quantity * price
+    nav = float(value.sum())
+    priced = price > 0
+
+    exit_all = (target_pct == 0) & (quantity != 0)
+    desired = np.where(
+        exit_all,
+        -quantity,
+        np.divide(target_pct / 100 * nav - value, price, out=np.zeros_like(price), where=priced),
+    )
+    trade = np.where(exit_all, desired, np.round(desired / lot_size) * lot_size)
+
+    if turnover_budget is not None:
+        limit = turnover_budget * abs(nav)
+        desired_turnover = float(np.abs(desired * price).sum())
+        if float(np.abs(trade * price).sum()) > limit and desired_turnover > 0:
+            scale = min(1.0, limit / desired_turnover)
+            trade = np.trunc(desired * scale / lot_size) * lot_size
+
+            residual = (desired - trade) * price
+            lot_value = lot_size * price
+            spare = limit - float(np.abs(trade * price).sum())
+            order = np.argsort(-np.abs(residual))
+            # Um lote a mais só quando reduz a distância ao alvo
+            candidates = order[priced[order] & (np.abs(residual[order]) >= lot_value[order] / 2)]
+            chosen = candidates[np.cumsum(lot_value[candidates]) <= spare]
+            trade[chosen] += np.sign(residual[chosen]) * lot_size[chosen]
+
+    trade_value = trade * price
+    post_value = value + trade_value
+    post_nav = float(post_value.sum())
+    return {
+        "nav": nav,
+        "trade_qty": trade,
+        "trade_value": trade_value,
+        "post_pct": np.divide(post_value, post_nav, out=np.zeros_like(post_value), where=post_nav != 0) * 100,
+        "turnover": float(np.abs(trade_value).sum()),
+        "net_cash": float(-trade_value.sum()),
+    }
+
+
+# Um plano por portfólio (o do último orçamento pedido), descartado na invalidação
+_cache: Dict[int, Tuple[Optional[float], Tuple[PortfolioBook, Dict, Dict]]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_rebalance(portfolio_id: int,
+                  turnover_budget: Optional[float] = None) -> Optional[Tuple[PortfolioBook, Dict, Dict]]:
+    """
+    Plano de rebalanceamento do portfólio, junto com o book e o resumo da
+    valoração de onde saiu (as ordens seguem a ordem de ``book.symbols``).
+    Reaproveitado enquanto a valoração memoizada não muda (posições, alvos e
+    preços).
+    """
+    valuation = get_portfolio_valuation(portfolio_id)
+    if valuation is None:
+        return None
+    book, summary = valuation
+
+    with _cache_lock:
+        cached = _cache.get(portfolio_id)
+        if cached is not None and cached[0] == turnover_budget and cached[1][1] is summary:
+            return cached[1]
+
+    solution = solve_rebalance(
+        book.quantity, book.last_price, book.target_pct, book.lot_size, turnover_budget
+    )
+    nav = solution["nav"]
+    position_pct = [h["position_pct"] for h in summary["holdings"]]
+    plan = {
+        "portfolio_id": portfolio_id,
+        "nav": nav,
+        "turnover_budget_pct": turnover_budget * 100 if turnover_budget is not None else None,
+        "turnover": solution["turnover"],
+        "turnover_pct": solution["turnover"] / abs(nav) * 100 if nav else 0.0,
+        "net_cash": solution["net_cash"],
+        "trades": [
+            {
+                "symbol": symbol,
+                "lot_size": int(lot),
+                "quantity": q,
+                "last_price": px,
+                "position_pct": pct,
+                "target_pct": tgt,
+                "trade_qty": int(trade),
+                "trade_value": trade_value,
+                "post_pct": post,
+            }
+            for symbol, lot, q, px, pct, tgt, trade, trade_value, post in zip(
+                book.symbols,
+                book.lot_size.tolist(),
+                book.quantity.tolist(),
+                book.last_price.tolist(),
+                position_pct,
+                book.target_pct.tolist(),
+                solution["trade_qty"].tolist(),
+                solution["trade_value"].tolist(),
+                solution["post_pct"].tolist(),
+            )
+        ],
+    }
+
+    entry = (book, summary, plan)
+    with _cache_lock:
+        _cache[portfolio_id] = (turnover_budget, entry)
+    return entry
+
+
+def clear_rebalance_cache(portfolio_id: Optional[int] = None):
+    """Descarta o plano memoizado do portfólio (ou de todos)."""
+    with _cache_lock:
+        if portfolio_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(portfolio_id, None)
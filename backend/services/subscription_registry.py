@@ -0,0 +1,83 @@
+# backend/services/subscription_registry.py
+# Registro de subscrições room <-> símbolo com contagem de referências por símbolo
+
+import threading
+from typing import Dict, List, Set
+
+
+class SubscriptionRegistry:
+    """
+    Mantém os dois índices (room -> símbolos e símbolo -> rooms) sob um único
+    lock, compartilhado pelos handlers do Socket.IO e pelo loop do RTD.
+    A contagem de referências de um símbolo é o número de rooms que o assinam.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms: Dict[str, Set[str]] = {}
+        self._symbols: Dict[str, Set[str]] = {}
+
+    def subscribe(self, room: str, symbol: str) -> bool:
+        """Registra a subscrição; retorna True se a room é o primeiro assinante do símbolo."""
+        with self._lock:
+            self._rooms.setdefault(room, set()).add(symbol)
+            rooms = self._symbols.setdefault(symbol, set())
+            first = not rooms
+            rooms.add(room)
+            return first
+
+    def unsubscribe(self, room: str, symbol: str) -> bool:
+        """Remove a subscrição; retorna True se era o último assinante do símbolo."""
+        with self._lock:
+            symbols = self._rooms.get(room)
+            if not symbols or symbol not in symbols:
+                return False
+            symbols.discard(symbol)
+            if not symbols:
+                del self._rooms[room]
+            return self._drop_room_from_symbol(symbol, room)
+
+    def remove_room(self, room: str) -> List[str]:
+        """Remove todas as subscrições da room; retorna os símbolos que ficaram sem assinantes."""
+        with self._lock:
+            symbols = self._rooms.pop(room, set())
+            return [s for s in symbols if self._drop_room_from_symbol(s, room)]
+
+    def _drop_room_from_symbol(self, symbol: str, room: str) -> bool:
+        rooms = self._symbols.get(symbol)
+        if rooms is None:
+            return False
+        rooms.discard(room)
+        if rooms:
+            return False
+        del self._symbols[symbol]
+        return True
+
+    def refcount(self, symbol: str) -> int:
+        with self._lock:
+            return len(self._symbols.get(symbol, ()))
+
+    def symbols_for_room(self, room: str) -> Set[str]:
+        with self._lock:
+            return set(self._rooms.get(room, ()))
+
+    def symbol_index(self) -> Dict[str, Set[str]]:
+        """Cópia do índice reverso símbolo -> rooms, segura para iterar fora do lock."""
+        with self._lock:
+            return {symbol: set(rooms) for symbol, rooms in self._symbols.items()}
+
+    def rooms_snapshot(self) -> Dict[str, Set[str]]:
+        """Cópia do índice room -> símbolos."""
+        with self._lock:
+            return {room: set(symbols) for room, symbols in self._rooms.items()}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "total_rooms": len(self._rooms),
+                "total_subscriptions": sum(len(s) for s in self._rooms.values()),
+                "distinct_symbols": len(self._symbols),
+            }
+
+    def __bool__(self) -> bool:
+        return bool(self._rooms)
@@ -0,0 +1,162 @@
+# backend/services/tick_buffer.py
+# Buffer circular colunar de ticks por símbolo e agregação incremental de barras OHLCV
+
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Timeframes intraday suportados (em segundos)
+TIMEFRAMES: Dict[str, int] = {"1m": 60, "5m": 300, "15m": 900}
+
+
+class TickRingBuffer:
+    """
+    Buffer circular de capacidade fixa com uma coluna NumPy por campo
+    (time_msc, bid, ask, last, volume). Ao encher, sobrescreve os ticks
+    mais antigos sem realocar memória.
+    """
+
+    def __init__(self, capacity: int = 20000):
+        self.capacity = capacity
+        self.time_msc = np.zeros(capacity, dtype=np.int64)
+        self.bid = np.zeros(capacity, dtype=np.float64)
+        self.ask = np.zeros(capacity, dtype=np.float64)
+        self.last = np.zeros(capacity, dtype=np.float64)
+        self.volume = np.zeros(capacity, dtype=np.float64)
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_time_msc(self) -> Optional[int]:
+        """time_msc do tick mais recente, ou None se o buffer está vazio."""
+        if not self._size:
+            return None
+        return int(self.time_msc[(self._next - 1) % self.capacity])
+
+    def extend(self, time_msc, bid, ask, last, volume):
+        """Acrescenta um lote de ticks (arrays de mesmo tamanho) de forma vetorizada."""
+        time_msc = np.asarray(time_msc, dtype=np.int64)
+        n = len(time_msc)
+        if not n:
+            return
+
+        columns = (
+            (self.time_msc, time_msc),
+            (self.bid, np.asarray(bid, dtype=np.float64)),
+            (self.ask, np.asarray(ask, dtype=np.float64)),
+            (self.last, np.asarray(last, dtype=np.float64)),
+            (self.volume, np.asarray(volume, dtype=np.float64)),
+        )
+        if n > self.capacity:
+            columns = tuple((target, values[-self.capacity:]) for target, values in columns)
+            n = self.capacity
+
+        with self._lock:
+            positions = (self._next + np.arange(n)) % self.capacity
+            for target, values in columns:
+                target[positions] = values
+            self._next = (self._next + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+
+    def append(self, time_msc: int, bid: float, ask: float, last: float, volume: float):
+        """Acrescenta um único tick."""
+        self.extend([time_msc], [bid], [ask], [last], [volume])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Retorna cópias das colunas em ordem cronológica (mais antigo primeiro)."""
+        with self._lock:
+            start = (self._next - self._size) % self.capacity
+            order = (start + np.arange(self._size)) % self.capacity
+            return {
+                "time_msc": self.time_msc[order],
+                "bid": self.bid[order],
+                "ask": self.ask[order],
+                "last": self.last[order],
+                "volume": self.volume[order],
+            }
+
+
+class BarAggregator:
+    """
+    Agrega ticks em barras OHLCV por timeframe de forma incremental: cada tick
+    atualiza apenas a barra corrente, que é fechada ao cruzar o limite do período.
+    """
+
+    def __init__(self, timeframes: Dict[str, int] = TIMEFRAMES, max_bars: int = 1000):
+        self.timeframes = timeframes
+        self._current: Dict[str, Optional[Dict]] = {tf: None for tf in timeframes}
+        self._closed: Dict[str, deque] = {tf: deque(maxlen=max_bars) for tf in timeframes}
+        self._lock = threading.Lock()
+
+    def update(self, time_msc: int, price: float, volume: float) -> List[Dict]:
+        """Aplica um tick e retorna as barras fechadas por ele (podendo ser vazia)."""
+        closed = []
+        seconds = time_msc // 1000
+        with self._lock:
+            for tf, period in self.timeframes.items():
+                bucket = seconds - seconds % period
+                bar = self._current[tf]
+                if bar is not None and bucket < bar["bucket"]:
+                    continue  # tick fora de ordem para uma barra já fechada
+
+                if bar is None or bucket > bar["bucket"]:
+                    if bar is not None:
+                        self._closed[tf].append(bar)
+                        closed.append({"timeframe": tf, **bar})
+                    self._current[tf] = {
+                        "bucket": bucket,
+                        "open": price,
+                        "high": price,
+                        "low": price,
+                        "close": price,
+                        "volume": volume,
+                        "ticks": 1,
+                    }
+                else:
+                    bar["high"] = max(bar["high"], price)
+                    bar["low"] = min(bar["low"], price)
+                    bar["close"] = price
+                    bar["volume"] += volume
+                    bar["ticks"] += 1
+        return closed
+
+    def update_many(self, time_msc, price, volume) -> List[Dict]:
+        """Aplica um lote de ticks em ordem cronológica."""
+        closed = []
+        for t, p, v in zip(np.asarray(time_msc).tolist(), np.asarray(price).tolist(),
+                           np.asarray(volume).tolist()):
+            closed.extend(self.update(t, p, v))
+        return closed
+
+    def get_bars(self, timeframe: str, limit: Optional[int] = None,
+                 include_current: bool = True) -> List[Dict]:
+        """Retorna as barras do timeframe em ordem cronológica, prontas para JSON."""
+        with self._lock:
+            bars = list(self._closed[timeframe])
+            current = self._current[timeframe]
+            if include_current and current is not None:
+                bars.append(dict(current))
+
+        if limit:
+            bars = bars[-limit:]
+        return [self._format_bar(bar) for bar in bars]
+
+    @staticmethod
+    def _format_bar(bar: Dict) -> Dict:
+        return {
+            # UTC, o mesmo instante gravado em intraday_bars.bar_time pelo tick_store
+            "time": datetime.fromtimestamp(bar["bucket"], tz=timezone.utc).isoformat(),
+            "open": bar["open"],
+            "high": bar["high"],
+            "low": bar["low"],
+            "close": bar["close"],
+            "volume": bar["volume"],
+            "ticks": bar["ticks"],
+        }
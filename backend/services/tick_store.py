@@ -0,0 +1,241 @@
+# backend/services/tick_store.py
+# Persistência de ticks e barras intraday em micro-lotes via COPY do PostgreSQL
+
+import io
+import logging
+import queue
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Set
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TICK_COLUMNS = ["symbol", "time", "time_msc", "bid", "ask", "last", "volume"]
+BAR_COLUMNS = ["symbol", "timeframe", "bar_time", "open", "high", "low", "close", "volume", "ticks"]
+
+
+class TickStoreWriter:
+    """
+    Thread de escrita que drena uma fila em memória de lotes de ticks e de
+    barras fechadas e os grava em ``intraday_ticks`` e ``intraday_bars``
+    com ``COPY FROM STDIN``.
+
+    A fila é limitada em linhas pendentes: quando cheia, o lote é descartado
+    e contabilizado em ``dropped_rows`` em vez de bloquear o loop do RTD.
+    """
+
+    def __init__(self, engine, max_pending_rows: int = 200000, batch_rows: int = 5000,
+                 flush_interval: float = 1.0, persist_ticks: bool = True, offload=None):
+        self.engine = engine
+        self.max_pending_rows = max_pending_rows
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.persist_ticks = persist_ticks
+        # Em modo eventlet/gevent o flush (psycopg2, bloqueante) roda no pool de threads do sistema
+        self.offload = offload
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending_rows = 0
+        self._pending_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._conn = None
+        self._partitions: Set[str] = set()
+
+        self.stats: Dict[str, float] = {
+            "enqueued_rows": 0,
+            "dropped_rows": 0,
+            "flushed_ticks": 0,
+            "flushed_bars": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "last_flush_ms": 0.0,
+            "pending_high_water": 0,
+        }
+
+    # --- Produtores (thread do RTD) ---
+    def put_ticks(self, symbol: str, time_msc, bid, ask, last, volume):
+        """Enfileira um lote de ticks (arrays de mesmo tamanho) de um símbolo."""
+        if not self.persist_ticks or not len(time_msc):
+            return
+        frame = pd.DataFrame({
+            "symbol": symbol,
+            "time": pd.to_datetime(time_msc, unit="ms"),
+            "time_msc": time_msc,
+            "bid": bid,
+            "ask": ask,
+            "last": last,
+            "volume": volume,
+        }, columns=TICK_COLUMNS)
+        self._enqueue("ticks", frame)
+
+    def put_bars(self, symbol: str, bars: List[Dict]):
+        """Enfileira as barras fechadas de um símbolo."""
+        if not bars:
+            return
+        frame = pd.DataFrame([{
+            "symbol": symbol,
+            "timeframe": bar["timeframe"],
+            "bar_time": pd.to_datetime(bar["bucket"], unit="s"),
+            "open": bar["open"],
+            "high": bar["high"],
+            "low": bar["low"],
+            "close": bar["close"],
+            "volume": bar["volume"],
+            "ticks": bar["ticks"],
+        } for bar in bars], columns=BAR_COLUMNS)
+        self._enqueue("bars", frame)
+
+    def _enqueue(self, kind: str, frame: pd.DataFrame):
+        rows = len(frame)
+        with self._pending_lock:
+            if self._pending_rows + rows > self.max_pending_rows:
+                self.stats["dropped_rows"] += rows
+                return
+            self._pending_rows += rows
+            self.stats["enqueued_rows"] += rows
+            self.stats["pending_high_water"] = max(
+                self.stats["pending_high_water"], self._pending_rows
+            )
+        self._queue.put((kind, frame))
+
+    # --- Consumidor (thread de escrita) ---
+    def _drain(self):
+        """Coleta itens da fila até atingir o lote ou o intervalo de flush."""
+        ticks, bars = [], []
+        rows = 0
+        deadline = time.monotonic() + self.flush_interval
+        while rows < self.batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                kind, frame = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            (ticks if kind == "ticks" else bars).append(frame)
+            rows += len(frame)
+        return ticks, bars, rows
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            ticks, bars, rows = self._drain()
+            if not rows:
+                continue
+            try:
+                if self.offload is not None:
+                    self.offload(self.flush, ticks, bars)
+                else:
+                    self.flush(ticks, bars)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Erro ao gravar lote intraday ({rows} linhas): {e}")
+                self._reset_connection()
+            finally:
+                with self._pending_lock:
+                    self._pending_rows -= rows
+
+    def flush(self, ticks: List[pd.DataFrame], bars: List[pd.DataFrame]):
+        """Grava um micro-lote: ticks via COPY direto, barras via staging + upsert."""
+        started = time.perf_counter()
+        conn = self._get_connection()
+        with conn.cursor() as cur:
+            if ticks:
+                frame = pd.concat(ticks, ignore_index=True)
+                self._ensure_partitions(cur, "intraday_ticks", frame["time"])
+                self._copy(cur, "intraday_ticks", TICK_COLUMNS, frame)
+                self.stats["flushed_ticks"] += len(frame)
+
+            if bars:
+                frame = pd.concat(bars, ignore_index=True)
+                self._ensure_partitions(cur, "intraday_bars", frame["bar_time"])
+                self._copy(cur, "intraday_bars_staging", BAR_COLUMNS, frame)
+                cur.execute("""
+                    INSERT INTO intraday_bars (symbol, timeframe, bar_time, open, high, low, close, volume, ticks)
+                    SELECT symbol, timeframe, bar_time, open, high, low, close, volume, ticks
+                    FROM intraday_bars_staging
+                    ON CONFLICT (symbol, timeframe, bar_time) DO UPDATE
+                    SET open = EXCLUDED.open,
+                        high = EXCLUDED.high,
+                        low = EXCLUDED.low,
+                        close = EXCLUDED.close,
+                        volume = EXCLUDED.volume,
+                        ticks = EXCLUDED.ticks;
+                """)
+                self.stats["flushed_bars"] += len(frame)
+        conn.commit()
+
+        self.stats["flushes"] += 1
+        self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    @staticmethod
+    def _copy(cur, table: str, columns: List[str], frame: pd.DataFrame):
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+    def _ensure_partitions(self, cur, table: str, times: pd.Series):
+        """Cria sob demanda as partições mensais que recebem o lote."""
+        for month in times.dt.to_period("M").unique():
+            name = f"{table}_{month.year}_{month.month:02d}"
+            if name in self._partitions:
+                continue
+            start = date(month.year, month.month, 1)
+            end = (month + 1).start_time.date()
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+            self._partitions.add(name)
+
+    def _get_connection(self):
+        """Conexão dedicada da thread, com a tabela de staging criada uma única vez."""
+        if self._conn is None:
+            self._conn = self.engine.raw_connection()
+            with self._conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS intraday_bars_staging
+                    (LIKE intraday_bars INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+                """)
+            self._conn.commit()
+        return self._conn
+
+    def _reset_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._partitions.clear()
+
+    # --- Ciclo de vida ---
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info("Writer intraday (COPY) iniciado.")
+
+    def stop(self, timeout: float = 10):
+        """Para a thread após drenar a fila pendente."""
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._reset_connection()
+        logger.info("Writer intraday (COPY) parado.")
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "pending_rows": self._pending_rows,
+            "max_pending_rows": self.max_pending_rows,
+            "running": self._running,
+        }
@@ -1,6 +1,19 @@
+import os
+import tempfile
+
 import pytest
 from backend import create_app, db
 from backend.config import Config
+from backend.services.portfolio_cache import portfolio_summary_cache
+from backend.services.portfolio_risk import clear_risk_cache
+from backend.services.quote_cache import quote_cache
+from backend.services.rebalancer import clear_rebalance_cache
+
+
+# create_app configura o log: nos testes, fora do repositório
+os.environ.setdefault(
+    "LOG_FILE", os.path.join(tempfile.gettempdir(), "backend-tests.log")
+)
 
 
 @pytest.fixture
@@ -8,6 +21,10 @@ def client():
     Config.SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     app = create_app()
     app.config["TESTING"] = True
+    portfolio_summary_cache.clear()
+    quote_cache.clear()
+    clear_risk_cache()
+    clear_rebalance_cache()
     with app.test_client() as client:
         with app.app_context():
             db.create_all()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark da etapa de transformação do backfill (sem banco).
+
+Compara a transformação antiga (apply linha a linha para ESCALA_MOEDA e
+is_fixed) com a vetorizada de ``transform_dataframe`` sobre um arquivo real
+da CVM e confere que os resultados são iguais.
+
+Uso:
+    python bench_transform.py --year 2023 --doc-type DFP
+    python bench_transform.py --zip itr_cia_aberta_2023.zip --repeat 3
+"""
+import argparse
+import time
+import zipfile
+
+import pandas as pd
+
+from financials_backfill import (
+    COLUMN_MAPPING,
+    CSV_DTYPES,
+    DOC_SOURCES,
+    STATEMENT_PATTERN,
+    fetch_zip_cached,
+    transform_dataframe,
+)
+from models import CvmDocument
+
+
+def legacy_transform(df, doc_type, report_version, cnpj_to_id_map):
+    """Transformação anterior, mantida aqui apenas como referência de desempenho."""
+    df.rename(columns=COLUMN_MAPPING, inplace=True)
+    df['company_cnpj'] = df['company_cnpj'].str.replace(r'[./-]', '', regex=True)
+    df['company_id'] = df['company_cnpj'].map(cnpj_to_id_map)
+    df.dropna(subset=['company_id'], inplace=True)
+    df['company_id'] = df['company_id'].astype(int)
+    df['reference_date'] = pd.to_datetime(df['reference_date'])
+    df['account_value'] = pd.to_numeric(df['account_value'], errors='coerce')
+    df.dropna(subset=['reference_date', 'account_value'], inplace=True)
+
+    def adjust_for_scale(row):
+        scale = row.get('currency_scale', 'UNIDADE')
+        value = row['account_value']
+        if isinstance(scale, str):
+            if scale.upper() == 'MIL':
+                return value * 1000
+            elif scale.upper() == 'MILHÃO':
+                return value * 1000000
+        return value
+
+    df['account_value'] = df.apply(adjust_for_scale, axis=1)
+    df['is_fixed'] = df['account_code'].apply(lambda x: len(str(x).split('.')) <= 2)
+    df['report_type'] = doc_type
+    df['report_version'] = report_version
+    model_columns = [c.name for c in CvmDocument.__table__.columns if c.name != 'id']
+    return df[df.columns.intersection(model_columns)]
+
+
+def timed(func, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zip", help="Zip DFP/ITR local. Sem ele, baixa (ou usa o cache) de --year/--doc-type.")
+    parser.add_argument("--year", type=int, default=2023)
+    parser.add_argument("--doc-type", default="DFP", choices=sorted(DOC_SOURCES))
+    parser.add_argument("--repeat", type=int, default=1, help="Execuções por variante (vale a melhor).")
+    args = parser.parse_args()
+
+    zip_path = args.zip
+    if not zip_path:
+        url = f"{DOC_SOURCES[args.doc_type]}{args.doc_type.lower()}_cia_aberta_{args.year}.zip"
+        zip_path, _ = fetch_zip_cached(url)
+
+    totals = {"read_legacy": 0.0, "read_new": 0.0, "legacy": 0.0, "vectorized": 0.0, "rows": 0}
+    print(f"{'arquivo':<45} {'linhas':>10} {'legado (s)':>11} {'vetor. (s)':>11} {'ganho':>7}")
+    with zipfile.ZipFile(zip_path) as z:
+        for filename in z.namelist():
+            match = STATEMENT_PATTERN.search(filename)
+            if not match:
+                continue
+            report_version = f"{match.group(1).upper()}_{match.group(2).upper()}"
+
+            read_legacy, raw_legacy = timed(lambda: pd.read_csv(
+                z.open(filename), sep=';', encoding='latin1', dtype={'CNPJ_CIA': str, 'CD_CONTA': str}
+            ), args.repeat)
+            read_new, raw_new = timed(lambda: pd.read_csv(
+                z.open(filename), sep=';', encoding='latin1', dtype=CSV_DTYPES
+            ), args.repeat)
+
+            # Todas as empresas do arquivo como monitoradas: pior caso, nenhuma linha descartada
+            cnpjs = raw_legacy['CNPJ_CIA'].str.replace(r'[./-]', '', regex=True).unique()
+            cnpj_to_id_map = {cnpj: i for i, cnpj in enumerate(cnpjs, start=1)}
+
+            legacy_time, legacy = timed(
+                lambda: legacy_transform(raw_legacy.copy(), args.doc_type, report_version, cnpj_to_id_map),
+                args.repeat,
+            )
+            new_time, new = timed(
+                lambda: transform_dataframe(raw_new, args.doc_type, report_version, cnpj_to_id_map),
+                args.repeat,
+            )
+
+            pd.testing.assert_frame_equal(
+                legacy.reset_index(drop=True).astype(str),
+                new[legacy.columns].reset_index(drop=True).astype(str),
+            )
+            totals["read_legacy"] += read_legacy
+            totals["read_new"] += read_new
+            totals["legacy"] += legacy_time
+            totals["vectorized"] += new_time
+            totals["rows"] += len(raw_legacy)
+            print(f"{filename:<45} {len(raw_legacy):>10} {legacy_time:>11.3f} {new_time:>11.3f} "
+                  f"{legacy_time / new_time:>6.1f}x")
+
+    print(f"\nTotal de linhas: {totals['rows']}")
+    print(f"Leitura CSV:    {totals['read_legacy']:.3f}s -> {totals['read_new']:.3f}s (dtypes category)")
+    print(f"Transformação:  {totals['legacy']:.3f}s -> {totals['vectorized']:.3f}s "
+          f"({totals['legacy'] / max(totals['vectorized'], 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
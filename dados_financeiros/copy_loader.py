@@ -0,0 +1,177 @@
+# copy_loader.py - Carga em massa em cvm_financial_data via COPY FROM STDIN (PostgreSQL)
+
+import io
+import sys
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from financials_upsert import NATURAL_KEY, TARGET_TABLE, UPSERT_CONFLICT, version_sql
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGE_TABLE = 'cvm_financial_data_stage'
+# Colunas carregadas, na ordem do CSV enviado ao COPY
+LOAD_COLUMNS = [
+    'company_id', 'reference_date', 'report_type', 'report_version', 'cvm_version',
+    'account_code', 'account_name', 'account_value', 'currency', 'is_fixed',
+]
+# Só no staging: início do período (DT_INI_EXERC), que desempata trimestre e acumulado no merge
+STAGE_COLUMNS = LOAD_COLUMNS + ['period_start']
+# Linhas convertidas para CSV por vez enquanto o COPY consome o stream
+COPY_CHUNK_ROWS = 50000
+
+# Tabela temporária por conexão; tipos largos (text/numeric) e os casts ficam no merge
+STAGE_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (
+    company_id integer,
+    reference_date date,
+    report_type text,
+    report_version text,
+    cvm_version text,
+    account_code text,
+    account_name text,
+    account_value numeric,
+    currency text,
+    is_fixed boolean,
+    period_start date
+) ON COMMIT DELETE ROWS
+"""
+
+
+class DataFrameCsvStream:
+    """
+    Objeto tipo arquivo que entrega o DataFrame como CSV sob demanda, um
+    bloco de ``chunk_rows`` linhas por vez, sem montar o CSV inteiro em memória.
+    """
+
+    def __init__(self, df, columns=LOAD_COLUMNS, chunk_rows=COPY_CHUNK_ROWS):
+        self._chunks = (
+            df.iloc[start:start + chunk_rows].to_csv(
+                header=False, index=False, columns=columns, date_format='%Y-%m-%d'
+            )
+            for start in range(0, len(df), chunk_rows)
+        )
+        self._current = io.StringIO()
+
+    def read(self, size=-1):
+        data = self._current.read(size)
+        while not data:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return ''
+            self._current = io.StringIO(chunk)
+            data = self._current.read(size)
+        return data
+
+
+def reset_stage(cursor):
+    """Cria a tabela de staging da conexão, se preciso, e a esvazia."""
+    cursor.execute(STAGE_DDL)
+    cursor.execute(f"TRUNCATE {STAGE_TABLE}")
+
+
+def copy_into_stage(cursor, df):
+    """
+    Acrescenta o DataFrame à tabela de staging com COPY ... FROM STDIN (CSV).
+    ``period_start`` é opcional; sem ela a coluna fica nula.
+    """
+    columns = [c for c in STAGE_COLUMNS if c in df.columns]
+    cursor.copy_expert(
+        f"COPY {STAGE_TABLE} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        DataFrameCsvStream(df, columns),
+    )
+
+
+def merge_stage(cursor):
+    """
+    Aplica o staging na tabela final com upsert na chave natural: de cada
+    conta entra só a maior versão e, empatada, o menor início de período (no
+    DRE do ITR, o acumulado no ano em vez do trimestre). Linhas existentes só
+    são reescritas quando a versão é mais nova ou os valores mudaram. Retorna
+    as linhas inseridas ou atualizadas.
+    """
+    columns = ', '.join(LOAD_COLUMNS)
+    key = ', '.join(NATURAL_KEY)
+    cursor.execute(
+        f"INSERT INTO {TARGET_TABLE} ({columns}) "
+        f"SELECT DISTINCT ON ({key}) {columns} FROM {STAGE_TABLE} "
+        f"ORDER BY {key}, {version_sql('cvm_version')} DESC, period_start ASC NULLS LAST "
+        f"{UPSERT_CONFLICT}"
+    )
+    return cursor.rowcount
+
+
+@contextmanager
+def stage_cursor(session):
+    """
+    Cursor da conexão da sessão com o staging vazio. Os DataFrames copiados
+    com ``copy_into_stage`` se acumulam até o ``merge_stage``, que escolhe a
+    linha de cada chave entre todos eles; tudo na transação corrente (sem
+    commit).
+    """
+    cursor = session.connection().connection.cursor()
+    try:
+        reset_stage(cursor)
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def load_dataframe(session, df):
+    """
+    Carrega o DataFrame transformado via staging + merge na transação
+    corrente da sessão (sem commit). Retorna o número de linhas inseridas ou
+    atualizadas.
+    """
+    if df.empty:
+        return 0
+    with stage_cursor(session) as cursor:
+        copy_into_stage(cursor, df)
+        return merge_stage(cursor)
+
+
+def secondary_indexes(connection, table=TARGET_TABLE):
+    """Retorna [(nome, definição)] dos índices que não são PK nem únicos."""
+    rows = connection.execute(text("""
+        SELECT x.indexrelid::regclass::text, pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        WHERE x.indrelid = CAST(:table AS regclass)
+          AND NOT x.indisprimary
+          AND NOT x.indisunique
+    """), {"table": table})
+    return [(name, definition) for name, definition in rows]
+
+
+@contextmanager
+def without_secondary_indexes(engine, table=TARGET_TABLE):
+    """
+    Remove os índices secundários durante uma carga completa e os recria ao
+    final, mesmo em caso de erro. Índices únicos e a PK são mantidos.
+    """
+    with engine.begin() as connection:
+        indexes = secondary_indexes(connection, table)
+        for name, _ in indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    if indexes:
+        print(f"Índices secundários removidos para a carga: {', '.join(name for name, _ in indexes)}")
+    try:
+        yield indexes
+    finally:
+        if indexes:
+            print("Recriando índices secundários...")
+            with engine.begin() as connection:
+                for _, definition in indexes:
+                    connection.execute(text(definition))
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo em MB (None onde não disponível)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
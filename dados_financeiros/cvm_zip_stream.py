@@ -0,0 +1,167 @@
+# cvm_zip_stream.py - Download em cache e leitura em blocos dos CSVs dentro dos zips de dados abertos da CVM
+# Compartilhado por financials_backfill (DFP/ITR) e documentos_cvm/scraper (IPE)
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import zipfile
+from queue import Queue, Full
+
+import requests
+import pandas as pd
+
+# Cache local dos zips da CVM, endereçado pelo sha256 do conteúdo
+CACHE_DIR = os.environ.get(
+    "CVM_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cvm_cache")
+)
+DEFAULT_CHUNK_ROWS = 100000
+# Blocos já lidos à frente do consumidor em ``prefetch``
+PREFETCH_DEPTH = 2
+
+
+def fetch_zip_cached(url, cache_dir=CACHE_DIR):
+    """
+    Baixa o zip para o cache local e retorna (caminho, sha256).
+
+    Os arquivos são gravados como <sha256>.zip e os metadados de cada URL
+    (ETag, Last-Modified, sha256) ficam num JSON próprio. Com o arquivo em
+    cache a requisição é condicional: um 304 reaproveita o zip local, e uma
+    falha de conexão também, com aviso.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json")
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    cached_path = os.path.join(cache_dir, f"{meta['sha256']}.zip") if meta.get('sha256') else None
+    if cached_path and not os.path.exists(cached_path):
+        cached_path, meta = None, {}
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = requests.get(url, headers=headers, stream=True, timeout=120)
+        if response.status_code == 304 and cached_path:
+            return cached_path, meta['sha256']
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        status = e.response.status_code if getattr(e, 'response', None) is not None else None
+        if cached_path and status != 404:
+            print(f"AVISO: Falha ao revalidar {url} ({e}). Usando cópia em cache.")
+            return cached_path, meta['sha256']
+        raise
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        zip_path = os.path.join(cache_dir, f"{sha256}.zip")
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": sha256,
+    }
+    tmp_meta = meta_path + ".part"
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+    return zip_path, sha256
+
+
+def zip_members(zip_path, extensions=('.csv',)):
+    """Nomes dos membros do zip com as extensões informadas (sem diferenciar maiúsculas)."""
+    with zipfile.ZipFile(zip_path) as z:
+        return [name for name in z.namelist() if name.lower().endswith(extensions)]
+
+
+def iter_csv_chunks(zip_path, member, dtype=None, chunksize=DEFAULT_CHUNK_ROWS,
+                    sep=';', encoding='latin1', **read_csv_kwargs):
+    """
+    Lê um CSV de dentro do zip em DataFrames de até ``chunksize`` linhas.
+
+    O membro é descomprimido incrementalmente a partir do arquivo em disco
+    e o parser consome apenas o necessário para cada bloco, de modo que a
+    memória não depende do tamanho do arquivo. ``dtype`` deve ser explícito
+    para que todos os blocos tenham os mesmos tipos.
+    """
+    with zipfile.ZipFile(zip_path) as z, z.open(member) as f:
+        reader = pd.read_csv(
+            f, sep=sep, encoding=encoding, dtype=dtype, chunksize=chunksize, **read_csv_kwargs
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk
+
+
+class _Raised:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=PREFETCH_DEPTH):
+    """
+    Consome ``iterable`` numa thread, mantendo até ``depth`` itens prontos
+    enquanto o chamador processa o atual (leitura e descompressão se
+    sobrepõem à transformação e à carga). Exceções do produtor são
+    repassadas ao consumidor.
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Raised(e))
+        finally:
+            # Fecha o gerador (e o zip) na própria thread que o executa
+            close = getattr(iterable, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, name="cvm-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
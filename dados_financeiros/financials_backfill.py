@@ -1,24 +1,35 @@
 import os
 import re
-import zipfile
+import argparse
 import requests
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import datetime
 
-from models import Base, CvmDocument, Company
+from models import Base, CvmDocument, Company, BackfillCheckpoint
+from copy_loader import copy_into_stage, merge_stage, peak_rss_mb, stage_cursor, without_secondary_indexes
+from cvm_zip_stream import fetch_zip_cached, iter_csv_chunks, prefetch, zip_members
+from financials_upsert import ensure_natural_key
 
 load_dotenv()
 
 # --- Configurações ---
 BASE_URL_DFP = "https://dados.cvm.gov.br/dados/CIA_ABERTA/DOC/DFP/DADOS/"
 BASE_URL_ITR = "https://dados.cvm.gov.br/dados/CIA_ABERTA/DOC/ITR/DADOS/"
+DOC_SOURCES = {"DFP": BASE_URL_DFP, "ITR": BASE_URL_ITR}
 START_YEAR = 2010
 END_YEAR = datetime.date.today().year
-BATCH_SIZE = 50000
+DEFAULT_WORKERS = 4
+# Linhas por bloco lido do CSV; a memória fica limitada a poucos blocos por processo
+CSV_CHUNK_ROWS = 200000
+STATEMENT_PATTERN = re.compile(r'_(BPA|BPP|DRE)_(con|ind)_', re.IGNORECASE)
+
 
 def get_db_engine():
     user = os.environ.get("DB_USER")
@@ -30,90 +41,240 @@ def get_db_engine():
     db_url = f"postgresql://{user}:{password}@{host}/{dbname}"
     return create_engine(db_url, pool_pre_ping=True)
 
-def process_and_load_dataframe(session, df, doc_type, report_version, cnpj_to_id_map):
+
+COLUMN_MAPPING = {
+    'CNPJ_CIA': 'company_cnpj', 'DT_REFER': 'reference_date', 'VERSAO': 'cvm_version',
+    'CD_CONTA': 'account_code', 'DS_CONTA': 'account_name', 'VL_CONTA': 'account_value',
+    'MOEDA': 'currency', 'ESCALA_MOEDA': 'currency_scale', 'DT_INI_EXERC': 'period_start'
+}
+# Multiplicador por ESCALA_MOEDA; escalas ausentes ou desconhecidas mantêm o valor
+SCALE_MULTIPLIERS = {'UNIDADE': 1, 'MIL': 1000, 'MILHÃO': 1000000}
+# Colunas de texto muito repetidas: lidas como category, o texto é guardado uma vez por valor distinto
+CSV_DTYPES = {
+    'CNPJ_CIA': 'category', 'CD_CONTA': 'category', 'DS_CONTA': 'category',
+    'MOEDA': 'category', 'ESCALA_MOEDA': 'category', 'ORDEM_EXERC': 'category',
+}
+# Chave natural no CSV de uma demonstração (tipo e demonstração são fixos por arquivo)
+CSV_KEY = ['CNPJ_CIA', 'DT_REFER', 'CD_CONTA']
+
+
+def _by_category(series, compute, missing):
+    """
+    Calcula ``compute`` uma vez por categoria distinta e expande para as
+    linhas pelos códigos da categoria. Linhas nulas recebem ``missing``.
+    """
+    series = series.astype('category')
+    table = np.append(np.asarray(compute(series.cat.categories.astype(str)), dtype=np.float64), missing)
+    return table[series.cat.codes.to_numpy()]
+
+
+def select_current_rows(df):
+    """
+    Mantém uma linha por chave natural do CSV: só o exercício corrente
+    (ORDEM_EXERC 'ÚLTIMO'; o 'PENÚLTIMO' repete a data de referência com os
+    valores do ano anterior) e a maior VERSAO. No DRE do ITR, que traz o
+    trimestre e o acumulado no ano, fica o acumulado (menor DT_INI_EXERC).
+    Só reduz o bloco lido: entre blocos do mesmo arquivo quem decide é o
+    ``merge_stage``.
+    """
+    if 'ORDEM_EXERC' in df.columns:
+        df = df[df['ORDEM_EXERC'] == 'ÚLTIMO']
+    order = ['VERSAO'] + (['DT_INI_EXERC'] if 'DT_INI_EXERC' in df.columns else [])
+    df = df.sort_values(order, ascending=[True] + [False] * (len(order) - 1), kind='stable')
+    return df.drop_duplicates(CSV_KEY, keep='last').sort_index()
+
+
+def transform_dataframe(df, doc_type, report_version, cnpj_to_id_map):
+    """
+    Converte o CSV da CVM para as colunas de ``cvm_financial_data`` usando
+    apenas operações por coluna (sem ``apply`` linha a linha).
+    """
+    df = df.rename(columns=COLUMN_MAPPING)
+
+    company_id = _by_category(
+        df['company_cnpj'],
+        lambda cnpjs: cnpjs.str.replace(r'[./-]', '', regex=True).map(cnpj_to_id_map),
+        np.nan,
+    )
+    keep = ~np.isnan(company_id)
+    df = df[keep].assign(company_id=company_id[keep].astype(int))
+    if df.empty:
+        return df
+
+    df = df.assign(
+        reference_date=pd.to_datetime(df['reference_date']),
+        account_value=pd.to_numeric(df['account_value'], errors='coerce'),
+    ).dropna(subset=['reference_date', 'account_value'])
+
+    multiplier = 1
+    if 'currency_scale' in df.columns:
+        multiplier = _by_category(
+            df['currency_scale'],
+            lambda scales: scales.str.upper().map(SCALE_MULTIPLIERS).fillna(1),
+            1,
+        )
+    df = df.assign(
+        account_value=df['account_value'] * multiplier,
+        # Contas até o 2º nível (ex.: 1.01) são fixas no plano de contas da CVM
+        is_fixed=_by_category(
+            df['account_code'], lambda codes: codes.str.count(r'\.') <= 1, True
+        ).astype(bool),
+        report_type=doc_type,
+        report_version=report_version,
+    )
+    if 'period_start' in df.columns:
+        df = df.assign(period_start=pd.to_datetime(df['period_start'], errors='coerce'))
+
+    # period_start não é coluna do modelo: só vai para o staging
+    model_columns = [c.name for c in CvmDocument.__table__.columns if c.name != 'id']
+    return df[df.columns.intersection(model_columns + ['period_start'])]
+
+
+def process_and_stage_dataframe(cursor, df, doc_type, report_version, cnpj_to_id_map):
+    """Transforma o DataFrame e o copia para o staging; retorna as linhas copiadas."""
     print(f"    -> Processando {len(df)} linhas para {doc_type}/{report_version}...")
-    
-    COLUMN_MAPPING = {
-        'CNPJ_CIA': 'company_cnpj', 'DT_REFER': 'reference_date', 'VERSAO': 'cvm_version',
-        'CD_CONTA': 'account_code', 'DS_CONTA': 'account_name', 'VL_CONTA': 'account_value',
-        'MOEDA': 'currency', 'ESCALA_MOEDA': 'currency_scale' # <--- ADICIONADO
-    }
-    df.rename(columns=COLUMN_MAPPING, inplace=True)
-    
-    df['company_cnpj'] = df['company_cnpj'].str.replace(r'[./-]', '', regex=True)
-    df['company_id'] = df['company_cnpj'].map(cnpj_to_id_map)
-    df.dropna(subset=['company_id'], inplace=True)
-    df['company_id'] = df['company_id'].astype(int)
+    df = transform_dataframe(select_current_rows(df), doc_type, report_version, cnpj_to_id_map)
 
     if df.empty:
         print("    -> Nenhum dado válido para as empresas monitoradas encontrado. Pulando.")
         return 0
 
-    df['reference_date'] = pd.to_datetime(df['reference_date'])
-    df['account_value'] = pd.to_numeric(df['account_value'], errors='coerce')
-    df.dropna(subset=['reference_date', 'account_value'], inplace=True)
-
-    # --- LÓGICA DE PRECISÃO ADICIONADA ---
-    def adjust_for_scale(row):
-        scale = row.get('currency_scale', 'UNIDADE')
-        value = row['account_value']
-        if isinstance(scale, str):
-            if scale.upper() == 'MIL':
-                return value * 1000
-            elif scale.upper() == 'MILHÃO':
-                return value * 1000000
-        return value
-
-    df['account_value'] = df.apply(adjust_for_scale, axis=1)
-    # --- FIM DA LÓGICA DE PRECISÃO ---
-
-    df['is_fixed'] = df['account_code'].apply(lambda x: len(str(x).split('.')) <= 2)
-    df['report_type'] = doc_type
-    df['report_version'] = report_version
-    
-    model_columns = [c.name for c in CvmDocument.__table__.columns if c.name != 'id']
-    df = df[df.columns.intersection(model_columns)]
-    
-    data_to_insert = df.to_dict(orient='records')
+    started = time.perf_counter()
+    copy_into_stage(cursor, df)
+    elapsed = time.perf_counter() - started
+    print(f"    -> {len(df)} linhas copiadas para o staging em {elapsed:.1f}s "
+          f"({len(df) / max(elapsed, 1e-9):,.0f} linhas/s)")
+    return len(df)
 
-    for i in tqdm(range(0, len(data_to_insert), BATCH_SIZE), desc="      Carregando para o BD"):
-        batch = data_to_insert[i:i + BATCH_SIZE]
-        try:
-            session.bulk_insert_mappings(CvmDocument, batch)
-            session.commit()
-        except Exception as e:
-            print(f"\n      ERRO ao inserir lote: {e}")
-            session.rollback()
 
-def download_and_process_zip(session, url, doc_type, cnpj_to_id_map):
+def load_checkpoints(session, year, doc_type):
+    """Retorna {statement: sha256 do zip de origem} das partições já concluídas."""
+    rows = session.query(BackfillCheckpoint.statement, BackfillCheckpoint.source_sha256).filter_by(
+        year=year, doc_type=doc_type
+    )
+    return {statement: sha256 for statement, sha256 in rows}
+
+
+def save_checkpoint(session, year, doc_type, statement, sha256, rows_loaded):
+    checkpoint = session.query(BackfillCheckpoint).filter_by(
+        year=year, doc_type=doc_type, statement=statement
+    ).first()
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(year=year, doc_type=doc_type, statement=statement)
+        session.add(checkpoint)
+    checkpoint.source_sha256 = sha256
+    checkpoint.rows_loaded = rows_loaded
+
+
+def download_and_process_zip(session, year, doc_type, cnpj_to_id_map, force=False):
+    """
+    Carrega as demonstrações (BPA/BPP/DRE, con/ind) de um ano e tipo de
+    documento. Cada demonstração é uma partição com checkpoint próprio:
+    partições já carregadas a partir do mesmo zip são puladas; as demais
+    passam por upsert, que só grava contas novas ou de versão mais recente.
+    Retorna {statement: linhas inseridas ou atualizadas, ou None se pulada}.
+    """
+    url = f"{DOC_SOURCES[doc_type]}{doc_type.lower()}_cia_aberta_{year}.zip"
+    results = {}
     try:
         print(f"\nBaixando arquivo de {url}...")
-        response = requests.get(url, stream=True, timeout=120)
-        response.raise_for_status()
-        zip_path = "temp_financials.zip"
-        with open(zip_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): f.write(chunk)
-        with zipfile.ZipFile(zip_path) as z:
-            csv_files = [f for f in z.namelist() if f.endswith(('.csv', '.CSV')) and ('BPA' in f or 'BPP' in f or 'DRE' in f)]
-            for filename in csv_files:
-                match = re.search(r'_(BPA|BPP|DRE)_(con|ind)_', filename, re.IGNORECASE)
-                if not match: continue
-                report_version = f"{match.group(1).upper()}_{match.group(2).upper()}"
-                print(f"  - Lendo arquivo: {filename} (Versão: {report_version})")
-                with z.open(filename) as f:
-                    df = pd.read_csv(f, sep=';', encoding='latin1', dtype={'CNPJ_CIA': str, 'CD_CONTA': str})
-                    process_and_load_dataframe(session, df, doc_type, report_version, cnpj_to_id_map)
-        os.remove(zip_path)
+        zip_path, sha256 = fetch_zip_cached(url)
     except requests.exceptions.RequestException as e:
-        if hasattr(e, 'response') and e.response and e.response.status_code == 404:
+        if getattr(e, 'response', None) is not None and e.response.status_code == 404:
             print(f"AVISO: Arquivo não encontrado (404). Pulando: {url}")
         else:
             print(f"AVISO: Falha no download ou conexão. Pulando: {url}. Erro: {e}")
+        return results
 
-def run_backfill():
+    done = {} if force else load_checkpoints(session, year, doc_type)
+    csv_files = [f for f in zip_members(zip_path) if 'BPA' in f or 'BPP' in f or 'DRE' in f]
+    for filename in csv_files:
+        match = STATEMENT_PATTERN.search(filename)
+        if not match:
+            continue
+        report_version = f"{match.group(1).upper()}_{match.group(2).upper()}"
+        if done.get(report_version) == sha256:
+            print(f"  - {filename}: já carregado (checkpoint). Pulando.")
+            results[report_version] = None
+            continue
+        print(f"  - Lendo arquivo: {filename} (Versão: {report_version})")
+        # Upsert e checkpoint da partição numa única transação. Os blocos são
+        # lidos numa thread enquanto o bloco anterior é transformado e copiado;
+        # o merge roda uma vez com o arquivo inteiro no staging, para a
+        # escolha de versão e período valer entre blocos.
+        try:
+            loaded = 0
+            chunks = iter_csv_chunks(zip_path, filename, dtype=CSV_DTYPES, chunksize=CSV_CHUNK_ROWS)
+            with stage_cursor(session) as cursor:
+                staged = sum(
+                    process_and_stage_dataframe(cursor, df, doc_type, report_version, cnpj_to_id_map)
+                    for df in prefetch(chunks)
+                )
+                if staged:
+                    started = time.perf_counter()
+                    loaded = merge_stage(cursor)
+                    print(f"    -> {staged} linhas no staging, {loaded} inseridas ou atualizadas "
+                          f"em {time.perf_counter() - started:.1f}s")
+            save_checkpoint(session, year, doc_type, report_version, sha256, loaded)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        results[report_version] = loaded
+    return results
+
+
+# --- Execução em processos paralelos: cada worker mantém sua própria engine ---
+_Session = None
+
+
+def _init_worker():
+    global _Session
+    _Session = sessionmaker(bind=get_db_engine())
+
+
+def process_partition(year, doc_type, cnpj_to_id_map, force=False):
+    """Retorna as linhas por demonstração, o tempo da tarefa e o pico de RSS do processo."""
+    session = _Session()
+    started = time.perf_counter()
+    try:
+        results = download_and_process_zip(session, year, doc_type, cnpj_to_id_map, force)
+    finally:
+        session.close()
+    return {
+        "statements": results,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def parse_years(spec):
+    """Converte '2015-2020', '2021' ou '2015,2018-2019' numa lista ordenada de anos."""
+    years = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(p) for p in part.split('-', 1))
+            years.update(range(start, end + 1))
+        else:
+            years.add(int(part))
+    return sorted(years)
+
+
+def run_backfill(years=None, doc_types=("DFP", "ITR"), workers=DEFAULT_WORKERS, force=False,
+                 drop_indexes=None):
+    """
+    Carrega os anos e tipos de documento pedidos. ``drop_indexes`` remove os
+    índices secundários durante a carga e os recria ao final; por padrão
+    isso ocorre em cargas completas (``force`` ou tabela vazia).
+    """
+    years = list(years or range(START_YEAR, END_YEAR + 1))
     engine = get_db_engine()
     print("Verificando e criando tabelas no banco de dados, se necessário...")
     Base.metadata.create_all(engine)
+    ensure_natural_key(engine)
     print("Tabelas verificadas/criadas com sucesso.")
 
     Session = sessionmaker(bind=engine)
@@ -122,38 +283,90 @@ def run_backfill():
     print("="*80)
     print("🚀 INICIANDO PROCESSO DE BACKFILL DE DADOS FINANCEIROS HISTÓRICOS 🚀")
     print("="*80)
+    failures = []
     try:
-        print("Limpando a tabela 'cvm_financial_data' para a carga completa...")
-        session.execute(text("TRUNCATE TABLE cvm_financial_data RESTART IDENTITY;"))
-        session.commit()
-
         print("Buscando a lista de empresas e criando mapa CNPJ -> ID...")
         companies = session.query(Company).all()
         cnpj_to_id_map = {c.cnpj: c.id for c in companies}
         print(f"Encontradas {len(cnpj_to_id_map)} empresas na tabela 'companies'.")
+        if drop_indexes is None:
+            drop_indexes = force or session.query(CvmDocument.id).first() is None
+    finally:
+        session.close()
 
-        if not cnpj_to_id_map:
-            print("❌ Nenhuma empresa encontrada para monitorar. Abortando o processo.")
-            return
+    if not cnpj_to_id_map:
+        print("❌ Nenhuma empresa encontrada para monitorar. Abortando o processo.")
+        return
 
-        doc_sources = [{"type": "DFP", "url": BASE_URL_DFP}, {"type": "ITR", "url": BASE_URL_ITR}]
-        for year in range(START_YEAR, END_YEAR + 1):
-            print(f"\n--- Processando ano: {year} ---")
-            for source in doc_sources:
-                file_url = f"{source['url']}{source['type'].lower()}_cia_aberta_{year}.zip"
-                download_and_process_zip(session, file_url, source['type'], cnpj_to_id_map)
+    tasks = [(year, doc_type) for year in years for doc_type in doc_types]
+    print(f"Anos {years[0]}-{years[-1]}, {len(tasks)} arquivos, {workers} processo(s).")
+    loaded_total, skipped_total = 0, 0
+    peak_rss = [peak_rss_mb()]
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        if drop_indexes:
+            stack.enter_context(without_secondary_indexes(engine))
+        pool = stack.enter_context(
+            ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks))), initializer=_init_worker)
+        )
+        futures = {
+            pool.submit(process_partition, year, doc_type, cnpj_to_id_map, force): (year, doc_type)
+            for year, doc_type in tasks
+        }
+        for future in as_completed(futures):
+            year, doc_type = futures[future]
+            try:
+                task = future.result()
+            except Exception as e:
+                print(f"\n❌ ERRO em {doc_type} {year}: {e}")
+                failures.append((year, doc_type))
+                continue
+            results = task["statements"]
+            loaded = sum(rows for rows in results.values() if rows is not None)
+            skipped = sum(1 for rows in results.values() if rows is None)
+            loaded_total += loaded
+            skipped_total += skipped
+            peak_rss.append(task["peak_rss_mb"])
+            print(f"✔ {doc_type} {year}: {loaded} linhas inseridas/atualizadas, {skipped} partições já concluídas "
+                  f"em {task['seconds']:.1f}s ({loaded / max(task['seconds'], 1e-9):,.0f} linhas/s).")
+    elapsed = time.perf_counter() - started
+    peak_rss = [mb for mb in peak_rss if mb is not None]
 
-        print("\n" + "="*80)
+    print("\n" + "="*80)
+    print(f"Linhas inseridas/atualizadas: {loaded_total}. Partições puladas: {skipped_total}.")
+    print(f"Tempo total: {elapsed:.1f}s. Vazão: {loaded_total / max(elapsed, 1e-9):,.0f} linhas/s.")
+    if peak_rss:
+        print(f"Pico de RSS por processo: {max(peak_rss):.0f} MB.")
+    if failures:
+        pending = ", ".join(f"{doc_type} {year}" for year, doc_type in sorted(failures))
+        print(f"⚠️ Falharam (serão retomados na próxima execução): {pending}")
+    else:
         print("🎉 PROCESSO DE BACKFILL CONCLUÍDO COM SUCESSO! 🎉")
-        print("="*80)
-    except Exception as e:
-        print(f"\n❌ ERRO CRÍTICO DURANTE O PROCESSO DE BACKFILL: {e}")
-        import traceback
-        traceback.print_exc()
-        session.rollback()
-    finally:
-        session.close()
-        print("🔌 Conexão com o banco de dados fechada.")
+    print("="*80)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de DFP/ITR da CVM em cvm_financial_data.")
+    parser.add_argument("--years", help=f"Anos a carregar, ex.: 2015-2020 ou 2018,2021 (padrão: {START_YEAR}-{END_YEAR}).")
+    parser.add_argument("--doc-types", default="DFP,ITR", help="Tipos de documento (padrão: DFP,ITR).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Processos em paralelo (padrão: {DEFAULT_WORKERS}).")
+    parser.add_argument("--force", action="store_true", help="Recarrega as partições mesmo com checkpoint.")
+    parser.add_argument("--drop-indexes", dest="drop_indexes", action="store_true", default=None,
+                        help="Remove os índices secundários durante a carga (padrão em cargas completas).")
+    parser.add_argument("--keep-indexes", dest="drop_indexes", action="store_false",
+                        help="Mantém os índices secundários durante a carga.")
+    args = parser.parse_args()
+
+    doc_types = [t.strip().upper() for t in args.doc_types.split(',') if t.strip()]
+    unknown = set(doc_types) - set(DOC_SOURCES)
+    if unknown:
+        parser.error(f"Tipos de documento desconhecidos: {', '.join(sorted(unknown))}")
+    failures = run_backfill(
+        parse_years(args.years) if args.years else None, doc_types, args.workers, args.force, args.drop_indexes
+    )
+    raise SystemExit(1 if failures else 0)
+
 
 if __name__ == "__main__":
-    run_backfill()
\ No newline at end of file
+    main()
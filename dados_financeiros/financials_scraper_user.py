@@ -13,6 +13,8 @@ import logging
 import numpy as np
 import sys
 
+from financials_upsert import NATURAL_KEY, UPDATE_COLUMNS, upsert_rows, version_number
+
 if sys.stdout.encoding.lower() != "utf-8":
     sys.stdout.reconfigure(encoding="utf-8")
     sys.stderr.reconfigure(encoding="utf-8")
@@ -100,6 +102,12 @@ class FinancialsScraper:
             logging.error(f"  -> ERRO ao processar o arquivo Excel: {e}")
             return []
 
+    def save_financial_lines(self, financial_lines: List) -> int:
+        """Upsert das linhas na chave natural; só grava contas novas, de versão mais recente ou alteradas."""
+        from models_user_custom import CvmDocument
+        rows = [{c: getattr(line, c) for c in NATURAL_KEY + UPDATE_COLUMNS} for line in financial_lines]
+        return upsert_rows(self.db.session, CvmDocument.__table__, rows)
+
     def _run_check_for_category(self, category_name: str) -> Dict:
         logging.info("="*80)
         logging.info(f"⚙️  INICIANDO SCRAPER (CATEGORIA: {category_name}) ⚙️")
@@ -146,10 +154,13 @@ class FinancialsScraper:
                     if not date_match: continue
                     reference_date = datetime.datetime.strptime(date_match.group(1), '%d/%m/%Y').date()
                     
-                    exists = self.db.session.query(CvmDocument.id).filter_by(company_id=company_id, report_type=category_name, reference_date=reference_date).first()
+                    # Reapresentações (VERSAO maior que a gravada) também são baixadas
+                    stored_versions = self.db.session.query(CvmDocument.cvm_version).filter_by(company_id=company_id, report_type=category_name, reference_date=reference_date).distinct().all()
+                    stored_version = max((version_number(v) for (v,) in stored_versions), default=None)
 
-                    if not exists:
-                        logging.info(f"\n✅ NOVO DOCUMENTO ({category_name} v{cvm_version}): {cols[1].inner_text()} para {reference_date}")
+                    if stored_version is None or version_number(cvm_version) > stored_version:
+                        label = "NOVO DOCUMENTO" if stored_version is None else f"NOVA VERSÃO (gravada v{stored_version})"
+                        logging.info(f"\n✅ {label} ({category_name} v{cvm_version}): {cols[1].inner_text()} para {reference_date}")
                         try:
                             with page.expect_download() as download_info:
                                 cols[10].locator('i[title="Download"]').click()
@@ -161,10 +172,10 @@ class FinancialsScraper:
                                         excel_content = z.read('DadosDocumento.xlsx')
                                         financial_lines = self.process_excel_file(io.BytesIO(excel_content), company_id, category_name, reference_date, cvm_version)
                                         if financial_lines:
-                                            self.db.session.bulk_save_objects(financial_lines)
+                                            saved = self.save_financial_lines(financial_lines)
                                             self.db.session.commit()
-                                            logging.info(f"  -> 🎉 SUCESSO! {len(financial_lines)} linhas salvas.")
-                                            total_new_lines += len(financial_lines)
+                                            logging.info(f"  -> 🎉 SUCESSO! {saved} linhas inseridas/atualizadas.")
+                                            total_new_lines += saved
                         except Exception as e:
                             logging.error(f"  -> ❌ ERRO GERAL: {e}")
                             self.db.session.rollback()
@@ -0,0 +1,88 @@
+# financials_upsert.py - Chave natural e upsert versionado de cvm_financial_data
+
+import re
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+TARGET_TABLE = 'cvm_financial_data'
+NATURAL_KEY_INDEX = 'uix_cvm_financial_data_natural_key'
+# Uma linha por conta de cada demonstração de uma empresa numa data de referência
+NATURAL_KEY = ['company_id', 'reference_date', 'report_type', 'report_version', 'account_code']
+# Colunas atualizadas quando chega uma versão mais nova (ou a mesma versão com valores diferentes)
+VALUE_COLUMNS = ['account_name', 'account_value', 'currency', 'is_fixed']
+UPDATE_COLUMNS = ['cvm_version'] + VALUE_COLUMNS
+
+
+def version_sql(column):
+    """Expressão SQL com o número da versão CVM (texto como '2' ou 'v2'); 0 quando ausente."""
+    return f"COALESCE(CAST(substring({column} FROM '[0-9]+') AS integer), 0)"
+
+
+def version_number(value):
+    """Mesmo critério de ``version_sql`` em Python."""
+    match = re.search(r'\d+', str(value)) if value is not None else None
+    return int(match.group()) if match else 0
+
+
+_NEW, _OLD = version_sql('EXCLUDED.cvm_version'), version_sql(f'{TARGET_TABLE}.cvm_version')
+# Só toca a linha existente se a versão for mais nova ou se os valores mudaram na mesma versão
+UPSERT_WHERE = (
+    f"{_NEW} > {_OLD} OR ({_NEW} = {_OLD} AND "
+    f"({', '.join(f'EXCLUDED.{c}' for c in VALUE_COLUMNS)}) IS DISTINCT FROM "
+    f"({', '.join(f'{TARGET_TABLE}.{c}' for c in VALUE_COLUMNS)}))"
+)
+UPSERT_CONFLICT = (
+    f"ON CONFLICT ({', '.join(NATURAL_KEY)}) DO UPDATE SET "
+    f"{', '.join(f'{c} = EXCLUDED.{c}' for c in UPDATE_COLUMNS)} "
+    f"WHERE {UPSERT_WHERE}"
+)
+
+# Remove as duplicatas da chave natural mantendo a maior versão (e, empatada, o maior id)
+DEDUPLICATE_SQL = f"""
+DELETE FROM {TARGET_TABLE} d
+USING {TARGET_TABLE} newer
+WHERE {' AND '.join(f'd.{c} = newer.{c}' for c in NATURAL_KEY)}
+  AND ({version_sql('newer.cvm_version')} > {version_sql('d.cvm_version')}
+       OR ({version_sql('newer.cvm_version')} = {version_sql('d.cvm_version')} AND newer.id > d.id))
+"""
+
+
+def upsert_rows(session, table, rows):
+    """
+    INSERT ... ON CONFLICT na chave natural para uma lista de dicts (sem
+    commit). Retorna o número de linhas inseridas ou atualizadas.
+    """
+    # Uma linha por chave: o ON CONFLICT não atualiza a mesma linha duas vezes num statement
+    rows = list({tuple(row[c] for c in NATURAL_KEY): row for row in rows}.values())
+    if not rows:
+        return 0
+    stmt = postgresql.insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=NATURAL_KEY,
+        set_={c: stmt.excluded[c] for c in UPDATE_COLUMNS},
+        where=text(UPSERT_WHERE),
+    )
+    return session.execute(stmt).rowcount
+
+
+def ensure_natural_key(engine):
+    """
+    Cria o índice único da chave natural em bancos anteriores a ele,
+    removendo antes as versões superadas. Em bancos novos o índice já vem
+    do ``create_all``.
+    """
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM pg_indexes WHERE tablename = :table AND indexname = :index"),
+            {"table": TARGET_TABLE, "index": NATURAL_KEY_INDEX},
+        ).first()
+        if exists:
+            return False
+        print(f"Criando o índice único {NATURAL_KEY_INDEX} (removendo versões superadas)...")
+        deleted = connection.execute(text(DEDUPLICATE_SQL)).rowcount
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX {NATURAL_KEY_INDEX} ON {TARGET_TABLE} ({', '.join(NATURAL_KEY)})"
+        ))
+        print(f"Índice criado; {deleted} linhas duplicadas removidas.")
+    return True
@@ -1,7 +1,7 @@
 # models.py - Versão corrigida com o typo em back_populates
 
 from sqlalchemy import (Column, Integer, String, Date, Boolean, ForeignKey, 
-                        BigInteger, DateTime)
+                        BigInteger, DateTime, Index, UniqueConstraint)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -53,6 +53,12 @@ class CvmDocument(Base):
     # --- CORREÇÃO DO TYPO: 'back_populates' ---
     company = relationship("Company", back_populates="financial_data")
 
+    __table_args__ = (
+        # Chave natural: uma linha por conta, mantendo só a versão mais recente da CVM
+        Index('uix_cvm_financial_data_natural_key', 'company_id', 'reference_date', 'report_type',
+              'report_version', 'account_code', unique=True),
+    )
+
     def to_dict(self):
         """Converte o objeto CvmDocument para um dicionário."""
         return {
@@ -68,4 +74,25 @@ class CvmDocument(Base):
             'currency': self.currency,
             'is_fixed': self.is_fixed,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+
+class BackfillCheckpoint(Base):
+    """
+    Partições (ano, tipo de documento, demonstração) já carregadas pelo
+    backfill, com o hash do zip de origem. Uma partição só é recarregada
+    quando a CVM publica um arquivo diferente.
+    """
+    __tablename__ = 'cvm_backfill_checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    year = Column(Integer, nullable=False)
+    doc_type = Column(String(10), nullable=False)
+    statement = Column(String(20), nullable=False)
+    source_sha256 = Column(String(64), nullable=False)
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('year', 'doc_type', 'statement', name='uix_backfill_partition'),
+    )
@@ -1,7 +1,7 @@
 # models_user_custom.py - Versão final e completa, sincronizada com models.py
 
 from sqlalchemy import (Column, Integer, String, Date, Boolean, ForeignKey, 
-                        BigInteger, DateTime)
+                        BigInteger, DateTime, Index)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -53,6 +53,12 @@ class CvmDocument(Base):
 
     company = relationship("Company", back_populates="financial_data")
 
+    __table_args__ = (
+        # Chave natural: uma linha por conta, mantendo só a versão mais recente da CVM
+        Index('uix_cvm_financial_data_natural_key', 'company_id', 'reference_date', 'report_type',
+              'report_version', 'account_code', unique=True),
+    )
+
     def to_dict(self):
         """Converte o objeto CvmDocument para um dicionário."""
         return {
@@ -1,11 +1,10 @@
 # scraper.py
 import os
+import sys
 import requests
 import pandas as pd
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from zipfile import ZipFile
-from io import BytesIO
 import datetime
 import re
 from dotenv import load_dotenv
@@ -13,6 +12,10 @@ from dotenv import load_dotenv
 # ... (O início do script, incluindo a configuração do DB_URL, permanece o mesmo) ...
 from models import CvmDocument, Company
 
+# Leitor de zips da CVM compartilhado com dados_financeiros (adicionado ao fim do path: 'models' continua sendo o local)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dados_financeiros'))
+from cvm_zip_stream import fetch_zip_cached, iter_csv_chunks, prefetch, zip_members  # noqa: E402
+
 # --- Configuração ---
 load_dotenv() # Carrega as variáveis do arquivo .env para o ambiente
 
@@ -33,6 +36,12 @@ DB_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 START_YEAR = 2003
 END_YEAR = datetime.date.today().year
 BASE_URL = "https://dados.cvm.gov.br/dados/CIA_ABERTA/DOC/IPE/DADOS/ipe_cia_aberta_{year}.zip"
+CHUNK_ROWS = 50000
+# Tipos explícitos: todos os blocos com o mesmo schema, sem inferência por bloco
+CSV_DTYPES = {
+    'CNPJ_Companhia': str, 'Codigo_CVM': str, 'Categoria': str, 'Tipo': str,
+    'Assunto': str, 'Data_Entrega': str, 'Data_Referencia': str, 'Link_Download': str,
+}
 
 # --- Conexão com o Banco ---
 engine = create_engine(DB_URL )
@@ -53,81 +62,25 @@ def get_cnpj_to_id_map(session):
 
 def fetch_and_process_year(year: int, cnpj_map: dict):
     """
-    Baixa, extrai e processa o arquivo CSV para um determinado ano,
-    utilizando o mapa de CNPJ para ID.
+    Baixa (ou reaproveita do cache), extrai e processa o arquivo CSV para um
+    determinado ano, utilizando o mapa de CNPJ para ID. O CSV é lido e
+    gravado em blocos, com memória constante independente do tamanho do ano.
     """
     url = BASE_URL.format(year=year)
     print(f"\nIniciando processamento para o ano: {year}")
 
     try:
-        response = requests.get(url, timeout=120)
-        response.raise_for_status()
-
-        with ZipFile(BytesIO(response.content)) as z:
-            csv_filename = z.namelist()[0]
-            with z.open(csv_filename, 'r') as f:
-                df = pd.read_csv(f, sep=';', encoding='latin-1', on_bad_lines='skip',
-                                 dtype={'CNPJ_Companhia': str, 'Codigo_CVM': str})
-
-                # Limpa e mapeia o CNPJ para company_id
-                df['CNPJ_Companhia_limpo'] = df['CNPJ_Companhia'].str.replace(r'[^\d]', '', regex=True)
-                df['company_id'] = df['CNPJ_Companhia_limpo'].map(cnpj_map)
-
-                original_count = len(df)
-                df.dropna(subset=['company_id'], inplace=True)
-                if len(df) < original_count:
-                    print(f"AVISO: {original_count - len(df)} registros descartados por não terem CNPJ correspondente na tabela 'companies'.")
-
-                rename_map = {
-                    'Codigo_CVM': 'cvm_code',
-                    'Categoria': 'document_category',
-                    'Tipo': 'document_type',
-                    'Assunto': 'title',
-                    'Data_Entrega': 'delivery_date',
-                    'Data_Referencia': 'reference_date',
-                    'Link_Download': 'download_url'
-                }
-                df.rename(columns=rename_map, inplace=True)
-
-                # --- SEÇÃO CORRIGIDA ---
-                # 1. Converte colunas de data. `errors='coerce'` transforma falhas em NaT.
-                df['delivery_date'] = pd.to_datetime(df['delivery_date'], errors='coerce')
-                df['reference_date'] = pd.to_datetime(df['reference_date'], errors='coerce')
-
-                # 2. Remove explicitamente as linhas onde a conversão de data falhou (resultou em NaT)
-                #    ou onde outras colunas essenciais são nulas.
-                df.dropna(subset=['delivery_date', 'reference_date', 'download_url', 'cvm_code'], inplace=True)
-                # --- FIM DA SEÇÃO CORRIGIDA ---
-
-                # Seleciona apenas as colunas que vamos usar
-                columns_to_keep = list(rename_map.values()) + ['company_id']
-                df = df[columns_to_keep]
-
-                # Garante tipos corretos antes de inserir
-                df['company_id'] = df['company_id'].astype(int)
-                df['cvm_code'] = pd.to_numeric(df['cvm_code'], errors='coerce').astype('Int64') # Converte para numérico e depois para Int64 para segurança
-
-                data_to_insert = df.to_dict(orient='records')
-                save_to_db(data_to_insert)
-
-                
-                df['protocolo'] = df['Link_Download'].str.extract(r'numProtocolo=(\d+)', expand=False)
-                df['download_url'] = 'https://www.rad.cvm.gov.br/ENET/frmDownloadDocumento.aspx?NumeroProtocoloEntrega=' + df['protocolo']
-                rename_map = {
-                        'Codigo_CVM': 'cvm_code',
-                        'Categoria': 'document_category',
-                        'Tipo': 'document_type',     
-                        'Assunto': 'title',
-                        'Data_Entrega': 'delivery_date',
-                        'Data_Referencia': 'reference_date',
-                        # Não precisamos mais mapear 'Link_Download', pois já criamos 'download_url'
-                }
-                df.rename(columns=rename_map, inplace=True )
-
-
-                        
-
-        print(f"Ano {year} processado. {len(data_to_insert)} registros lidos e válidos.")
+        zip_path, _ = fetch_zip_cached(url)
+        csv_filename = zip_members(zip_path)[0]
+        chunks = iter_csv_chunks(zip_path, csv_filename, dtype=CSV_DTYPES, chunksize=CHUNK_ROWS,
+                                 encoding='latin-1', on_bad_lines='skip')
+        total = 0
+        for df in prefetch(chunks):
+            data_to_insert = transform_chunk(df, cnpj_map)
+            save_to_db(data_to_insert)
+            total += len(data_to_insert)
+
+        print(f"Ano {year} processado. {total} registros lidos e válidos.")
 
     except requests.exceptions.RequestException as e:
         print(f"ERRO ao baixar dados para o ano {year}: {e}")
@@ -135,6 +88,47 @@ def fetch_and_process_year(year: int, cnpj_map: dict):
         print(f"ERRO inesperado ao processar o ano {year}: {e}")
 
 
+def transform_chunk(df, cnpj_map: dict) -> list[dict]:
+    """Converte um bloco do CSV IPE nos registros de ``cvm_documents``."""
+    # Limpa e mapeia o CNPJ para company_id
+    df['CNPJ_Companhia_limpo'] = df['CNPJ_Companhia'].str.replace(r'[^\d]', '', regex=True)
+    df['company_id'] = df['CNPJ_Companhia_limpo'].map(cnpj_map)
+
+    original_count = len(df)
+    df.dropna(subset=['company_id'], inplace=True)
+    if len(df) < original_count:
+        print(f"AVISO: {original_count - len(df)} registros descartados por não terem CNPJ correspondente na tabela 'companies'.")
+
+    rename_map = {
+        'Codigo_CVM': 'cvm_code',
+        'Categoria': 'document_category',
+        'Tipo': 'document_type',
+        'Assunto': 'title',
+        'Data_Entrega': 'delivery_date',
+        'Data_Referencia': 'reference_date',
+        'Link_Download': 'download_url'
+    }
+    df.rename(columns=rename_map, inplace=True)
+
+    # 1. Converte colunas de data. `errors='coerce'` transforma falhas em NaT.
+    df['delivery_date'] = pd.to_datetime(df['delivery_date'], errors='coerce')
+    df['reference_date'] = pd.to_datetime(df['reference_date'], errors='coerce')
+
+    # 2. Remove explicitamente as linhas onde a conversão de data falhou (resultou em NaT)
+    #    ou onde outras colunas essenciais são nulas.
+    df.dropna(subset=['delivery_date', 'reference_date', 'download_url', 'cvm_code'], inplace=True)
+
+    # Seleciona apenas as colunas que vamos usar
+    columns_to_keep = list(rename_map.values()) + ['company_id']
+    df = df[columns_to_keep].copy()
+
+    # Garante tipos corretos antes de inserir
+    df['company_id'] = df['company_id'].astype(int)
+    df['cvm_code'] = pd.to_numeric(df['cvm_code'], errors='coerce').astype('Int64') # Converte para numérico e depois para Int64 para segurança
+
+    return df.to_dict(orient='records')
+
+
 def save_to_db(data: list[dict]):
     """
     Salva uma lista de registros no banco, ignorando duplicatas pelo 'download_url'.
@@ -1,3 +1,4 @@
+import click
 from flask.cli import FlaskGroup
 from backend import create_app, db
 
@@ -5,5 +6,75 @@ app = create_app()
 cli = FlaskGroup(create_app=create_app)
 
 
+@cli.command("rebuild-nav")
+@click.option("--portfolio", "portfolio_ids", type=int, multiple=True,
+              help="Portfólio a reconstruir (repetível). Padrão: todos.")
+@click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]),
+              help="Data inicial (YYYY-MM-DD). Padrão: 365 dias antes do fim. "
+                   "Nunca antes do primeiro registro diário real do portfólio.")
+@click.option("--end", type=click.DateTime(formats=["%Y-%m-%d"]),
+              help="Data final (YYYY-MM-DD). Padrão: hoje.")
+@click.option("--workers", type=int, default=1, show_default=True,
+              help="Processos em paralelo (um portfólio por tarefa).")
+def rebuild_nav_command(portfolio_ids, start, end, workers):
+    """Preenche os dias ausentes de portfolio_daily_values a partir de daily_quotes."""
+    from backend.models import Portfolio
+    from backend.services.nav_engine import rebuild_nav
+
+    ids = list(portfolio_ids) or [pid for (pid,) in db.session.query(Portfolio.id)]
+    results = rebuild_nav(
+        ids,
+        start.date() if start else None,
+        end.date() if end else None,
+        workers,
+    )
+    for pid in sorted(results):
+        click.echo(f"Portfólio {pid}: {results[pid]} dias inseridos")
+
+
+@cli.command("eod-snapshot")
+@click.option("--portfolio", "portfolio_ids", type=int, multiple=True,
+              help="Portfólio a registrar (repetível). Padrão: todos.")
+@click.option("--date", "day", type=click.DateTime(formats=["%Y-%m-%d"]),
+              help="Data do snapshot (YYYY-MM-DD). Padrão: hoje.")
+@click.option("--at", "at_time",
+              help="Agenda a execução diária (dias úteis) no horário HH:MM em vez de rodar uma vez.")
+def eod_snapshot_command(portfolio_ids, day, at_time):
+    """Registra o valor de fim de dia dos portfólios em portfolio_daily_values."""
+    from backend.services.eod_snapshot import snapshot_portfolios
+
+    def run():
+        stats = snapshot_portfolios(list(portfolio_ids) or None, day.date() if day else None)
+        click.echo(
+            f"{stats['date']}: {stats['portfolios']} portfólios "
+            f"({stats['inserted']} inseridos, {stats['updated']} atualizados) "
+            f"em {stats['duration_ms']} ms"
+        )
+        for pid in stats["missing"]:
+            click.echo(f"Portfólio {pid} não encontrado", err=True)
+
+    if not at_time:
+        run()
+        return
+
+    import time
+    from datetime import date
+    import schedule
+
+    def run_on_weekdays():
+        if date.today().weekday() < 5:
+            try:
+                run()
+            except Exception as e:
+                db.session.rollback()
+                click.echo(f"Erro no snapshot EOD: {e}", err=True)
+
+    schedule.every().day.at(at_time).do(run_on_weekdays)
+    click.echo(f"Snapshot EOD agendado para {at_time} (dias úteis)")
+    while True:
+        schedule.run_pending()
+        time.sleep(30)
+
+
 if __name__ == "__main__":
     cli()
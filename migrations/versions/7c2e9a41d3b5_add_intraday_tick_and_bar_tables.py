@@ -0,0 +1,57 @@
+"""add intraday tick and bar tables
+
+Revision ID: 7c2e9a41d3b5
+Revises: 41040a87193c, 4d358e082fd4
+Create Date: 2026-10-18 10:12:31.402118
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2e9a41d3b5"
+down_revision: Union[str, Sequence[str], None] = ("41040a87193c", "4d358e082fd4")
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create range-partitioned intraday tables (monthly partitions are created on demand)."""
+    op.execute(
+        """
+        CREATE TABLE intraday_ticks (
+            symbol VARCHAR(20) NOT NULL,
+            time TIMESTAMP NOT NULL,
+            time_msc BIGINT NOT NULL,
+            bid NUMERIC(12, 4),
+            ask NUMERIC(12, 4),
+            last NUMERIC(12, 4),
+            volume NUMERIC(20, 2)
+        ) PARTITION BY RANGE (time)
+        """
+    )
+    op.execute(
+        "CREATE INDEX ix_intraday_ticks_symbol_time ON intraday_ticks (symbol, time)"
+    )
+    op.execute(
+        """
+        CREATE TABLE intraday_bars (
+            symbol VARCHAR(20) NOT NULL,
+            timeframe VARCHAR(5) NOT NULL,
+            bar_time TIMESTAMP NOT NULL,
+            open NUMERIC(12, 4) NOT NULL,
+            high NUMERIC(12, 4) NOT NULL,
+            low NUMERIC(12, 4) NOT NULL,
+            close NUMERIC(12, 4) NOT NULL,
+            volume NUMERIC(20, 2),
+            ticks INTEGER,
+            PRIMARY KEY (symbol, timeframe, bar_time)
+        ) PARTITION BY RANGE (bar_time)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS intraday_bars")
+    op.execute("DROP INDEX IF EXISTS ix_intraday_ticks_symbol_time")
+    op.execute("DROP TABLE IF EXISTS intraday_ticks")
@@ -0,0 +1,27 @@
+"""flag reconstructed portfolio daily values
+
+Revision ID: a9d4e2f61b37
+Revises: f8b3c5d7e920
+Create Date: 2026-10-18 19:06:12.447903
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a9d4e2f61b37"
+down_revision: Union[str, Sequence[str], None] = "f8b3c5d7e920"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "portfolio_daily_values",
+        sa.Column("is_reconstructed", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("portfolio_daily_values", "is_reconstructed")
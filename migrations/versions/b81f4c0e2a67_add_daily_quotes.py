@@ -0,0 +1,34 @@
+"""add daily quotes
+
+Revision ID: b81f4c0e2a67
+Revises: 7c2e9a41d3b5
+Create Date: 2026-10-18 11:40:07.518223
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b81f4c0e2a67"
+down_revision: Union[str, Sequence[str], None] = "7c2e9a41d3b5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_quotes",
+        sa.Column("symbol", sa.String(length=20), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("open", sa.Numeric(12, 4)),
+        sa.Column("high", sa.Numeric(12, 4)),
+        sa.Column("low", sa.Numeric(12, 4)),
+        sa.Column("close", sa.Numeric(12, 4), nullable=False),
+        sa.Column("volume", sa.Numeric(20, 2)),
+        sa.PrimaryKeyConstraint("symbol", "date"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_quotes")
@@ -0,0 +1,58 @@
+"""unique portfolio position per symbol
+
+Revision ID: c4d2e7a9b310
+Revises: b81f4c0e2a67
+Create Date: 2026-10-18 14:05:31.204118
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d2e7a9b310"
+down_revision: Union[str, Sequence[str], None] = "b81f4c0e2a67"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Consolida as duplicatas de (portfolio_id, symbol) na posição mais recente:
+    # quantidade somada e preço médio ponderado pela quantidade
+    op.execute(
+        """
+        UPDATE portfolio_positions AS p
+        SET quantity = agg.quantity,
+            avg_price = CASE
+                WHEN agg.quantity <> 0 THEN ROUND(agg.cost / agg.quantity, 2)
+                ELSE p.avg_price
+            END
+        FROM (
+            SELECT portfolio_id, symbol, MAX(id) AS keep_id,
+                   SUM(quantity) AS quantity, SUM(quantity * avg_price) AS cost
+            FROM portfolio_positions
+            GROUP BY portfolio_id, symbol
+            HAVING COUNT(*) > 1
+        ) agg
+        WHERE p.id = agg.keep_id
+        """
+    )
+    # Remove as linhas já consolidadas antes do índice único
+    op.execute(
+        """
+        DELETE FROM portfolio_positions p
+        USING portfolio_positions newer
+        WHERE p.portfolio_id = newer.portfolio_id
+          AND p.symbol = newer.symbol
+          AND p.id < newer.id
+        """
+    )
+    op.create_index(
+        "uix_portfolio_position_symbol",
+        "portfolio_positions",
+        ["portfolio_id", "symbol"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uix_portfolio_position_symbol", table_name="portfolio_positions")
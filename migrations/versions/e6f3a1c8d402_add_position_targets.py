@@ -0,0 +1,34 @@
+"""add rebalancing targets to portfolio positions
+
+Revision ID: e6f3a1c8d402
+Revises: c4d2e7a9b310
+Create Date: 2026-10-18 15:22:47.830512
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e6f3a1c8d402"
+down_revision: Union[str, Sequence[str], None] = "c4d2e7a9b310"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "portfolio_positions",
+        sa.Column("target_pct", sa.Numeric(10, 4), nullable=False, server_default="0"),
+    )
+    op.add_column("portfolio_positions", sa.Column("target_price", sa.Numeric(10, 2), nullable=True))
+    op.add_column(
+        "portfolio_positions",
+        sa.Column("lot_size", sa.Integer(), nullable=False, server_default="100"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("portfolio_positions", "lot_size")
+    op.drop_column("portfolio_positions", "target_price")
+    op.drop_column("portfolio_positions", "target_pct")
@@ -0,0 +1,46 @@
+"""natural key for cvm financial data
+
+Revision ID: f8b3c5d7e920
+Revises: e6f3a1c8d402
+Create Date: 2026-10-18 17:42:09.518330
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f8b3c5d7e920"
+down_revision: Union[str, Sequence[str], None] = "e6f3a1c8d402"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NATURAL_KEY = ["company_id", "reference_date", "report_type", "report_version", "account_code"]
+
+
+def _version(column: str) -> str:
+    # VERSAO da CVM guardada como texto ('1', '2', ...): compara numericamente
+    return f"COALESCE(CAST(substring({column} FROM '[0-9]+') AS integer), 0)"
+
+
+def upgrade() -> None:
+    # Mantém apenas a maior versão de cada conta (empate: o registro mais recente) antes do índice único
+    same_key = " AND ".join(f"d.{c} = newer.{c}" for c in NATURAL_KEY)
+    op.execute(
+        f"""
+        DELETE FROM cvm_financial_data d
+        USING cvm_financial_data newer
+        WHERE {same_key}
+          AND ({_version("newer.cvm_version")} > {_version("d.cvm_version")}
+               OR ({_version("newer.cvm_version")} = {_version("d.cvm_version")} AND newer.id > d.id))
+        """
+    )
+    op.create_index(
+        "uix_cvm_financial_data_natural_key",
+        "cvm_financial_data",
+        NATURAL_KEY,
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uix_cvm_financial_data_natural_key", table_name="cvm_financial_data")
@@ -1,10 +1,19 @@
 import os
-import sys
-import logging
-from flask_socketio import SocketIO
-from backend import create_app, socketio
-from backend.services.metatrader5_rtd_worker import initialize_rtd_worker
-from backend.routes.realtime_routes import register_socketio_events
+
+# Nos modos assíncronos o monkey patching precisa acontecer antes de qualquer outro import
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import sys  # noqa: E402
+import logging  # noqa: E402
+from backend import create_app, socketio  # noqa: E402
+from backend.services.metatrader5_rtd_worker import initialize_rtd_worker  # noqa: E402
+from backend.routes.realtime_routes import register_socketio_events  # noqa: E402
 
 if sys.stdout.encoding.lower() != "utf-8":
     sys.stdout.reconfigure(encoding="utf-8")
@@ -0,0 +1,122 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Os scripts de dados_financeiros importam os módulos vizinhos pelo nome
+sys.path.insert(0, str(Path(__file__).parent / "dados_financeiros"))
+
+from copy_loader import (  # noqa: E402
+    LOAD_COLUMNS,
+    STAGE_COLUMNS,
+    DataFrameCsvStream,
+    copy_into_stage,
+    merge_stage,
+    stage_cursor,
+)
+from financials_upsert import NATURAL_KEY, version_sql  # noqa: E402
+
+
+def make_frame(rows):
+    return pd.DataFrame({
+        "company_id": np.arange(1, rows + 1),
+        "reference_date": pd.to_datetime(["2023-12-31"] * rows),
+        "report_type": "DFP",
+        "report_version": "BPA_CON",
+        "cvm_version": "1",
+        "account_code": [f"1.{i:02d}" for i in range(rows)],
+        "account_name": [None if i % 3 == 0 else f"Conta; \"{i}\"" for i in range(rows)],
+        "account_value": [np.nan if i % 4 == 0 else i * 1000 for i in range(rows)],
+        "currency": "REAL",
+        "is_fixed": [i % 2 == 0 for i in range(rows)],
+    })
+
+
+def read_all(stream, size):
+    parts = []
+    while True:
+        data = stream.read(size)
+        if not data:
+            return "".join(parts)
+        parts.append(data)
+
+
+def test_stream_matches_full_csv_across_chunks_and_read_sizes():
+    df = make_frame(23)
+    expected = df.to_csv(header=False, index=False, columns=LOAD_COLUMNS, date_format="%Y-%m-%d")
+
+    for chunk_rows in (1, 5, 23, 100):
+        for size in (-1, 7, 8192):
+            assert read_all(DataFrameCsvStream(df, chunk_rows=chunk_rows), size) == expected
+
+
+def test_stream_writes_nulls_as_empty_fields():
+    lines = read_all(DataFrameCsvStream(make_frame(4)), -1).splitlines()
+
+    # COPY ... WITH (FORMAT csv) lê campos vazios sem aspas como NULL
+    assert lines[0] == "1,2023-12-31,DFP,BPA_CON,1,1.00,,,REAL,True"
+    assert lines[1] == '2,2023-12-31,DFP,BPA_CON,1,1.01,"Conta; ""1""",1000.0,REAL,False'
+
+
+def test_stream_of_empty_frame_is_empty():
+    assert DataFrameCsvStream(make_frame(0)).read() == ""
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.executed, self.copied, self.closed = [], [], False
+        self.rowcount = 2
+
+    def execute(self, sql):
+        self.executed.append(" ".join(sql.split()))
+
+    def copy_expert(self, sql, stream):
+        self.copied.append((sql, read_all(stream, 4096)))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def connection(self):
+        dbapi = type("DBAPIConnection", (), {"cursor": lambda _: self._cursor})()
+        return type("Connection", (), {"connection": dbapi})()
+
+
+def test_copy_into_stage_streams_the_frame():
+    cursor = RecordingCursor()
+    copy_into_stage(cursor, make_frame(3))
+
+    sql, data = cursor.copied[0]
+    assert sql.startswith(f"COPY cvm_financial_data_stage ({', '.join(LOAD_COLUMNS)}) FROM STDIN")
+    assert len(data.splitlines()) == 3
+
+
+def test_merge_prefers_latest_version_then_earliest_period():
+    cursor = RecordingCursor()
+    assert merge_stage(cursor) == 2
+
+    sql = cursor.executed[0]
+    assert sql.startswith(f"INSERT INTO cvm_financial_data ({', '.join(LOAD_COLUMNS)}) SELECT DISTINCT ON (")
+    assert f"ORDER BY {', '.join(NATURAL_KEY)}, {version_sql('cvm_version')} DESC, " \
+           "period_start ASC NULLS LAST ON CONFLICT" in sql
+
+
+def test_stage_accumulates_chunks_until_a_single_merge():
+    cursor = RecordingCursor()
+    chunks = [make_frame(3).assign(period_start=pd.to_datetime("2023-01-01")), make_frame(2)]
+
+    with stage_cursor(FakeSession(cursor)) as staged:
+        for df in chunks:
+            copy_into_stage(staged, df)
+        merge_stage(staged)
+
+    assert cursor.executed[1] == "TRUNCATE cvm_financial_data_stage"
+    assert len(cursor.executed) == 3 and cursor.closed
+    (first_sql, first), (second_sql, second) = cursor.copied
+    assert f"({', '.join(STAGE_COLUMNS)})" in first_sql and first.splitlines()[0].endswith(",True,2023-01-01")
+    assert f"({', '.join(LOAD_COLUMNS)})" in second_sql and len(second.splitlines()) == 2
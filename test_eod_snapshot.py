@@ -0,0 +1,79 @@
+from datetime import date
+
+from backend import db
+from backend.models import (
+    AssetMetrics,
+    DailyQuote,
+    Portfolio,
+    PortfolioDailyValue,
+    PortfolioPosition,
+    Ticker,
+)
+from backend.services.eod_snapshot import snapshot_portfolios
+
+DAY = date(2024, 1, 2)
+
+
+def seed(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Ticker(symbol="PETR4", type="stock"),
+            Portfolio(id=1, name="P1"),
+            Portfolio(id=2, name="P2"),
+            Portfolio(id=3, name="Vazio"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=50),
+            PortfolioPosition(portfolio_id=2, symbol="VALE3", quantity=1, avg_price=50),
+            PortfolioPosition(portfolio_id=2, symbol="PETR4", quantity=100, avg_price=30),
+            AssetMetrics(symbol="VALE3", last_price=59),
+            AssetMetrics(symbol="PETR4", last_price=34),
+            # Só VALE3 tem fechamento do dia; PETR4 usa o último preço
+            DailyQuote(symbol="VALE3", date=DAY, close=60),
+            PortfolioDailyValue(
+                portfolio_id=2, date=DAY, total_value=1, total_cost=1,
+                total_gain=0, total_gain_percent=0,
+            ),
+        ])
+        db.session.commit()
+
+
+def daily_values():
+    return {
+        (v.portfolio_id, v.date): (float(v.total_value), float(v.total_gain))
+        for v in PortfolioDailyValue.query
+    }
+
+
+def test_snapshot_values_all_portfolios_with_closes(client):
+    seed(client)
+    with client.application.app_context():
+        stats = snapshot_portfolios(day=DAY)
+        assert stats["portfolios"] == 3
+        assert stats["inserted"] == 2
+        assert stats["updated"] == 1
+        assert stats["positions"] == 3
+        assert stats["priced_from_close"] == 1
+        assert stats["duration_ms"] >= 0
+        assert daily_values() == {
+            (1, DAY): (600.0, 100.0),
+            (2, DAY): (3460.0, 3460.0 - 3050.0),
+            (3, DAY): (0.0, 0.0),
+        }
+
+        # Reexecução é idempotente: só atualiza
+        again = snapshot_portfolios([1, 99], DAY)
+        assert (again["inserted"], again["updated"], again["missing"]) == (0, 1, [99])
+        assert PortfolioDailyValue.query.count() == 3
+
+
+def test_snapshot_endpoints(client):
+    seed(client)
+    resp = client.post("/api/portfolio/snapshot", json={"ids": [1, 2], "date": DAY.isoformat()})
+    assert resp.status_code == 201
+    assert resp.get_json()["portfolios"] == 2
+
+    assert client.post("/api/portfolio/snapshot", json={"date": "ontem"}).status_code == 400
+    assert client.post("/api/portfolio/99/snapshot").status_code == 404
+    assert client.post("/api/portfolio/1/snapshot").status_code == 201
+    with client.application.app_context():
+        assert daily_values()[(1, date.today())] == (590.0, 90.0)
@@ -0,0 +1,94 @@
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Os scripts de dados_financeiros importam os módulos vizinhos pelo nome
+sys.path.insert(0, str(Path(__file__).parent / "dados_financeiros"))
+
+from bench_transform import legacy_transform  # noqa: E402
+from financials_backfill import CSV_DTYPES, select_current_rows, transform_dataframe  # noqa: E402
+
+CNPJ_TO_ID = {"11111111000111": 1, "22222222000122": 2}
+
+CSV = """CNPJ_CIA;DT_REFER;VERSAO;CD_CONTA;DS_CONTA;VL_CONTA;MOEDA;ESCALA_MOEDA;ORDEM_EXERC
+11.111.111/0001-11;2023-12-31;1;1;Ativo Total;10;REAL;MIL;ÚLTIMO
+11.111.111/0001-11;2023-12-31;1;1.01;Ativo Circulante;2.5;REAL;MILHÃO;ÚLTIMO
+11.111.111/0001-11;2023-12-31;1;1.01.01;Caixa;7;REAL;UNIDADE;ÚLTIMO
+22.222.222/0001-22;2023-12-31;2;1.01.02;Aplicações;3;REAL;mil;ÚLTIMO
+22.222.222/0001-22;2023-12-31;2;2.01;Passivo;4;REAL;BILHÃO;ÚLTIMO
+22.222.222/0001-22;2023-12-31;2;2.02;Sem escala;5;REAL;;ÚLTIMO
+22.222.222/0001-22;2023-12-31;2;2.03;Valor inválido;abc;REAL;MIL;ÚLTIMO
+33.333.333/0001-33;2023-12-31;1;1;Não monitorada;9;REAL;MIL;ÚLTIMO
+"""
+
+
+def read_csv(dtype):
+    return pd.read_csv(io.StringIO(CSV), sep=";", dtype=dtype)
+
+
+def test_transform_applies_scale_and_fixed_accounts():
+    df = transform_dataframe(read_csv(CSV_DTYPES), "DFP", "BPA_CON", CNPJ_TO_ID)
+
+    assert df["company_id"].tolist() == [1, 1, 1, 2, 2, 2]
+    assert df["account_value"].tolist() == [10_000, 2_500_000, 7, 3_000, 4, 5]
+    assert df["is_fixed"].tolist() == [True, True, False, False, True, True]
+    assert (df["report_type"] == "DFP").all()
+    assert (df["report_version"] == "BPA_CON").all()
+    assert "company_cnpj" not in df.columns
+
+
+def test_transform_matches_legacy_row_by_row_version():
+    legacy = legacy_transform(
+        read_csv({"CNPJ_CIA": str, "CD_CONTA": str}), "ITR", "BPA_IND", CNPJ_TO_ID
+    )
+    new = transform_dataframe(read_csv(CSV_DTYPES), "ITR", "BPA_IND", CNPJ_TO_ID)
+
+    pd.testing.assert_frame_equal(
+        legacy.reset_index(drop=True).astype(str),
+        new[legacy.columns].reset_index(drop=True).astype(str),
+    )
+
+
+def test_transform_without_monitored_companies_is_empty():
+    df = transform_dataframe(read_csv(CSV_DTYPES), "DFP", "BPA_CON", {})
+    assert df.empty
+
+
+# DRE do ITR: trimestre (DT_INI_EXERC no trimestre) e acumulado no ano, em duas versões
+ITR_DRE = """CNPJ_CIA;DT_REFER;VERSAO;DT_INI_EXERC;CD_CONTA;DS_CONTA;VL_CONTA;MOEDA;ESCALA_MOEDA;ORDEM_EXERC
+11.111.111/0001-11;2023-06-30;1;2023-04-01;3.01;Receita;40;REAL;UNIDADE;ÚLTIMO
+11.111.111/0001-11;2023-06-30;1;2023-01-01;3.01;Receita;70;REAL;UNIDADE;ÚLTIMO
+11.111.111/0001-11;2023-06-30;2;2023-04-01;3.01;Receita;45;REAL;UNIDADE;ÚLTIMO
+11.111.111/0001-11;2023-06-30;2;2023-01-01;3.01;Receita;75;REAL;UNIDADE;ÚLTIMO
+11.111.111/0001-11;2023-06-30;1;2022-01-01;3.01;Receita;60;REAL;UNIDADE;PENÚLTIMO
+11.111.111/0001-11;2023-06-30;1;2023-04-01;3.02;Custo;-20;REAL;UNIDADE;ÚLTIMO
+"""
+
+
+def read_itr_dre():
+    return pd.read_csv(io.StringIO(ITR_DRE), sep=";", dtype=CSV_DTYPES)
+
+
+def test_select_current_rows_keeps_latest_version_and_year_to_date():
+    df = select_current_rows(read_itr_dre())
+
+    assert df["CD_CONTA"].tolist() == ["3.01", "3.02"]
+    assert df["VL_CONTA"].tolist() == [75, -20]
+    assert df["DT_INI_EXERC"].tolist() == ["2023-01-01", "2023-04-01"]
+
+
+def test_select_current_rows_without_period_column_keeps_latest_version():
+    republished = read_csv(CSV_DTYPES).assign(VERSAO=9)
+    df = select_current_rows(pd.concat([republished, read_csv(CSV_DTYPES)], ignore_index=True))
+
+    assert len(df) == len(republished)
+    assert (df["VERSAO"] == 9).all()
+
+
+def test_transform_keeps_period_start_for_the_stage():
+    df = transform_dataframe(read_itr_dre(), "ITR", "DRE_CON", CNPJ_TO_ID)
+
+    assert df["period_start"].dt.strftime("%Y-%m-%d").tolist()[:2] == ["2023-04-01", "2023-01-01"]
+    assert "period_start" not in transform_dataframe(read_csv(CSV_DTYPES), "DFP", "BPA_CON", CNPJ_TO_ID)
@@ -0,0 +1,87 @@
+import datetime
+import sys
+from pathlib import Path
+
+from sqlalchemy.dialects import postgresql
+
+# Os scripts de dados_financeiros importam os módulos vizinhos pelo nome
+sys.path.insert(0, str(Path(__file__).parent / "dados_financeiros"))
+
+from financials_upsert import (  # noqa: E402
+    NATURAL_KEY,
+    UPSERT_CONFLICT,
+    UPSERT_WHERE,
+    upsert_rows,
+    version_number,
+    version_sql,
+)
+from models import CvmDocument  # noqa: E402
+
+
+class FakeSession:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        # Como no PostgreSQL sem conflitos: uma linha afetada por linha enviada
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        return type("Result", (), {"rowcount": sum(k.startswith("account_code") for k in params)})()
+
+
+def make_row(account_code, cvm_version, value):
+    return {
+        "company_id": 1, "reference_date": datetime.date(2023, 12, 31), "report_type": "DFP",
+        "report_version": "BPA_CON", "account_code": account_code, "cvm_version": cvm_version,
+        "account_name": "Conta", "account_value": value, "currency": "REAL", "is_fixed": True,
+    }
+
+
+def test_version_number_reads_the_digits():
+    assert version_number("2") == 2
+    assert version_number("v10") == 10
+    assert version_number(3) == 3
+    assert version_number("") == 0
+    assert version_number(None) == 0
+
+
+def test_version_sql_casts_the_digits_with_zero_default():
+    assert version_sql("stage.cvm_version") == (
+        "COALESCE(CAST(substring(stage.cvm_version FROM '[0-9]+') AS integer), 0)"
+    )
+
+
+def test_upsert_only_rewrites_newer_or_changed_rows():
+    new, old = version_sql("EXCLUDED.cvm_version"), version_sql("cvm_financial_data.cvm_version")
+
+    assert UPSERT_WHERE.startswith(f"{new} > {old} OR ({new} = {old} AND ")
+    assert "(EXCLUDED.account_name, EXCLUDED.account_value, EXCLUDED.currency, EXCLUDED.is_fixed) " \
+           "IS DISTINCT FROM (cvm_financial_data.account_name" in UPSERT_WHERE
+    assert UPSERT_CONFLICT == (
+        f"ON CONFLICT ({', '.join(NATURAL_KEY)}) DO UPDATE SET "
+        "cvm_version = EXCLUDED.cvm_version, account_name = EXCLUDED.account_name, "
+        "account_value = EXCLUDED.account_value, currency = EXCLUDED.currency, "
+        f"is_fixed = EXCLUDED.is_fixed WHERE {UPSERT_WHERE}"
+    )
+
+
+def test_upsert_rows_compiles_one_row_per_natural_key():
+    session = FakeSession()
+    rows = [make_row("1", "1", 10.0), make_row("1.01", "1", 5.0), make_row("1", "2", 12.0)]
+
+    assert upsert_rows(session, CvmDocument.__table__, rows) == 2
+
+    compiled = session.statements[0].compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+    assert f"ON CONFLICT ({', '.join(NATURAL_KEY)}) DO UPDATE SET" in sql
+    assert "cvm_version = excluded.cvm_version" in sql
+    assert sql.endswith(f"WHERE {UPSERT_WHERE}")
+    # A última linha de uma chave repetida vence
+    values = [v for k, v in compiled.params.items() if k.startswith("account_value")]
+    assert sorted(values) == [5.0, 12.0]
+
+
+def test_upsert_rows_without_rows_does_nothing():
+    session = FakeSession()
+    assert upsert_rows(session, CvmDocument.__table__, []) == 0
+    assert session.statements == []
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+from backend import db
+from backend.models import DailyQuote
+
+
+def _seed_quotes(client, symbol, days):
+    today = date.today()
+    with client.application.app_context():
+        db.session.add_all([
+            DailyQuote(
+                symbol=symbol, date=today - timedelta(days=offset),
+                open=10 + offset, high=11 + offset, low=9 + offset,
+                close=10.5 + offset, volume=1000,
+            )
+            for offset in days
+        ])
+        db.session.commit()
+
+
+def test_historical_returns_daily_bars_in_order(client):
+    _seed_quotes(client, "VALE3", [1, 3, 2, 400])
+
+    resp = client.get("/api/historical/vale3")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["ticker"] == "VALE3"
+    assert len(data["data"]) == 3
+    dates = [row["date"] for row in data["data"]]
+    assert dates == sorted(dates)
+    assert data["data"][-1]["close"] == 11.5
+
+
+def test_historical_filters_by_range(client):
+    _seed_quotes(client, "VALE3", [1, 2, 3])
+    start = (date.today() - timedelta(days=2)).isoformat()
+    end = (date.today() - timedelta(days=2)).isoformat()
+
+    resp = client.get(f"/api/historical/VALE3?start={start}&end={end}")
+    assert resp.status_code == 200
+    assert [row["date"] for row in resp.get_json()["data"]] == [start]
+
+
+def test_historical_returns_404_without_history(client):
+    resp = client.get("/api/historical/PETR4")
+    assert resp.status_code == 404
+
+
+def test_historical_rejects_invalid_date(client):
+    resp = client.get("/api/historical/VALE3?start=2024-13-01")
+    assert resp.status_code == 400
@@ -15,3 +15,26 @@ def test_get_ibov_history(monkeypatch, client):
     data = resp.get_json()
     assert data['success'] is True
     assert len(data['history']) == 3
+
+
+def test_get_ibov_history_reads_daily_quotes(monkeypatch, client):
+    from datetime import date, timedelta
+    from backend import db
+    from backend.models import DailyQuote
+    from backend.routes import market_routes
+
+    def fail_download(*args, **kwargs):
+        raise AssertionError("yfinance não deve ser chamado")
+
+    monkeypatch.setattr(market_routes, 'yf', type('obj', (), {'download': fail_download}))
+    with client.application.app_context():
+        db.session.add_all([
+            DailyQuote(symbol="IBOV", date=date.today() - timedelta(days=d), close=120000 + d)
+            for d in (1, 2)
+        ])
+        db.session.commit()
+
+    resp = client.get('/api/market/ibov-history')
+    assert resp.status_code == 200
+    history = resp.get_json()['history']
+    assert [h['close'] for h in history] == [120002.0, 120001.0]
@@ -0,0 +1,112 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from backend import db
+from backend.models import (
+    DailyQuote,
+    Portfolio,
+    PortfolioDailyMetric,
+    PortfolioDailyValue,
+    PortfolioPosition,
+    Ticker,
+)
+from backend.services.eod_snapshot import snapshot_portfolios
+from backend.services.nav_engine import nav_series, rebuild_nav
+
+
+def test_nav_series_supports_position_matrix():
+    closes = np.array([[10.0, 20.0], [11.0, 19.0]])
+    constant = nav_series(closes, np.array([1.0, 2.0]), np.array([9.0, 21.0]))
+    assert constant["total_value"].tolist() == [50.0, 49.0]
+    assert constant["total_cost"].tolist() == [51.0, 51.0]
+
+    history = nav_series(closes, np.array([[1.0, 2.0], [2.0, 2.0]]), np.array([9.0, 21.0]))
+    assert history["total_value"].tolist() == [50.0, 60.0]
+    assert history["total_gain_percent"][1] == pytest.approx((60 - 60) / 60 * 100)
+
+
+def seed(client, first_metric=date(2024, 1, 2)):
+    with client.application.app_context():
+        db.session.add_all([
+            # Primeiro registro real do portfólio: limita o início da reconstrução
+            PortfolioDailyMetric(portfolio_id=1, metric_id="qtdCotas", value=1, date=first_metric),
+            Ticker(symbol="VALE3", type="stock"),
+            Ticker(symbol="PETR4", type="stock"),
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=50),
+            PortfolioPosition(portfolio_id=1, symbol="PETR4", quantity=100, avg_price=30),
+            DailyQuote(symbol="VALE3", date=date(2024, 1, 2), close=60),
+            DailyQuote(symbol="PETR4", date=date(2024, 1, 2), close=35),
+            DailyQuote(symbol="VALE3", date=date(2024, 1, 3), close=62),
+            # PETR4 sem negócio em 03/01: usa o fechamento anterior
+            DailyQuote(symbol="VALE3", date=date(2024, 1, 4), close=61),
+            DailyQuote(symbol="PETR4", date=date(2024, 1, 4), close=36),
+            PortfolioDailyValue(
+                portfolio_id=1, date=date(2024, 1, 4), total_value=1, total_cost=1,
+                total_gain=0, total_gain_percent=0,
+            ),
+        ])
+        db.session.commit()
+
+
+def test_rebuild_fills_only_missing_days(client):
+    seed(client)
+    with client.application.app_context():
+        inserted = rebuild_nav([1], date(2024, 1, 1), date(2024, 1, 31))
+        assert inserted == {1: 2}
+        values = {
+            v.date: float(v.total_value)
+            for v in PortfolioDailyValue.query.filter_by(portfolio_id=1)
+        }
+        assert values == {
+            date(2024, 1, 2): 4100.0,
+            date(2024, 1, 3): 4120.0,
+            date(2024, 1, 4): 1.0,
+        }
+        flags = {
+            v.date: v.is_reconstructed
+            for v in PortfolioDailyValue.query.filter_by(portfolio_id=1)
+        }
+        assert flags == {date(2024, 1, 2): True, date(2024, 1, 3): True, date(2024, 1, 4): False}
+        assert rebuild_nav([1], date(2024, 1, 1), date(2024, 1, 31)) == {1: 0}
+
+    resp = client.get("/api/portfolio/1/daily-values")
+    values = resp.get_json()["values"]
+    assert [v["date"] for v in values] == ["2024-01-02", "2024-01-03", "2024-01-04"]
+    assert [v["is_reconstructed"] for v in values] == [True, True, False]
+
+
+def test_rebuild_skips_dates_without_all_closes(client):
+    seed(client)
+    with client.application.app_context():
+        db.session.add(PortfolioPosition(portfolio_id=1, symbol="ITUB4", quantity=1, avg_price=1))
+        db.session.add(Ticker(symbol="ITUB4", type="stock"))
+        db.session.add(DailyQuote(symbol="ITUB4", date=date(2024, 1, 3), close=30))
+        db.session.commit()
+
+        assert rebuild_nav([1], date(2024, 1, 1), date(2024, 1, 31)) == {1: 1}
+        assert rebuild_nav([99]) == {99: 0}
+
+
+def test_rebuild_starts_at_first_real_record(client):
+    seed(client, first_metric=date(2024, 1, 3))
+    with client.application.app_context():
+        assert rebuild_nav([1], date(2023, 1, 1), date(2024, 1, 31)) == {1: 1}
+        assert {v.date for v in PortfolioDailyValue.query} == {date(2024, 1, 3), date(2024, 1, 4)}
+
+        db.session.add(Portfolio(id=2, name="Sem registros"))
+        db.session.add(PortfolioPosition(portfolio_id=2, symbol="VALE3", quantity=1, avg_price=1))
+        db.session.commit()
+        assert rebuild_nav([2], date(2024, 1, 1), date(2024, 1, 31)) == {2: 0}
+
+
+def test_real_snapshot_replaces_reconstructed_day(client):
+    seed(client)
+    with client.application.app_context():
+        rebuild_nav([1], date(2024, 1, 1), date(2024, 1, 31))
+        snapshot_portfolios([1], date(2024, 1, 3))
+
+        day = PortfolioDailyValue.query.filter_by(portfolio_id=1, date=date(2024, 1, 3)).one()
+        assert day.is_reconstructed is False
@@ -0,0 +1,125 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend import db
+from backend.models import AssetMetrics, Company, Portfolio, PortfolioPosition, Ticker
+from backend.services import portfolio_valuation
+from backend.services.portfolio_cache import PortfolioSummaryCache, portfolio_summary_cache
+from backend.services.quote_cache import quote_cache
+
+
+def fake_valuation(symbols):
+    return (SimpleNamespace(symbols=symbols), {"total_value": 1.0})
+
+
+def test_cache_reuses_value_until_invalidated():
+    cache = PortfolioSummaryCache(ttl_seconds=60)
+    calls = []
+
+    def compute(pid):
+        calls.append(pid)
+        return fake_valuation(["VALE3"])
+
+    first = cache.get_or_compute(1, compute)
+    assert cache.get_or_compute(1, compute) is first
+    assert calls == [1]
+
+    cache.invalidate(1)
+    cache.get_or_compute(1, compute)
+    assert calls == [1, 1]
+    assert cache.stats["hits"] == 1
+
+
+def test_price_notification_reprices_only_portfolios_holding_symbol():
+    cache = PortfolioSummaryCache(ttl_seconds=60)
+    cache.get_or_compute(1, lambda pid: fake_valuation(["VALE3"]))
+    cache.get_or_compute(2, lambda pid: fake_valuation(["PETR4"]))
+    repriced = []
+
+    def reprice(values, prices):
+        repriced.append([value[0].symbols for value in values])
+        return [(value[0], {"total_value": prices["VALE3"]}) for value in values]
+
+    cache.notify_prices({"VALE3": 12.0}, reprice)
+    assert repriced == [[["VALE3"]]]
+    assert len(cache) == 2
+    assert cache.get_or_compute(1, lambda pid: None)[1]["total_value"] == 12.0
+    assert cache.get_or_compute(2, lambda pid: None)[1]["total_value"] == 1.0
+    assert cache.stats["repriced"] == 1
+
+
+def test_missing_portfolio_is_not_cached():
+    cache = PortfolioSummaryCache(ttl_seconds=60)
+    assert cache.get_or_compute(1, lambda pid: None) is None
+    assert len(cache) == 0
+
+
+def test_page_load_computes_book_once(client, monkeypatch):
+    with client.application.app_context():
+        db.session.add_all([
+            Company(id=1, company_name="Vale"),
+            Ticker(symbol="VALE3", company_id=1, type="stock"),
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=5),
+            AssetMetrics(symbol="VALE3", last_price=10, price_change_percent=2, sector="Materials"),
+        ])
+        db.session.commit()
+
+    loads = []
+    original = portfolio_valuation.load_portfolio_book
+
+    def counting_load(pid):
+        loads.append(pid)
+        return original(pid)
+
+    monkeypatch.setattr(portfolio_valuation, "load_portfolio_book", counting_load)
+
+    for endpoint in ("summary", "daily-contribution", "suggested", "sector-weights"):
+        assert client.get(f"/api/portfolio/1/{endpoint}").status_code == 200
+    assert loads == [1]
+    assert client.get("/api/portfolio/1/suggested").get_json()["assets"][0]["company"] == "Vale"
+
+    payload = [{"symbol": "VALE3", "quantity": 20, "avg_price": 5}]
+    assert client.post("/api/portfolio/1/positions", json=payload).status_code == 201
+    summary = client.get("/api/portfolio/1/summary").get_json()["portfolio"]
+    assert summary["total_value"] == 200.0
+    assert loads == [1, 1]
+    assert portfolio_summary_cache.version(1) == 1
+
+
+def test_live_prices_reprice_cached_valuation_without_reload(client, monkeypatch):
+    with client.application.app_context():
+        db.session.add_all([
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=5),
+            PortfolioPosition(portfolio_id=1, symbol="PETR4", quantity=1, avg_price=30),
+            AssetMetrics(symbol="VALE3", last_price=10, previous_close=8, price_change_percent=25),
+            AssetMetrics(symbol="PETR4", last_price=30),
+        ])
+        db.session.commit()
+
+        loads = []
+        original = portfolio_valuation.load_portfolio_book
+
+        def counting_load(pid):
+            loads.append(pid)
+            return original(pid)
+
+        monkeypatch.setattr(portfolio_valuation, "load_portfolio_book", counting_load)
+
+        assert portfolio_valuation.get_portfolio_valuation(1)[1]["total_value"] == 130.0
+        portfolio_valuation.reprice_cached_valuations({"VALE3": 12.0})
+        book, summary = portfolio_valuation.get_portfolio_valuation(1)
+        assert summary["total_value"] == 150.0
+        assert book.last_price.tolist() == [12.0, 30.0]
+        # Variação diária recalculada sobre o fechamento anterior, não a do scraper
+        vale = summary["holdings"][0]
+        assert vale["daily_change_pct"] == pytest.approx(50.0)
+        assert vale["contribution"] == pytest.approx(50.0 * 120 / 150)
+        assert loads == [1]
+
+        # Recalculado (ex.: após invalidate), usa o quote_cache em vez do asset_metrics
+        quote_cache.put("PETR4", {"symbol": "PETR4", "price": 31.0})
+        portfolio_summary_cache.invalidate(1)
+        assert portfolio_valuation.get_portfolio_valuation(1)[1]["total_value"] == 131.0
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+import time
+
+import numpy as np
+import pytest
+
+from backend import db
+from backend.models import DailyQuote, Portfolio, PortfolioPosition, Ticker
+from backend.services import portfolio_risk
+from backend.services.portfolio_risk import compute_risk, max_drawdown, return_matrix
+
+
+def test_compute_risk_against_reference_formulas():
+    rng = np.random.default_rng(7)
+    bench = rng.normal(0, 0.01, 500)
+    returns = np.column_stack([bench * 1.5 + rng.normal(0, 0.002, 500), rng.normal(0, 0.02, 500)])
+    weights = np.array([0.6, 0.4])
+
+    risk = compute_risk(returns, weights, bench, window=21)
+    portfolio = returns @ weights
+
+    assert risk["volatility"] == pytest.approx(portfolio.std(ddof=1) * np.sqrt(252))
+    assert risk["beta"] == pytest.approx(np.cov(portfolio, bench)[0, 1] / bench.var(ddof=1))
+    assert risk["asset_beta"][0] == pytest.approx(1.5, abs=0.05)
+    assert risk["tracking_error"] == pytest.approx((portfolio - bench).std(ddof=1) * np.sqrt(252))
+    assert risk["var"]["historical"]["0.95"] == pytest.approx(-np.percentile(portfolio, 5))
+    assert len(risk["rolling_volatility"]) == 500 - 20
+    assert risk["rolling_volatility"][-1] == pytest.approx(portfolio[-21:].std(ddof=1) * np.sqrt(252))
+
+
+def test_max_drawdown_and_missing_prices():
+    assert max_drawdown(np.array([0.1, -0.5, 0.2])) == pytest.approx(-0.5)
+    closes = np.array([[10.0, np.nan], [11.0, 5.0], [11.0, 5.5]])
+    assert return_matrix(closes).tolist() == [[pytest.approx(0.1), 0.0], [0.0, pytest.approx(0.1)]]
+
+
+def test_risk_endpoint_uses_daily_quotes(client):
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(40)]
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=50),
+        ])
+        for i, day in enumerate(days):
+            ibov = 100 * (1 + 0.01 * ((-1) ** i))
+            db.session.add(DailyQuote(symbol="IBOV", date=day, close=ibov))
+            db.session.add(DailyQuote(symbol="VALE3", date=day, close=ibov / 2))
+        db.session.commit()
+
+    resp = client.get("/api/portfolio/1/risk?start=2024-01-01&end=2024-03-01&window=10")
+    assert resp.status_code == 200
+    risk = resp.get_json()["risk"]
+    assert risk["observations"] == 39
+    assert risk["beta"] == pytest.approx(1.0)
+    assert risk["tracking_error"] == pytest.approx(0.0, abs=1e-9)
+    assert risk["holdings"][0]["weight"] == pytest.approx(1.0)
+    assert len(risk["rolling_volatility"]["values"]) == 30
+
+    assert client.get("/api/portfolio/99/risk").status_code == 404
+    assert client.get("/api/portfolio/1/risk?window=1").status_code == 400
+
+
+def test_risk_cache_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(portfolio_risk, "CACHE_MAX_ENTRIES", 3)
+    with client.application.app_context():
+        db.session.add(Portfolio(id=1, name="P1"))
+        db.session.commit()
+
+    for window in range(2, 10):
+        assert client.get(f"/api/portfolio/1/risk?window={window}").status_code == 200
+    assert len(portfolio_risk._cache) == 3
+    assert [key[-1] for key in portfolio_risk._cache] == [7, 8, 9]
+
+
+def test_compute_risk_is_fast_for_large_book():
+    rng = np.random.default_rng(1)
+    returns = rng.normal(0, 0.02, (1260, 200))
+    weights = np.full(200, 1 / 200)
+    started = time.perf_counter()
+    compute_risk(returns, weights, returns.mean(axis=1), window=21)
+    assert time.perf_counter() - started < 0.5
@@ -131,3 +131,66 @@ def test_get_sector_weights_returns_data(client):
     assert round(weight["portfolioWeight"], 2) == 100.0
 
 
+def test_upsert_positions_bulk_reports_outcomes(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=1, avg_price=1),
+        ])
+        db.session.commit()
+
+    payload = [
+        {"symbol": "VALE3", "quantity": 10, "avg_price": 5},
+        {"symbol": "PETR4", "quantity": 3, "avg_price": 30, "type": "stock"},
+        {"symbol": "PETR4", "quantity": 4, "avg_price": 31, "type": "stock"},
+        {"quantity": 1},
+    ]
+    resp = client.post("/api/portfolio/1/positions", json=payload)
+    assert resp.status_code == 201
+    body = resp.get_json()
+    assert (body["inserted"], body["updated"], body["skipped"]) == (1, 1, 1)
+    assert body["duplicates"] == 1
+    assert body["tickers_created"] == 1
+
+    with client.application.app_context():
+        positions = {
+            p.symbol: (float(p.quantity), float(p.avg_price))
+            for p in PortfolioPosition.query.filter_by(portfolio_id=1)
+        }
+        assert positions == {"VALE3": (10.0, 5.0), "PETR4": (4.0, 31.0)}
+
+
+def test_update_daily_metrics_backfill_then_columnar_read(client):
+    with client.application.app_context():
+        db.session.add(Portfolio(id=1, name="P1"))
+        db.session.commit()
+
+    payload = [
+        {"id": "cotaD1", "value": 100, "date": "2024-01-02"},
+        {"id": "qtdCotas", "value": 10, "date": "2024-01-02"},
+        {"id": "cotaD1", "value": 101, "date": "2024-01-03"},
+        {"id": "cotaD1", "value": 102, "date": "2024-01-03"},
+    ]
+    resp = client.post("/api/portfolio/1/daily-metrics", json=payload)
+    assert resp.status_code == 201
+    assert resp.get_json()["upserted"] == 3
+
+    resp = client.get("/api/portfolio/1/daily-metrics?start=2024-01-01&end=2024-01-31")
+    data = resp.get_json()
+    assert data["dates"] == ["2024-01-02", "2024-01-03"]
+    assert data["metrics"] == {"cotaD1": [100.0, 102.0], "qtdCotas": [10.0, None]}
+
+    resp = client.get("/api/portfolio/1/daily-metrics?start=2024-01-01&end=2024-01-31&metrics=qtdCotas")
+    assert resp.get_json()["metrics"] == {"qtdCotas": [10.0]}
+
+
+def test_daily_metrics_rejects_bad_dates(client):
+    with client.application.app_context():
+        db.session.add(Portfolio(id=1, name="P1"))
+        db.session.commit()
+
+    resp = client.post("/api/portfolio/1/daily-metrics", json=[{"id": "x", "value": 1, "date": "02/01/2024"}])
+    assert resp.status_code == 400
+    assert client.get("/api/portfolio/1/daily-metrics?start=abc").status_code == 400
+    assert client.get("/api/portfolio/99/daily-metrics").status_code == 404
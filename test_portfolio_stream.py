@@ -0,0 +1,98 @@
+import pytest
+
+from backend.services.portfolio_stream import LivePortfolio, PortfolioStream
+from backend.services.portfolio_valuation import PortfolioBook, value_book
+
+
+def make_live(portfolio_id=1):
+    book = PortfolioBook(portfolio_id, "P1", [
+        ("VALE3", 10, 50, 60, 20, 0, 100, None, "Materials", "Vale"),
+        ("PETR4", 100, 30, 35, 0, 0, 100, None, "Energy", "Petrobras"),
+    ])
+    return LivePortfolio(book, value_book(book), {"qtdCotas": 41.0, "cotaD1": 100.0})
+
+
+def test_apply_prices_updates_only_changed_holdings():
+    live = make_live()
+    assert live.total_value == 4100.0
+
+    delta = live.apply_prices({"VALE3": 66.0, "ITUB4": 30.0})
+
+    assert delta["seq"] == 1
+    assert delta["total_value"] == pytest.approx(4160.0)
+    assert delta["valor_cota"] == pytest.approx(4160.0 / 41)
+    assert delta["variacao_cota_pct"] == pytest.approx((4160.0 / 41 / 100 - 1) * 100)
+    [holding] = delta["holdings"]
+    assert holding["symbol"] == "VALE3"
+    assert holding["daily_change_pct"] == pytest.approx(32.0)  # referência 50
+    assert holding["contribution"] == pytest.approx(32.0 * (660 / 4160.0))
+
+
+def test_reference_price_is_the_previous_close():
+    # Variação do scraper desatualizada (0) frente ao fechamento anterior guardado
+    book = PortfolioBook(1, "P1", [
+        ("VALE3", 10, 50, 60, 0, 0, 100, None, None, None, 50),
+        ("PETR4", 100, 30, 35, 0, 0, 100, None, None, None),
+    ])
+    live = LivePortfolio(book, value_book(book), {})
+    assert live.snapshot()["holdings"][0]["daily_change_pct"] == pytest.approx(20.0)
+
+    # Book já reprecificado pelo tick: a referência continua o fechamento anterior
+    live_book = book.with_prices({"PETR4": 42.0})
+    live = LivePortfolio(live_book, value_book(live_book), {})
+    assert live.snapshot()["holdings"][1]["daily_change_pct"] == pytest.approx(20.0)
+    delta = live.apply_prices({"VALE3": 55.0})
+    assert delta["holdings"][0]["daily_change_pct"] == pytest.approx(10.0)
+
+
+def test_unchanged_price_produces_no_delta():
+    live = make_live()
+    assert live.apply_prices({"PETR4": 35.0}) is None
+    assert live.seq == 0
+
+
+def test_snapshot_matches_summary_for_unchanged_book():
+    live = make_live()
+    snapshot = live.snapshot()
+    assert [h["symbol"] for h in snapshot["holdings"]] == ["VALE3", "PETR4"]
+    assert snapshot["holdings"][0]["daily_change_pct"] == pytest.approx(20.0)
+    assert snapshot["holdings"][0]["contribution"] == pytest.approx(20.0 * 600 / 4100)
+
+
+def test_stream_loads_once_and_drops_with_last_subscriber():
+    stream = PortfolioStream()
+    loads = []
+
+    def load(pid):
+        loads.append(pid)
+        return make_live(pid)
+
+    stream.subscribe("sid-a", 1, load)
+    stream.subscribe("sid-b", 1, load)
+    assert loads == [1]
+    assert stream.symbols() == {"VALE3", "PETR4"}
+
+    assert stream.unsubscribe("sid-a", 1) == set()
+    assert stream.remove_room("sid-b") == {"VALE3", "PETR4"}
+    assert not stream
+
+
+def test_stream_returns_updates_per_portfolio():
+    stream = PortfolioStream()
+    stream.subscribe("sid-a", 1, make_live)
+    stream.subscribe("sid-a", 2, make_live)
+
+    updates = stream.apply_prices({"PETR4": 36.0})
+    assert [pid for pid, _ in updates] == [1, 2]
+    assert stream.subscribe("sid-b", 3, lambda pid: None) is None
+
+
+def test_refresh_keeps_live_prices():
+    stream = PortfolioStream()
+    stream.subscribe("sid-a", 1, make_live)
+    stream.apply_prices({"VALE3": 70.0})
+
+    assert stream.refresh(1, make_live) == (set(), set())
+    [(_, delta)] = stream.apply_prices({"PETR4": 36.0})
+    assert delta["total_value"] == pytest.approx(700 + 3600)
+    assert delta["seq"] == 3
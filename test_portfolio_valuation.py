@@ -0,0 +1,166 @@
+from datetime import date
+
+import pytest
+
+from backend import db
+from backend.models import AssetMetrics, Portfolio, PortfolioDailyMetric, PortfolioPosition, Ticker
+from backend.services.portfolio_valuation import (
+    PortfolioBook,
+    aggregate_exposure,
+    load_portfolio_book,
+    value_book,
+    value_books,
+)
+
+
+def make_book(rows):
+    return PortfolioBook(1, "P1", rows)
+
+
+def test_value_book_matches_per_position_formulas():
+    book = make_book([
+        ("VALE3", 10, 5, 10, 2, 0, 100, None, "Materials", "Vale"),
+        ("PETR4", -20, 30, 25, -1, 0, 100, None, "Energy", "Petrobras"),
+        ("ITUB4", 5, 20, None, None, 0, 100, None, None, None),
+    ])
+    summary = value_book(book, {"qtdCotas": 10.0, "cotaD1": -40.0})
+
+    vale, petr, itub = summary["holdings"]
+    assert summary["total_value"] == pytest.approx(100 - 500)
+    assert summary["total_cost"] == pytest.approx(50 - 600 + 100)
+    assert vale["gain_percent"] == pytest.approx(100.0)
+    assert vale["position_pct"] == pytest.approx(100 / -400 * 100)
+    assert petr["contribution"] == pytest.approx(-1 * (-500 / -400 * 100) / 100)
+    assert itub["last_price"] == 0.0
+    assert itub["adjustment_qty"] == 0.0
+    assert vale["adjustment_qty"] == pytest.approx(-vale["position_pct"] / 100 * -400 / 10)
+    assert summary["posicao_comprada_pct"] == pytest.approx(100 / -400 * 100)
+    assert summary["valor_cota"] == pytest.approx(-40.0)
+    assert summary["variacao_cota_pct"] == pytest.approx(0.0)
+
+
+def test_with_prices_recomputes_daily_change_from_previous_close():
+    book = make_book([
+        ("VALE3", 10, 5, 10, 25, 0, 100, None, None, None, 8),
+        ("PETR4", 1, 30, 30, 20, 0, 100, None, None, None),
+    ])
+    repriced = book.with_prices({"VALE3": 12.0, "PETR4": 36.0})
+
+    # VALE3 usa o fechamento guardado; PETR4 o derivado do scraper (30 / 1,2)
+    assert repriced.daily_change_pct.tolist() == pytest.approx([50.0, 44.0])
+    assert book.daily_change_pct.tolist() == [25.0, 20.0]
+    assert value_book(repriced)["holdings"][1]["contribution"] == pytest.approx(44.0 * 36 / 156)
+
+
+def test_value_book_handles_empty_portfolio():
+    summary = value_book(make_book([]))
+    assert summary["holdings"] == []
+    assert summary["total_value"] == 0.0
+    assert summary["exposicao_total_pct"] == 0.0
+
+
+def test_load_portfolio_book_single_query(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Ticker(symbol="BBAS3", type="stock"),
+            Portfolio(id=1, name="P1"),
+            Portfolio(id=2, name="Vazio"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=5),
+            PortfolioPosition(portfolio_id=1, symbol="BBAS3", quantity=4, avg_price=20),
+            AssetMetrics(symbol="VALE3", last_price=10, price_change_percent=2, sector="Materials"),
+            PortfolioDailyMetric(portfolio_id=1, metric_id="qtdCotas", value=10, date=date.today()),
+        ])
+        db.session.commit()
+
+        book = load_portfolio_book(1)
+        assert book.symbols == ["VALE3", "BBAS3"]
+        assert book.last_price.tolist() == [10.0, 0.0]
+        assert book.sectors == ["Materials", None]
+
+        assert len(load_portfolio_book(2)) == 0
+        assert load_portfolio_book(99) is None
+
+    resp = client.get("/api/portfolio/1/summary")
+    portfolio = resp.get_json()["portfolio"]
+    assert portfolio["total_value"] == 100.0
+    assert portfolio["valor_cota"] == 10.0
+    assert [h["symbol"] for h in portfolio["holdings"]] == ["VALE3", "BBAS3"]
+
+
+def test_value_books_matches_value_book_per_portfolio():
+    books = [
+        PortfolioBook(1, "P1", [
+            ("VALE3", 10, 5, 10, 2, 50, 100, None, "Materials", "Vale"),
+            ("PETR4", -20, 30, 25, -1, 0, 100, None, "Energy", "Petrobras"),
+        ]),
+        PortfolioBook(2, "Vazio", []),
+        PortfolioBook(3, "P3", [("VALE3", 5, 8, 10, 2, 0, 100, None, "Materials", "Vale")]),
+    ]
+    metrics = {1: {"qtdCotas": 10.0}, 3: {"cotaD1": 2.0}}
+
+    batch = value_books(books, metrics)
+    assert batch == [value_book(book, metrics.get(book.id)) for book in books]
+
+
+def test_aggregate_exposure_rolls_up_by_symbol_and_sector():
+    books = [
+        PortfolioBook(1, "P1", [
+            ("VALE3", 10, 5, 10, 2, 0, 100, None, "Materials", "Vale"),
+            ("PETR4", -4, 30, 25, -1, 0, 100, None, "Energy", "Petrobras"),
+        ]),
+        PortfolioBook(2, "P2", [
+            ("VALE3", 5, 8, 10, 2, 0, 100, None, "Materials", "Vale"),
+            ("GGBR4", 20, 1, 2, 0, 0, 100, None, "Materials", None),
+            ("XPTO3", 1, 1, None, None, 0, 100, None, None, None),
+        ]),
+    ]
+    rollup = aggregate_exposure(books)
+
+    assert rollup["total_value"] == pytest.approx(150 - 100 + 40)
+    by_symbol = {row["symbol"]: row for row in rollup["by_symbol"]}
+    assert by_symbol["VALE3"]["quantity"] == 15
+    assert by_symbol["VALE3"]["value"] == 150
+    assert by_symbol["VALE3"]["portfolios"] == 2
+    assert by_symbol["VALE3"]["weight_pct"] == pytest.approx(150 / 90 * 100)
+    assert rollup["by_symbol"][0]["symbol"] == "VALE3"
+
+    by_sector = {row["sector"]: row for row in rollup["by_sector"]}
+    assert by_sector["Materials"]["value"] == 190
+    assert by_sector["Materials"]["symbols"] == 2
+    assert by_sector["Energy"]["value"] == -100
+    assert by_sector[None]["value"] == 0
+    assert rollup["posicao_vendida_pct"] == pytest.approx(100 / 90 * 100)
+
+
+def test_multi_portfolio_summary_endpoint(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Ticker(symbol="BBAS3", type="stock"),
+            Portfolio(id=1, name="P1"),
+            Portfolio(id=2, name="P2"),
+            Portfolio(id=3, name="Vazio"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=10, avg_price=5),
+            PortfolioPosition(portfolio_id=2, symbol="VALE3", quantity=5, avg_price=5),
+            PortfolioPosition(portfolio_id=2, symbol="BBAS3", quantity=4, avg_price=20),
+            AssetMetrics(symbol="VALE3", last_price=10, sector="Materials"),
+            AssetMetrics(symbol="BBAS3", last_price=25, sector="Financials"),
+        ])
+        db.session.commit()
+
+    data = client.get("/api/portfolio/summary?ids=2,1,99&ids=3").get_json()
+    assert [p["id"] for p in data["portfolios"]] == [2, 1, 3]
+    assert data["missing"] == [99]
+    assert data["portfolios"][0]["total_value"] == 150.0
+    assert data["rollup"]["total_value"] == 250.0
+    assert data["rollup"]["by_symbol"][0] == {
+        "symbol": "VALE3", "company": None, "sector": "Materials",
+        "quantity": 15.0, "value": 150.0, "weight_pct": 60.0, "portfolios": 2,
+    }
+    assert [s["sector"] for s in data["rollup"]["by_sector"]] == ["Materials", "Financials"]
+
+    # Sem ids considera todos; a valoração é reaproveitada pelo endpoint individual
+    assert len(client.get("/api/portfolio/summary").get_json()["portfolios"]) == 3
+    assert client.get("/api/portfolio/2/summary").get_json()["portfolio"] == data["portfolios"][0]
+    assert client.get("/api/portfolio/summary?ids=a").status_code == 400
@@ -0,0 +1,33 @@
+from backend.services import quote_cache as qc
+
+
+def test_get_many_splits_fresh_and_stale(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(qc.time, "monotonic", lambda: now[0])
+    cache = qc.QuoteCache(max_age_seconds=5)
+
+    cache.put("VALE3", {"symbol": "VALE3", "last": 60.0})
+    now[0] += 3
+    cache.put("PETR4", {"symbol": "PETR4", "last": 35.0})
+    now[0] += 3
+
+    found, missing = cache.get_many(["VALE3", "PETR4", "ITUB4"])
+    assert list(found) == ["PETR4"]
+    assert found["PETR4"]["age_ms"] == 3000.0
+    assert missing == ["VALE3", "ITUB4"]
+
+    found, _ = cache.get_many(["VALE3"], max_age=10)
+    assert found["VALE3"]["last"] == 60.0
+
+
+def test_touch_refreshes_age_without_changing_quote(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(qc.time, "monotonic", lambda: now[0])
+    cache = qc.QuoteCache(max_age_seconds=1)
+
+    cache.put("VALE3", {"last": 60.0})
+    now[0] = 5
+    cache.touch(["VALE3", "PETR4"])
+
+    assert cache.get("VALE3") == {"last": 60.0, "age_ms": 0.0}
+    assert cache.get("PETR4") is None
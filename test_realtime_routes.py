@@ -0,0 +1,93 @@
+import pytest
+
+from backend.routes import realtime_routes
+from backend.services.quote_cache import quote_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_quote_cache():
+    quote_cache.clear()
+    yield
+    quote_cache.clear()
+
+
+class FakeWorker:
+    mt5_connected = True
+
+    def __init__(self):
+        self.fetched = []
+        self.watched = []
+
+    def get_mt5_quote(self, symbol):
+        self.fetched.append(symbol)
+        if symbol == "XXXX3":
+            return None
+        return {"symbol": symbol, "last": 1.0}
+
+    def watch_symbols(self, symbols):
+        self.watched.extend(symbols)
+
+    def get_bars(self, symbol, timeframe, limit):
+        if symbol != "VALE3":
+            return None
+        return [{"time": "2024-01-01T10:00:00", "open": 1, "high": 2,
+                 "low": 1, "close": 2, "volume": 10, "ticks": 3}][:limit]
+
+
+def test_bars_returns_503_without_worker(client, monkeypatch):
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: None)
+    resp = client.get("/api/realtime/bars/VALE3")
+    assert resp.status_code == 503
+
+
+def test_bars_returns_intraday_bars(client, monkeypatch):
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: FakeWorker())
+    resp = client.get("/api/realtime/bars/vale3?timeframe=5m&limit=1")
+    assert resp.status_code == 200
+    data = resp.get_json()["data"]
+    assert data["symbol"] == "VALE3"
+    assert data["timeframe"] == "5m"
+    assert data["bars"][0]["close"] == 2
+
+
+def test_bars_rejects_unknown_timeframe(client, monkeypatch):
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: FakeWorker())
+    resp = client.get("/api/realtime/bars/VALE3?timeframe=1h")
+    assert resp.status_code == 400
+
+
+def test_bars_returns_404_for_symbol_without_ticks(client, monkeypatch):
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: FakeWorker())
+    resp = client.get("/api/realtime/bars/PETR4")
+    assert resp.status_code == 404
+
+
+def test_quotes_served_from_cache_without_mt5_calls(client, monkeypatch):
+    worker = FakeWorker()
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: worker)
+    quote_cache.put_many({
+        "VALE3": {"symbol": "VALE3", "last": 60.0},
+        "PETR4": {"symbol": "PETR4", "last": 35.0},
+    })
+
+    resp = client.get("/api/realtime/quotes?tickers=vale3,petr4")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert set(body["data"]) == {"VALE3", "PETR4"}
+    assert "age_ms" in body["data"]["VALE3"]
+    assert body["missing"] == []
+    assert worker.fetched == []
+
+
+def test_quotes_fetch_cache_misses_once_and_watch_them(client, monkeypatch):
+    worker = FakeWorker()
+    monkeypatch.setattr(realtime_routes, "get_rtd_worker", lambda: worker)
+
+    resp = client.get("/api/realtime/quotes?tickers=ITUB4&tickers=XXXX3")
+    body = resp.get_json()
+    assert body["data"]["ITUB4"]["age_ms"] == 0.0
+    assert body["missing"] == ["XXXX3"]
+    assert worker.watched == ["ITUB4", "XXXX3"]
+
+    client.get("/api/realtime/quotes?tickers=ITUB4")
+    assert worker.fetched == ["ITUB4", "XXXX3"]
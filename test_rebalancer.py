@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from backend import db
+from backend.models import AssetMetrics, Portfolio, PortfolioPosition, Ticker
+from backend.services import rebalancer
+from backend.services.rebalancer import solve_rebalance
+
+
+def test_trades_are_rounded_to_lots():
+    quantity = np.array([1000.0, 0.0, 150.0])
+    price = np.array([10.0, 20.0, 5.0])
+    target = np.array([50.0, 50.0, 0.0])
+    lots = np.array([100.0, 100.0, 100.0])
+
+    solution = solve_rebalance(quantity, price, target, lots)
+
+    # NAV 10750: alvo 5375 em cada ativo
+    assert solution["trade_qty"].tolist() == [-500.0, 300.0, -150.0]
+    assert np.all(solution["trade_qty"][:2] % 100 == 0)
+
+
+def test_turnover_budget_is_respected():
+    rng = np.random.default_rng(3)
+    n = 300
+    quantity = rng.integers(0, 50, n) * 100.0
+    price = rng.uniform(5, 80, n)
+    target = np.full(n, 100 / n)
+    lots = np.full(n, 100.0)
+
+    unconstrained = solve_rebalance(quantity, price, target, lots)
+    budget = 0.05
+    solution = solve_rebalance(quantity, price, target, lots, budget)
+
+    assert unconstrained["turnover"] > budget * unconstrained["nav"]
+    assert solution["turnover"] <= budget * solution["nav"] + 1e-6
+    assert solution["turnover"] > 0.8 * budget * solution["nav"]
+    assert np.all(solution["trade_qty"] % 100 == 0)
+    # Cada ordem vai na direção do alvo e não o ultrapassa
+    desired = (target / 100 * unconstrained["nav"] - quantity * price) / price
+    moved = solution["trade_qty"] != 0
+    assert np.all(np.sign(solution["trade_qty"][moved]) == np.sign(desired[moved]))
+
+
+def seed(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Ticker(symbol="VALE3", type="stock"),
+            Ticker(symbol="PETR4", type="stock"),
+            Portfolio(id=1, name="P1"),
+            PortfolioPosition(portfolio_id=1, symbol="VALE3", quantity=1000, avg_price=50),
+            AssetMetrics(symbol="VALE3", last_price=60),
+            AssetMetrics(symbol="PETR4", last_price=30),
+        ])
+        db.session.commit()
+
+
+def test_targets_drive_rebalance_and_suggested(client):
+    seed(client)
+    payload = [
+        {"symbol": "VALE3", "target_pct": 50, "target_price": 72},
+        {"symbol": "PETR4", "target_pct": 50, "lot_size": 100},
+        {"symbol": "XXXX4", "target_pct": 10},
+    ]
+    resp = client.post("/api/portfolio/1/targets", json=payload)
+    assert resp.status_code == 201
+    assert resp.get_json()["unknown_symbols"] == ["XXXX4"]
+
+    plan = client.get("/api/portfolio/1/rebalance").get_json()["rebalance"]
+    trades = {t["symbol"]: t["trade_qty"] for t in plan["trades"]}
+    assert trades == {"VALE3": -500, "PETR4": 1000}
+
+    summary = client.get("/api/portfolio/1/summary").get_json()["portfolio"]
+    vale = summary["holdings"][0]
+    assert vale["target_pct"] == 50
+    assert vale["adjustment_qty"] == pytest.approx(-500)
+
+    assets = {a["ticker"]: a for a in client.get("/api/portfolio/1/suggested").get_json()["assets"]}
+    assert assets["VALE3"]["targetPrice"] == 72
+    assert assets["VALE3"]["upsideDownside"] == pytest.approx(20.0)
+    assert assets["VALE3"]["owUw"] == pytest.approx(50.0)
+    assert assets["PETR4"]["tradeQty"] == 1000
+
+    # Reenviar posições mantém os alvos
+    client.post("/api/portfolio/1/positions", json=[{"symbol": "VALE3", "quantity": 500, "avg_price": 50}])
+    plan = client.get("/api/portfolio/1/rebalance?turnover=10").get_json()["rebalance"]
+    assert plan["trades"][0]["target_pct"] == 50
+    assert plan["turnover"] <= 0.1 * plan["nav"]
+
+
+def test_suggested_trades_follow_their_holdings(client):
+    seed(client)
+    client.post("/api/portfolio/1/targets", json=[
+        {"symbol": "PETR4", "target_pct": 50, "lot_size": 100},
+        {"symbol": "VALE3", "target_pct": 50},
+    ])
+
+    plan = client.get("/api/portfolio/1/rebalance").get_json()["rebalance"]
+    trades = {t["symbol"]: t["trade_qty"] for t in plan["trades"]}
+    assets = client.get("/api/portfolio/1/suggested").get_json()["assets"]
+    assert {a["ticker"]: a["tradeQty"] for a in assets} == trades
+
+
+@pytest.mark.parametrize("item", [
+    {"symbol": "VALE3", "target_pct": "50"},
+    {"symbol": "VALE3", "target_pct": -1},
+    {"symbol": "VALE3", "target_pct": 50, "lot_size": 0},
+    {"symbol": "VALE3", "target_pct": 50, "lot_size": -100},
+    {"symbol": "VALE3", "target_pct": 50, "lot_size": "100"},
+    {"symbol": "VALE3", "target_pct": 50, "lot_size": 2.5},
+    {"symbol": "VALE3", "target_pct": 50, "target_price": "72"},
+])
+def test_invalid_targets_are_rejected(client, item):
+    seed(client)
+    resp = client.post("/api/portfolio/1/targets", json=[item])
+    assert resp.status_code == 400
+    assert resp.get_json()["success"] is False
+
+    # Nada foi gravado e o rebalanceamento continua calculável
+    assert client.get("/api/portfolio/1/rebalance").status_code == 200
+
+
+def test_rebalance_cache_keeps_one_plan_per_portfolio(client):
+    seed(client)
+    for turnover in (1, 2.5, 5):
+        assert client.get(f"/api/portfolio/1/rebalance?turnover={turnover}").status_code == 200
+    assert list(rebalancer._cache) == [1]
+    assert rebalancer._cache[1][0] == pytest.approx(0.05)
+
+    client.post("/api/portfolio/1/targets", json=[{"symbol": "VALE3", "target_pct": 40}])
+    assert rebalancer._cache == {}
@@ -0,0 +1,397 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.services import metatrader5_rtd_worker as rtd
+from backend.services.quote_cache import quote_cache
+
+
+class FakeMT5:
+    """Simula a API do MetaTrader5 contando as leituras de tick."""
+
+    TIMEFRAME_M1 = 1
+    COPY_TICKS_ALL = -1
+    TICK_DTYPE = [
+        ("time", "i8"), ("bid", "f8"), ("ask", "f8"), ("last", "f8"),
+        ("volume", "u8"), ("time_msc", "i8"), ("flags", "u4"), ("volume_real", "f8"),
+    ]
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.tick_calls = []
+        self.tick_history = {}
+        self.copy_calls = []
+        self.released = []
+
+    def symbol_info_tick(self, symbol):
+        self.tick_calls.append(symbol)
+        price = self.prices.get(symbol)
+        if price is None:
+            return None
+        return SimpleNamespace(
+            bid=price, ask=price + 0.01, last=price, volume=100,
+            time=1_700_000_000, time_msc=1_700_000_000_000, flags=0, volume_real=100.0,
+        )
+
+    def add_tick(self, symbol, time_msc, price):
+        rows = self.tick_history.setdefault(symbol, [])
+        rows.append((time_msc // 1000, price, price + 0.01, price, 10, time_msc, 0, 10.0))
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        self.copy_calls.append((symbol, date_from))
+        rows = [r for r in self.tick_history.get(symbol, []) if r[0] >= date_from]
+        return np.array(rows[:count], dtype=self.TICK_DTYPE)
+
+    def copy_ticks_range(self, symbol, date_from, date_to, flags):
+        self.copy_calls.append((symbol, date_from, date_to))
+        rows = [r for r in self.tick_history.get(symbol, []) if date_from <= r[0] <= date_to]
+        return np.array(rows, dtype=self.TICK_DTYPE)
+
+    def market_book_add(self, symbol):
+        return True
+
+    def market_book_release(self, symbol):
+        self.released.append(symbol)
+        return True
+
+    def symbol_select(self, symbol, enable):
+        return True
+
+    def copy_rates_from_pos(self, *args):
+        return None
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, room=None):
+        self.emitted.append((event, payload, room))
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    fake = FakeMT5({"VALE3": 60.0, "PETR4": 35.0, "BBAS3": 28.0})
+    monkeypatch.setattr(rtd, "mt5", fake, raising=False)
+    monkeypatch.setattr(rtd, "MT5_AVAILABLE", True)
+    monkeypatch.setenv("MT5_LOGIN", "1")
+    monkeypatch.setattr(rtd.MetaTrader5RTDWorker, "_initialize_database", lambda self: None)
+
+    w = rtd.MetaTrader5RTDWorker(FakeSocketIO())
+    w.mt5_connected = True
+    w.mt5_symbols = {"VALE3", "PETR4", "BBAS3"}
+    w.realtime_symbols = {"VALE3", "PETR4"}
+    w.fake_mt5 = fake
+    quote_cache.clear()
+    yield w
+    quote_cache.clear()
+
+
+def test_update_cycle_polls_each_symbol_once(worker):
+    for room in ("room1", "room2", "room3"):
+        worker.subscribe_ticker(room, "VALE3")
+    worker.subscribe_ticker("room1", "PETR4")
+
+    worker._run_update_cycle()
+
+    assert sorted(worker.fake_mt5.tick_calls) == ["PETR4", "VALE3"]
+    emits = worker.socketio.emitted
+    assert len(emits) == 3
+    by_room = {room: payload["quotes"] for _, payload, room in emits}
+    assert {q["symbol"] for q in by_room["room1"]} == {"VALE3", "PETR4"}
+    assert [q["symbol"] for q in by_room["room2"]] == ["VALE3"]
+
+
+def test_quote_misses_are_resolved_after_the_batch(worker):
+    worker.mt5_symbols.add("ITSA4")  # sem tick no MT5
+
+    quotes = worker._fetch_quotes(["VALE3", "ITSA4", "BBAS3"])
+
+    # Uma leitura por símbolo no lote; a ativação do ITSA4 vem depois, numa única passada
+    assert worker.fake_mt5.tick_calls == ["VALE3", "ITSA4", "BBAS3", "ITSA4"]
+    assert sorted(quotes) == ["BBAS3", "VALE3"]
+    assert "ITSA4" in worker.failed_symbols
+
+    worker.fake_mt5.tick_calls.clear()
+    worker._fetch_quotes(["ITSA4"])
+    assert worker.fake_mt5.tick_calls == ["ITSA4"]
+
+
+def test_subscription_stats_report_fanout(worker):
+    for room in ("room1", "room2", "room3", "room4"):
+        worker.subscribe_ticker(room, "VALE3")
+
+    worker._run_update_cycle()
+    stats = worker.get_subscription_stats()
+
+    assert stats["mt5_calls_per_cycle"] == 1
+    assert stats["distinct_symbols_per_cycle"] == 1
+    assert stats["fanout_ratio"] == 4.0
+
+
+def test_unchanged_quotes_are_not_reemitted(worker):
+    worker.subscribe_ticker("room1", "VALE3")
+
+    worker._run_update_cycle()
+    worker._run_update_cycle()
+
+    emits = worker.socketio.emitted
+    assert len(emits) == 1
+    first = emits[0][1]["quotes"][0]
+    assert first["seq"] == 1
+    assert first["bid"] == 60.0
+
+
+def test_delta_carries_only_changed_fields(worker):
+    worker.subscribe_ticker("room1", "VALE3")
+    worker._run_update_cycle()
+
+    worker.fake_mt5.prices["VALE3"] = 61.0
+    worker._run_update_cycle()
+
+    delta = worker.socketio.emitted[-1][1]["quotes"][0]
+    assert delta["seq"] == 2
+    assert delta["last"] == 61.0
+    assert "volume" not in delta
+
+
+def test_snapshot_returns_full_quote_with_sequence(worker):
+    worker.subscribe_ticker("room1", "VALE3")
+    worker._run_update_cycle()
+
+    snapshot = worker.get_snapshot(["vale3", "PETR4"])
+
+    assert [q["symbol"] for q in snapshot] == ["VALE3", "PETR4"]
+    assert snapshot[0]["seq"] == 1
+    assert snapshot[0]["volume"] == 100
+
+
+def test_snapshot_does_not_consume_sequence_numbers(worker):
+    worker.subscribe_ticker("room1", "VALE3")
+
+    snapshot = worker.get_snapshot(["VALE3"])
+    assert snapshot[0]["seq"] == 0
+    assert snapshot[0]["bid"] == 60.0
+
+    worker._run_update_cycle()
+    first = worker.socketio.emitted[0][1]["quotes"][0]
+    assert first["seq"] == 1
+    assert first["bid"] == 60.0
+
+
+def test_tick_mode_pushes_only_ticks_after_watermark(worker):
+    worker.INGESTION_MODE = "ticks"
+    worker.subscribe_ticker("room1", "VALE3")
+
+    worker._run_update_cycle()
+    assert worker.tick_watermarks["VALE3"] == 1_700_000_000_000
+
+    assert worker._run_update_cycle() == 0
+    assert worker.last_cycle_stats["ticks_ingested"] == 0
+
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_000_000, 60.0)
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_000_500, 60.5)
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_001_200, 61.0)
+
+    assert worker._run_update_cycle() == 1
+    assert worker.last_cycle_stats["ticks_ingested"] == 2
+    assert worker.tick_watermarks["VALE3"] == 1_700_000_001_200
+    assert worker.socketio.emitted[-1][1]["quotes"][0]["last"] == 61.0
+
+
+def test_tick_mode_pages_past_a_second_with_a_full_batch(worker):
+    worker.INGESTION_MODE = "ticks"
+    worker.TICK_BATCH_SIZE = 3
+    worker.subscribe_ticker("room1", "VALE3")
+    worker._run_update_cycle()
+
+    # O lote do copy_ticks_from volta cheio só com ticks já vistos
+    for ms in (0, 0, 0, 1, 2, 3, 4):
+        worker.fake_mt5.add_tick("VALE3", 1_700_000_000_000 + ms, 60.0)
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_002_000, 61.0)
+
+    worker._run_update_cycle()
+    assert worker.tick_watermarks["VALE3"] == 1_700_000_000_004
+    assert worker.last_cycle_stats["ticks_ingested"] == 4
+
+    worker._run_update_cycle()
+    assert worker.tick_watermarks["VALE3"] == 1_700_000_002_000
+    assert worker.ticker_prices["VALE3"]["last"] == 61.0
+
+
+def test_tick_mode_pause_adapts_to_activity(worker):
+    worker.INGESTION_MODE = "ticks"
+    worker.MIN_PAUSE_SECONDS = 0.1
+    worker.MAX_PAUSE_SECONDS = 1.0
+
+    assert worker._next_pause(3) == 0.1
+    assert worker._next_pause(0) == 0.2
+    for _ in range(10):
+        pause = worker._next_pause(0)
+    assert pause == 1.0
+    assert worker._next_pause(1) == 0.1
+
+
+def test_ticks_are_buffered_and_aggregated_into_bars(worker):
+    worker.INGESTION_MODE = "ticks"
+    worker.subscribe_ticker("room1", "VALE3")
+    worker._run_update_cycle()
+
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_000_500, 61.0)
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_070_000, 62.0)
+    worker._run_update_cycle()
+    worker._run_update_cycle()
+
+    assert len(worker.tick_buffers["VALE3"]) == 3
+    bars = worker.get_bars("VALE3", "1m")
+    assert [bar["close"] for bar in bars] == [61.0, 62.0]
+    assert worker.ticker_prices["VALE3"]["last"] == 62.0
+
+
+def test_poll_mode_does_not_buffer_repeated_tick(worker):
+    worker.subscribe_ticker("room1", "VALE3")
+    worker._run_update_cycle()
+    worker._run_update_cycle()
+
+    assert len(worker.tick_buffers["VALE3"]) == 1
+
+
+def test_update_cycle_warms_quote_cache_for_watched_symbols(worker):
+    worker.watch_symbols(["PETR4", "UNKNOWN"])
+
+    worker._run_update_cycle()
+
+    assert quote_cache.get("PETR4")["last"] == 35.0
+    assert "UNKNOWN" not in worker.cache_watchlist
+    assert worker.socketio.emitted == []
+
+
+def test_market_book_released_when_last_subscriber_leaves(worker):
+    worker.subscribe_ticker("room1", "BBAS3")
+    worker.subscribe_ticker("room2", "BBAS3")
+    assert "BBAS3" in worker.realtime_symbols
+    assert worker.subscriptions.refcount("BBAS3") == 2
+
+    worker.unsubscribe_ticker("room1", "BBAS3")
+    assert worker.fake_mt5.released == []
+
+    worker.unsubscribe_ticker("room2", "bbas3")
+    assert worker.fake_mt5.released == ["BBAS3"]
+    assert "BBAS3" not in worker.realtime_symbols
+
+
+def test_unsubscribe_all_cleans_room_and_keeps_main_symbols(worker):
+    worker.subscribe_ticker("room1", "BBAS3")
+    worker.subscribe_ticker("room1", "VALE3")
+    worker.subscribe_ticker("room2", "VALE3")
+
+    worker.unsubscribe_all("room1")
+
+    assert worker.active_subscriptions == {"room2": {"VALE3"}}
+    assert worker.fake_mt5.released == ["BBAS3"]
+    assert "VALE3" in worker.realtime_symbols
+
+
+def test_mt5_reads_go_through_offload_executor(worker):
+    offloaded = []
+
+    def offload(fn, *args):
+        offloaded.append(fn.__name__)
+        return fn(*args)
+
+    worker._mt5_executor = offload
+    worker.subscribe_ticker("sid-a", "VALE3")
+    worker._run_update_cycle()
+    quote = worker.get_mt5_quote("PETR4")
+
+    # Só as chamadas mt5.* vão ao executor; buffers e cache ficam no loop
+    assert offloaded == ["_mt5_symbol_ticks", "symbol_info_tick"]
+    assert len(worker.tick_buffers["VALE3"]) == 1
+    assert quote["last"] == 35.0
+
+
+def test_tick_mode_reads_raw_batches_in_the_executor(worker):
+    offloaded = []
+
+    def offload(fn, *args):
+        offloaded.append(fn.__name__)
+        return fn(*args)
+
+    worker._mt5_executor = offload
+    worker.INGESTION_MODE = "ticks"
+    worker.subscribe_ticker("sid-a", "VALE3")
+    worker._run_update_cycle()
+    worker.fake_mt5.add_tick("VALE3", 1_700_000_000_500, 61.0)
+    worker._run_update_cycle()
+
+    assert offloaded == ["_mt5_new_ticks", "_mt5_new_ticks"]
+    assert worker.tick_watermarks["VALE3"] == 1_700_000_000_500
+    assert len(worker.tick_buffers["VALE3"]) == 2
+
+
+def test_emits_are_queued_when_emitter_is_active(worker):
+    worker.emit_queue = rtd.queue.Queue()
+    worker.subscribe_ticker("sid-a", "VALE3")
+    worker._run_update_cycle()
+
+    assert worker.socketio.emitted == []
+    assert worker.get_subscription_stats()["pending_emits"] == 1
+
+    worker.running = False
+    worker._emit_loop()
+    event, payload, room = worker.socketio.emitted[0]
+    assert (event, room) == ("price_update", "sid-a")
+    assert payload["quotes"][0]["symbol"] == "VALE3"
+
+
+def test_portfolio_stream_emits_on_price_change(worker):
+    from backend.services.portfolio_stream import LivePortfolio
+    from backend.services.portfolio_valuation import PortfolioBook, value_book
+
+    def load(pid):
+        book = PortfolioBook(pid, "P1", [("BBAS3", 100, 20, 27.0, 0, 0, 100, None, None, None)])
+        return LivePortfolio(book, value_book(book), {})
+
+    assert worker.subscribe_portfolio("sid-a", 7, load) is not None
+    worker._run_update_cycle()
+
+    assert worker.last_cycle_stats["distinct_symbols"] == 1
+    assert "BBAS3" in worker.realtime_symbols
+    [(event, payload, room)] = worker.socketio.emitted
+    assert (event, room) == ("portfolio_update", "portfolio:7")
+    assert payload["total_value"] == pytest.approx(2800.0)
+    assert payload["holdings"][0]["symbol"] == "BBAS3"
+
+    worker.socketio.emitted.clear()
+    worker._run_update_cycle()
+    assert worker.socketio.emitted == []
+
+    worker.unsubscribe_all("sid-a")
+    assert worker.get_subscription_stats()["streamed_portfolios"] == 0
+
+
+def test_portfolio_refresh_acquires_and_releases_changed_symbols(worker):
+    from backend.services.portfolio_stream import LivePortfolio
+    from backend.services.portfolio_valuation import PortfolioBook, value_book
+
+    holdings = {"symbols": ["BBAS3"]}
+
+    def load(pid):
+        book = PortfolioBook(pid, "P1", [
+            (symbol, 100, 20, 27.0, 0, 0, 100, None, None, None) for symbol in holdings["symbols"]
+        ])
+        return LivePortfolio(book, value_book(book), {})
+
+    worker.mt5_symbols.add("ITSA4")
+    worker.fake_mt5.prices["ITSA4"] = 10.0
+    worker.subscribe_portfolio("sid-a", 7, load)
+    assert "BBAS3" in worker.realtime_symbols
+
+    holdings["symbols"] = ["ITSA4"]
+    worker.refresh_portfolio(7, load)
+
+    assert "ITSA4" in worker.realtime_symbols
+    assert "BBAS3" not in worker.realtime_symbols
+    assert worker.fake_mt5.released == ["BBAS3"]
+    assert worker.portfolio_stream.symbols() == {"ITSA4"}
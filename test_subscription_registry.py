@@ -0,0 +1,29 @@
+from backend.services.subscription_registry import SubscriptionRegistry
+
+
+def test_refcount_tracks_rooms_per_symbol():
+    registry = SubscriptionRegistry()
+    assert registry.subscribe("a", "VALE3") is True
+    assert registry.subscribe("b", "VALE3") is False
+    assert registry.subscribe("a", "VALE3") is False
+    assert registry.refcount("VALE3") == 2
+
+    assert registry.unsubscribe("a", "VALE3") is False
+    assert registry.unsubscribe("a", "VALE3") is False
+    assert registry.unsubscribe("b", "VALE3") is True
+    assert registry.refcount("VALE3") == 0
+    assert not registry
+
+
+def test_remove_room_returns_only_orphaned_symbols():
+    registry = SubscriptionRegistry()
+    registry.subscribe("a", "VALE3")
+    registry.subscribe("a", "PETR4")
+    registry.subscribe("b", "PETR4")
+
+    assert registry.remove_room("a") == ["VALE3"]
+    assert registry.remove_room("a") == []
+    assert registry.symbol_index() == {"PETR4": {"b"}}
+    assert registry.stats() == {
+        "total_rooms": 1, "total_subscriptions": 1, "distinct_symbols": 1,
+    }
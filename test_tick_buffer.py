@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from backend.services.tick_buffer import BarAggregator, TickRingBuffer
+
+
+def test_ring_buffer_overwrites_oldest_ticks():
+    buffer = TickRingBuffer(capacity=3)
+    for i in range(5):
+        buffer.append(1000 * i, 10.0 + i, 10.1 + i, 10.0 + i, 1)
+
+    arrays = buffer.to_arrays()
+    assert len(buffer) == 3
+    assert arrays["time_msc"].tolist() == [2000, 3000, 4000]
+    assert arrays["last"].tolist() == [12.0, 13.0, 14.0]
+    assert buffer.last_time_msc == 4000
+
+
+def test_ring_buffer_extend_larger_than_capacity_keeps_tail():
+    buffer = TickRingBuffer(capacity=4)
+    n = np.arange(10)
+    buffer.extend(n, n, n, n, n)
+
+    assert buffer.to_arrays()["time_msc"].tolist() == [6, 7, 8, 9]
+
+
+def test_bar_aggregator_builds_ohlcv_and_closes_bars():
+    agg = BarAggregator()
+    base = 1_700_000_100 * 1000  # múltiplo de 900s
+    agg.update(base, 10.0, 100)
+    agg.update(base + 10_000, 12.0, 50)
+    agg.update(base + 20_000, 9.0, 25)
+    closed = agg.update(base + 61_000, 11.0, 10)
+
+    assert [bar["timeframe"] for bar in closed] == ["1m"]
+    bars = agg.get_bars("1m")
+    assert len(bars) == 2
+    first = bars[0]
+    assert (first["open"], first["high"], first["low"], first["close"]) == (10.0, 12.0, 9.0, 9.0)
+    assert first["volume"] == 175
+    assert first["ticks"] == 3
+
+    five = agg.get_bars("5m")
+    assert len(five) == 1
+    assert five[0]["close"] == 11.0
+    assert agg.get_bars("1m", limit=1)[0]["close"] == 11.0
+
+
+def test_bar_time_is_utc_like_tick_store():
+    agg = BarAggregator()
+    agg.update(1_700_000_100 * 1000, 10.0, 1)
+
+    bar_time = pd.Timestamp(agg.get_bars("1m")[0]["time"])
+    assert bar_time.utcoffset().total_seconds() == 0
+    assert bar_time.tz_localize(None) == pd.to_datetime(1_700_000_100, unit="s")
@@ -0,0 +1,85 @@
+import numpy as np
+
+from backend.services.tick_store import TickStoreWriter
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.log.append(("execute", " ".join(sql.split())))
+
+    def copy_expert(self, sql, buffer):
+        self.log.append(("copy", sql, buffer.read()))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self.log)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    def raw_connection(self):
+        return self.conn
+
+
+def _ticks(n, start=1_700_000_000_000):
+    t = np.arange(n, dtype=np.int64) * 1000 + start
+    prices = np.full(n, 10.0)
+    return t, prices, prices + 0.01, prices, np.ones(n)
+
+
+def test_enqueue_drops_when_pending_limit_reached():
+    writer = TickStoreWriter(FakeEngine(), max_pending_rows=5)
+    writer.put_ticks("VALE3", *_ticks(4))
+    writer.put_ticks("VALE3", *_ticks(4))
+
+    stats = writer.get_stats()
+    assert stats["enqueued_rows"] == 4
+    assert stats["dropped_rows"] == 4
+    assert stats["pending_rows"] == 4
+
+
+def test_flush_copies_ticks_and_upserts_bars_through_staging():
+    engine = FakeEngine()
+    writer = TickStoreWriter(engine, flush_interval=0.01)
+    writer.put_ticks("VALE3", *_ticks(3))
+    writer.put_bars("VALE3", [{
+        "timeframe": "1m", "bucket": 1_699_999_980, "open": 10.0, "high": 10.5,
+        "low": 9.5, "close": 10.2, "volume": 300.0, "ticks": 3,
+    }])
+
+    ticks, bars, rows = writer._drain()
+    writer.flush(ticks, bars)
+
+    assert rows == 4
+    log = engine.conn.log
+    copies = [entry for entry in log if entry[0] == "copy"]
+    assert copies[0][1].startswith("COPY intraday_ticks (symbol, time, time_msc")
+    assert copies[0][2].count("\n") == 3
+    assert copies[1][1].startswith("COPY intraday_bars_staging")
+    assert any("ON CONFLICT (symbol, timeframe, bar_time)" in entry[1] for entry in log)
+    assert any("PARTITION OF intraday_ticks FOR VALUES FROM ('2023-11-01') TO ('2023-12-01')"
+               in entry[1] for entry in log)
+    assert writer.stats["flushed_ticks"] == 3
+    assert writer.stats["flushed_bars"] == 1